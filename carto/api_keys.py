@@ -12,9 +12,9 @@ https://carto.com/developers/auth-api/
 
 """
 
-from pyrestcli.fields import CharField, DateTimeField
+from pyrestcli.fields import CharField
 
-from .fields import TableGrantField, GrantsField
+from .fields import TableGrantField, GrantsField, DateTimeField
 from .resources import Resource, Manager
 from .exceptions import CartoException
 from .paginators import CartoPaginator
@@ -0,0 +1,713 @@
+"""
+Module for asyncio access to the SQL API
+
+Requires aiohttp. The clients mirror the ones in carto.sql, but their
+methods are coroutines, so many queries can be run concurrently on a
+single event loop:
+
+::
+
+    async with AsyncClient(auth_client) as client:
+        sql = AsyncSQLClient(client)
+        results = await asyncio.gather(*[sql.send(q) for q in queries])
+
+.. module:: carto.async_sql
+   :platform: Unix, Windows
+   :synopsis: Module for asyncio access to the SQL API
+
+
+"""
+
+from gettext import gettext as _
+import asyncio
+import json
+import time
+import zlib
+
+from urllib.parse import urljoin
+
+from .exceptions import CartoException, CartoRateLimitException
+from .sql import SQL_API_URL, SQL_BATCH_API_URL, MAX_GET_QUERY_LEN, \
+    DEFAULT_CHUNK_SIZE, DEFAULT_COMPRESSION_LEVEL, \
+    BATCH_JOBS_PENDING_STATUSES, BATCH_JOBS_FAILED_STATUSES, \
+    BatchPollStrategy
+
+# Maximum number of connections open at the same time by an AsyncClient.
+# Requests beyond that wait for a free connection
+DEFAULT_ASYNC_CONNECTIONS = 100
+
+
+def import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise CartoException(_("aiohttp is required to use the async "
+                               "clients"))
+    return aiohttp
+
+
+class AsyncResponse(object):
+    """
+    Response of an AsyncClient, with the subset of the interface of
+    requests' responses used by the auth clients
+    """
+    def __init__(self, response, content=None):
+        """
+        :param response: aiohttp response
+        :param content: Body of the response, if it has already been read
+        :type response: aiohttp.ClientResponse
+        :type content: bytes
+        """
+        self.raw = response
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.content = content
+
+    @property
+    def text(self):
+        return (self.content or b'').decode(self.raw.charset or 'utf-8',
+                                            'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    async def read(self):
+        """
+        Reads the whole body of a streamed response
+
+        :return: The body
+        :rtype: bytes
+        """
+        if self.content is None:
+            try:
+                self.content = await self.raw.read()
+            finally:
+                self.raw.release()
+        return self.content
+
+    async def iter_content(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Iterates over the body of a streamed response
+
+        :param chunk_size: Maximum size of the blocks
+        :type chunk_size: int
+
+        :return: Async iterator of blocks of the body
+        """
+        if self.content is not None:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+            return
+        try:
+            async for chunk in self.raw.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            self.raw.release()
+
+    def close(self):
+        self.raw.release()
+
+
+class AsyncClient(object):
+    """
+    Sends the requests of an auth client through an aiohttp session
+
+    Credentials, client identifier and User-Agent are taken from the auth
+    client, so that requests are the same as the ones sent by the
+    synchronous clients. Share one instance among all the async clients
+    so that they use the same connections.
+    """
+    def __init__(self, auth_client, session=None,
+                 limit=DEFAULT_ASYNC_CONNECTIONS, timeout=None):
+        """
+        :param auth_client: Auth client to make authorized requests, such as
+                            APIKeyAuthClient
+        :param session: aiohttp session. By default, one is created on the
+                        first request and closed along with the client
+        :param limit: Maximum number of connections open at the same time
+        :param timeout: Timeout of the requests, in seconds, as a number or
+                        a (connect, read) tuple
+        :type auth_client: :class:`carto.auth.APIKeyAuthClient`
+        :type session: aiohttp.ClientSession
+        :type limit: int
+        :type timeout: float or tuple
+
+        :return:
+        """
+        self.aiohttp = import_aiohttp()
+        self.auth_client = auth_client
+        self.base_url = auth_client.base_url
+        self.api_key = getattr(auth_client, 'api_key', None)
+        self.session = session
+        self.owns_session = session is None
+        self.limit = limit
+        self.timeout = timeout
+
+    def _create_session(self):
+        if isinstance(self.timeout, (tuple, list)):
+            connect, read = self.timeout
+        else:
+            connect = read = self.timeout
+        timeout = self.aiohttp.ClientTimeout(total=None, sock_connect=connect,
+                                             sock_read=read)
+        connector = self.aiohttp.TCPConnector(limit=self.limit)
+        return self.aiohttp.ClientSession(connector=connector,
+                                          timeout=timeout)
+
+    @staticmethod
+    def _without_none(values):
+        # requests skips params with no value, aiohttp fails on them
+        if not isinstance(values, dict):
+            return values
+        return dict((k, v) for k, v in values.items() if v is not None)
+
+    async def send(self, relative_path, http_method, stream=False,
+                   **requests_args):
+        """
+        Makes an authorized request
+
+        :param relative_path: URL path relative to self.base_url
+        :param http_method: HTTP method
+        :param stream: Whether to return before the body is read
+        :param requests_args: params, data, json and headers of the request,
+                              as they are given to requests
+        :type relative_path: str
+        :type http_method: str
+        :type stream: bool
+        :type requests_args: kwargs
+
+        :return: A response object
+        :rtype: :class:`carto.async_sql.AsyncResponse`
+
+        :raise: CartoException
+        """
+        prepare_send = getattr(self.auth_client, 'prepare_send', None)
+        if prepare_send is not None:
+            http_method, requests_args = prepare_send(http_method,
+                                                      **requests_args)
+
+        kwargs = {}
+        for arg in ('params', 'data', 'json', 'headers'):
+            if requests_args.get(arg) is not None:
+                kwargs[arg] = self._without_none(requests_args[arg])
+
+        try:
+            if self.session is None:
+                self.session = self._create_session()
+            raw = await self.session.request(
+                http_method.upper(), urljoin(self.base_url, relative_path),
+                **kwargs)
+            response = AsyncResponse(raw)
+            if not stream:
+                await response.read()
+        except Exception as e:
+            raise CartoException(e)
+
+        if CartoRateLimitException.is_rate_limited(response):
+            await response.read()
+            raise CartoRateLimitException(response)
+
+        return response
+
+    def get_response_data(self, response, parse_json=True):
+        """
+        Gets response data or raises the same exceptions as the auth client
+
+        :param response: A response with its body already read
+        :param parse_json: If True, response will be parsed as JSON
+        :type response: :class:`carto.async_sql.AsyncResponse`
+        :type parse_json: bool
+
+        :return: Response data, either as json or as a regular
+                 response.content object
+        :rtype: object
+        """
+        return self.auth_client.get_response_data(response, parse_json)
+
+    async def close(self):
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _async_client(client):
+    if isinstance(client, AsyncClient):
+        return client
+    return AsyncClient(client)
+
+
+class AsyncSQLClient(object):
+    """
+    Allows you to send requests to CARTO's SQL API from asyncio code
+    """
+    def __init__(self, client, api_version='v2'):
+        """
+        :param client: AsyncClient, or an auth client to build one for
+        :param api_version: Current version is 'v2'. 'v1' can be used to avoid
+                            caching, but it's not guaranteed to work
+        :type client: :class:`carto.async_sql.AsyncClient`
+        :type api_version: str
+
+        :return:
+        """
+        self.client = _async_client(client)
+        self.api_url = SQL_API_URL.format(api_version=api_version)
+        self.api_key = self.client.api_key
+
+    async def send(self, sql, parse_json=True, do_post=True, format=None,
+                   **request_args):
+        """
+        Executes SQL query in a CARTO server
+
+        :param sql: The SQL
+        :param parse_json: Set it to False if you want raw reponse
+        :param do_post: Set it to True to force post request
+        :param format: Any of the data export formats allowed by CARTO's
+                        SQL API
+        :param request_args: Additional parameters to send with the request
+        :type sql: str
+        :type parse_json: boolean
+        :type do_post: boolean
+        :type format: str
+        :type request_args: dictionary
+
+        :return: response data, either as json or as a regular
+                    response.content object
+        :rtype: object
+
+        :raise: CartoException
+        """
+        try:
+            params = {'q': sql}
+            if format:
+                params['format'] = format
+                if format not in ['json', 'geojson']:
+                    parse_json = False
+
+            for attr in request_args:
+                params[attr] = request_args[attr]
+
+            if len(sql) < MAX_GET_QUERY_LEN and do_post is False:
+                resp = await self.client.send(self.api_url, 'GET',
+                                              params=params)
+            else:
+                resp = await self.client.send(self.api_url, 'POST',
+                                              data=params)
+
+            return self.client.get_response_data(resp, parse_json)
+        except CartoRateLimitException as e:
+            raise e
+        except Exception as e:
+            raise CartoException(e)
+
+    async def close(self):
+        await self.client.close()
+
+
+class AsyncBatchSQLClient(object):
+    """
+    Allows you to send requests to CARTO's Batch SQL API from asyncio code
+    """
+    def __init__(self, client, api_version='v2', poll_strategy=None):
+        """
+        :param client: AsyncClient, or an auth client to build one for
+        :param api_version: Current version is 'v2'. 'v1' can be used to avoid
+                            caching, but it's not guaranteed to work
+        :param poll_strategy: How to wait for jobs to finish. Defaults to
+                              a BatchPollStrategy with the default delays
+                              and no timeout
+        :type client: :class:`carto.async_sql.AsyncClient`
+        :type api_version: str
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+
+        :return:
+        """
+        self.client = _async_client(client)
+        self.api_url = SQL_BATCH_API_URL.format(api_version=api_version)
+        self.poll_strategy = poll_strategy or BatchPollStrategy()
+        self.api_key = self.client.api_key
+
+    async def send(self, url, http_method, json_body=None, http_header=None):
+        """
+        Executes Batch SQL query in a CARTO server
+
+        :param url: Endpoint url
+        :param http_method: The method used to make the request to the API
+        :param json_body: The information that needs to be sent, by default
+                            is set to None
+        :param http_header: The header used to make write requests to the API,
+                            by default is none
+        :type url: str
+        :type http_method: str
+        :type json_body: dict
+        :type http_header: str
+
+        :return: Response data, either as json or as a regular response.content
+                object
+        :rtype: object
+
+        :raise: CartoException
+        """
+        try:
+            data = await self.client.send(url,
+                                          http_method=http_method,
+                                          headers=http_header,
+                                          json=json_body)
+            data_json = self.client.get_response_data(data)
+        except CartoRateLimitException as e:
+            raise e
+        except Exception as e:
+            raise CartoException(e)
+        return data_json
+
+    async def create(self, sql_query):
+        """
+        Creates a new batch SQL query.
+
+        :param sql_query: The SQL query to be used
+        :type sql_query: str or list of str
+
+        :return: Response data, either as json or as a regular response.content
+                    object
+        :rtype: object
+
+        :raise: CartoException
+        """
+        header = {'content-type': 'application/json'}
+        return await self.send(self.api_url,
+                               http_method="POST",
+                               json_body={"query": sql_query},
+                               http_header=header)
+
+    async def create_and_wait_for_completion(self, sql_query,
+                                             poll_strategy=None):
+        """
+        Creates a new batch SQL query and waits for its completion or failure
+
+        :param sql_query: The SQL query to be used
+        :param poll_strategy: How to wait for the job to finish. Defaults
+                              to the one of the client
+        :type sql_query: str or list of str
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+
+        :return: Response data, either as json or as a regular response.content
+                    object, with the number of reads of the job status and
+                    the seconds waited in poll_stats
+        :rtype: object
+
+        :raise: CartoException when there's an exception in the BatchSQLJob
+                execution, the batch job status is one of the
+                BATCH_JOBS_FAILED_STATUSES ('failed', 'canceled', 'unknown')
+                or the job doesn't finish before the timeout of the poll
+                strategy
+        """
+        data = await self.create(sql_query)
+
+        poll_strategy = poll_strategy or self.poll_strategy
+        start = time.time()
+        delays = poll_strategy.delays()
+        polls = 0
+
+        while data and data['status'] in BATCH_JOBS_PENDING_STATUSES:
+            delay = next(delays)
+            if poll_strategy.timeout is not None:
+                remaining = poll_strategy.timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise CartoException(_("Batch SQL job {job_id} not finished after {timeout} seconds").format(
+                        job_id=data['job_id'], timeout=poll_strategy.timeout))
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+            data = await self.read(data['job_id'])
+            polls += 1
+
+        data['poll_stats'] = {'polls': polls,
+                              'wait_time': time.time() - start}
+
+        if data['status'] in BATCH_JOBS_FAILED_STATUSES:
+            raise CartoException(_("Batch SQL job failed with result: {data}".format(data=data)))
+
+        return data
+
+    async def read(self, job_id):
+        """
+        Reads the information for a specific Batch API request
+
+        :param job_id: The id of the job to be read from
+        :type job_id: str
+
+        :return: Response data, either as json or as a regular response.content
+                    object
+        :rtype: object
+
+        :raise: CartoException
+        """
+        return await self.send(self.api_url + job_id, http_method="GET")
+
+    async def update(self, job_id, sql_query):
+        """
+        Updates the sql query of a specific job
+
+        :param job_id: The id of the job to be updated
+        :param sql_query: The new SQL query for the job
+        :type job_id: str
+        :type sql_query: str
+
+        :return: Response data, either as json or as a regular response.content
+                    object
+        :rtype: object
+
+        :raise: CartoException
+        """
+        header = {'content-type': 'application/json'}
+        return await self.send(self.api_url + job_id,
+                               http_method="PUT",
+                               json_body={"query": sql_query},
+                               http_header=header)
+
+    async def cancel(self, job_id):
+        """
+        Cancels a job
+
+        :param job_id: The id of the job to be cancelled
+        :type job_id: str
+
+        :return: A status code depending on whether the cancel request was
+                    successful
+        :rtype: str
+
+        :raise CartoException:
+        """
+        try:
+            confirmation = await self.send(self.api_url + job_id,
+                                           http_method="DELETE")
+        except CartoException as e:
+            if 'Cannot set status from done to cancelled' in e.args[0].args[0]:
+                return 'done'
+            else:
+                raise e
+        return confirmation['status']
+
+    async def close(self):
+        await self.client.close()
+
+
+class AsyncCopySQLClient(object):
+    """
+    Allows to use the PostgreSQL COPY command for efficient streaming
+    of data to and from CARTO from asyncio code
+    """
+    def __init__(self, client, api_version='v2'):
+        """
+        :param client: AsyncClient, or an auth client to build one for
+        :param api_version: Current version is 'v2'. 'v1' can be used to avoid
+                            caching, but it's not guaranteed to work
+        :type client: :class:`carto.async_sql.AsyncClient`
+        :type api_version: str
+
+        :return:
+        """
+        self.client = _async_client(client)
+        self.api_url = SQL_API_URL.format(api_version=api_version)
+        self.api_key = self.client.api_key
+
+    async def _iterate(self, iterable_data):
+        if hasattr(iterable_data, '__aiter__'):
+            async for chunk in iterable_data:
+                yield chunk
+        else:
+            for chunk in iterable_data:
+                yield chunk
+
+    async def _read_chunks(self, file_object):
+        # Files are read in the default executor, not to block the loop
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, file_object.read,
+                                               DEFAULT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    async def _compress_chunks(self, chunk_generator, compression_level):
+        # Chunks are compressed in the default executor, not to block the
+        # loop. They are compressed one at a time, in order
+        loop = asyncio.get_running_loop()
+        zlib_mode = 16 + zlib.MAX_WBITS
+        compressor = zlib.compressobj(compression_level,
+                                      zlib.DEFLATED,
+                                      zlib_mode)
+        async for chunk in chunk_generator:
+            compressed_chunk = await loop.run_in_executor(
+                None, compressor.compress, chunk)
+            if len(compressed_chunk) > 0:
+                yield compressed_chunk
+        yield compressor.flush()
+
+    async def copyfrom(self, query, iterable_data, compress=True,
+                       compression_level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        Gets data from an iterable object into a table
+
+        :param query: The "COPY table_name [(column_name[, ...])]
+                           FROM STDIN [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param iterable_data: An object that can be iterated, synchronously
+                              or asynchronously, to retrieve the data
+        :type iterable_data: object
+
+        :return: Response data as json
+        :rtype: str
+
+        :raise CartoException:
+        """
+        url = self.api_url + '/copyfrom'
+        # aiohttp sends async generators with chunked transfer encoding
+        headers = {'Content-Type': 'application/octet-stream'}
+        params = {'api_key': self.api_key, 'q': query}
+
+        data = self._iterate(iterable_data)
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+            data = self._compress_chunks(data, compression_level)
+
+        try:
+            response = await self.client.send(url,
+                                              http_method='POST',
+                                              params=params,
+                                              data=data,
+                                              headers=headers)
+            return self.client.get_response_data(response)
+        except CartoRateLimitException as e:
+            raise e
+        except Exception as e:
+            raise CartoException(e)
+
+    async def copyfrom_file_object(self, query, file_object, compress=True,
+                                   compression_level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        Gets data from a readable file object into a table
+
+        :param query: The "COPY table_name [(column_name[, ...])]
+                           FROM STDIN [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param file_object: A file-like object.
+                            Normally the return value of open('file.ext', 'rb')
+        :type file_object: file
+
+        :return: Response data as json
+        :rtype: str
+
+        :raise CartoException:
+        """
+        return await self.copyfrom(query, self._read_chunks(file_object),
+                                   compress, compression_level)
+
+    async def copyfrom_file_path(self, query, path, compress=True,
+                                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        Gets data from a readable file into a table
+
+        :param query: The "COPY table_name [(column_name[, ...])]
+                           FROM STDIN [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param path: A path to a file
+        :type path: str
+
+        :return: Response data as json
+        :rtype: str
+
+        :raise CartoException:
+        """
+        with open(path, 'rb') as f:
+            return await self.copyfrom_file_object(query, f, compress,
+                                                   compression_level)
+
+    async def copyto(self, query):
+        """
+        Gets data from a table into a response whose body can be iterated
+        with iter_content
+
+        :param query: The "COPY { table_name [(column_name[, ...])] | (query) }
+                           TO STDOUT [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :return: response object
+        :rtype: :class:`carto.async_sql.AsyncResponse`
+
+        :raise CartoException:
+        """
+        url = self.api_url + '/copyto'
+        params = {'api_key': self.api_key, 'q': query}
+        http_method = 'GET' if len(query) < MAX_GET_QUERY_LEN else 'POST'
+
+        response = await self.client.send(url,
+                                          http_method=http_method,
+                                          params=params,
+                                          stream=True)
+        if response.status_code >= 400:
+            await response.read()
+            if response.status_code < 500:
+                # Client error, provide better reason
+                try:
+                    reason = response.json()['error'][0]
+                except Exception:
+                    reason = response.text
+                raise CartoException(u'%s Client Error: %s' %
+                                     (response.status_code, reason))
+            raise CartoException(u'%s Server Error: %s' %
+                                 (response.status_code, response.reason))
+
+        return response
+
+    async def copyto_file_object(self, query, file_object):
+        """
+        Gets data from a table into a writable file object
+
+        :param query: The "COPY { table_name [(column_name[, ...])] | (query) }
+                           TO STDOUT [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param file_object: A file-like object.
+                            Normally the return value of open('file.ext', 'wb')
+        :type file_object: file
+
+        :raise CartoException:
+        """
+        response = await self.copyto(query)
+        async for block in response.iter_content(DEFAULT_CHUNK_SIZE):
+            file_object.write(block)
+
+    async def copyto_file_path(self, query, path, append=False):
+        """
+        Gets data from a table into a writable file
+
+        :param query: The "COPY { table_name [(column_name[, ...])] | (query) }
+                           TO STDOUT [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param path: A path to a writable file
+        :type path: str
+
+        :param append: Whether to append or not if the file already exists
+                       Default value is False
+        :type append: bool
+
+        :raise CartoException:
+        """
+        file_mode = 'wb' if not append else 'ab'
+        with open(path, file_mode) as f:
+            await self.copyto_file_object(query, f)
+
+    async def close(self):
+        await self.client.close()
@@ -16,11 +16,15 @@ Module for authenticated access to CARTO's APIs
 from gettext import gettext as _
 import re
 import sys
+import time
 import warnings
 import pkg_resources
 
 from pyrestcli.auth import BaseAuthClient, BasicAuthClient
 from .exceptions import CartoException, CartoRateLimitException
+from .throttling import RateLimitThrottler
+from .transport import PooledSession, DEFAULT_POOL_CONNECTIONS, \
+    DEFAULT_POOL_MAXSIZE
 
 if sys.version_info >= (3, 0):
     from urllib.parse import urlparse
@@ -89,10 +93,23 @@ class APIKeyAuthClient(_UsernameGetter, _BaseUrlChecker, _ClientIdentifier,
     dropdown menu
     """
     def __init__(self, base_url, api_key, organization=None, session=None,
-                 client_id=None, user_agent=None):
+                 client_id=None, user_agent=None,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 max_retries=0, timeout=None, keep_alive=True,
+                 tcp_nodelay=True, throttle=False, rate_limit_retries=0):
         """
         Init method
 
+        The pool and transport params are used to build a
+        carto.transport.PooledSession when no session is given. Pass the
+        same session to several auth clients to share their connections.
+
+        With throttle enabled, requests are delayed as needed to stay
+        within the rate limits announced by CARTO. Pass the same
+        carto.throttling.RateLimitThrottler to several auth clients using
+        the same API key so that they share the budget.
+
         :param base_url: Base URL. API endpoint paths will always be relative
         to this URL
         :param api_key: API key
@@ -100,11 +117,39 @@ class APIKeyAuthClient(_UsernameGetter, _BaseUrlChecker, _ClientIdentifier,
         :param session: requests' session object
         :param client_id: Client param string to pass for request args
         :param user_agent: User-Agent param string to pass for request args
+        :param pool_connections: Number of hosts to keep connection pools for
+        :param pool_maxsize: Maximum number of connections kept per host.
+                             Set it to the number of threads sharing the
+                             client
+        :param pool_block: Whether to wait for a free pooled connection
+                           instead of opening a throwaway one
+        :param max_retries: Retries on connection errors, or an
+                            urllib3.util.Retry instance
+        :param timeout: Default timeout of the requests, in seconds, as a
+                        number or a (connect, read) tuple
+        :param keep_alive: Whether to reuse connections between requests
+        :param tcp_nodelay: Whether to disable Nagle's algorithm
+        :param throttle: Whether to pace the requests, or the throttler to
+                         use
+        :param rate_limit_retries: Times a rate limited request is retried
+                                   after waiting for its Retry-After
+                                   header. Requests streaming their body
+                                   from a file or a generator are never
+                                   retried
         :type api_key: str
         :type organization: str
         :type session: object
         :type client_id: str
         :type user_agent: str
+        :type pool_connections: int
+        :type pool_maxsize: int
+        :type pool_block: bool
+        :type max_retries: int
+        :type timeout: float or tuple
+        :type keep_alive: bool
+        :type tcp_nodelay: bool
+        :type throttle: bool or carto.throttling.RateLimitThrottler
+        :type rate_limit_retries: int
 
         :return:
         """
@@ -123,8 +168,34 @@ class APIKeyAuthClient(_UsernameGetter, _BaseUrlChecker, _ClientIdentifier,
         else:
             self.client_id = client_id
 
+        if session is None:
+            session = PooledSession(pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block,
+                                    max_retries=max_retries,
+                                    timeout=timeout,
+                                    keep_alive=keep_alive,
+                                    tcp_nodelay=tcp_nodelay)
+
+        if throttle is True:
+            throttle = RateLimitThrottler()
+        self.throttler = throttle or None
+        self.rate_limit_retries = rate_limit_retries
+
         super(APIKeyAuthClient, self).__init__(base_url, session=session)
 
+    def pool_stats(self):
+        """
+        Gets usage stats of the connection pools of the client session
+
+        :return: The stats of carto.transport.PooledSession.pool_stats, or
+                 None if the client was built with another kind of session
+        :rtype: dict
+        """
+        if not isinstance(self.session, PooledSession):
+            return None
+        return self.session.pool_stats()
+
     def send(self, relative_path, http_method, **requests_args):
         """
         Makes an API-key-authorized request
@@ -141,17 +212,53 @@ class APIKeyAuthClient(_UsernameGetter, _BaseUrlChecker, _ClientIdentifier,
         :raise:
             CartoException
         """
-        try:
-            http_method, requests_args = self.prepare_send(http_method, **requests_args)
-
-            response = super(APIKeyAuthClient, self).send(relative_path, http_method, **requests_args)
-        except Exception as e:
-            raise CartoException(e)
-
-        if CartoRateLimitException.is_rate_limited(response):
-            raise CartoRateLimitException(response)
+        retries = 0
+        while True:
+            if self.throttler is not None:
+                self.throttler.acquire(relative_path)
+
+            try:
+                http_method, requests_args = self.prepare_send(http_method, **requests_args)
+
+                response = super(APIKeyAuthClient, self).send(relative_path, http_method, **requests_args)
+            except Exception as e:
+                raise CartoException(e)
+
+            if self.throttler is not None:
+                self.throttler.update(relative_path, response)
+
+            if not CartoRateLimitException.is_rate_limited(response):
+                return response
+
+            if retries >= self.rate_limit_retries or \
+                    not self._can_resend(requests_args):
+                raise CartoRateLimitException(response)
+
+            retries += 1
+            response.close()
+            if self.throttler is None:
+                # Otherwise the throttler waits for it
+                time.sleep(int(response.headers['Retry-After']))
+
+    @staticmethod
+    def _can_resend(requests_args):
+        if requests_args.get('files'):
+            return False
+        data = requests_args.get('data')
+        return data is None or isinstance(data, (bytes, str, dict, list,
+                                                 tuple))
+
+    def throttle_stats(self):
+        """
+        Gets the stats of the throttler of the client
 
-        return response
+        :return: The stats of carto.throttling.RateLimitThrottler.stats,
+                 or None if the client is not throttled
+        :rtype: dict
+        """
+        if self.throttler is None:
+            return None
+        return self.throttler.stats()
 
     def prepare_send(self, http_method, **requests_args):
         http_method = http_method.lower()
@@ -181,7 +288,8 @@ class NonVerifiedAPIKeyAuthClient(APIKeyAuthClient):
     You can find your API key by clicking on the API key section of the user
     dropdown menu
     """
-    def __init__(self, base_url, api_key, organization=None, session=None):
+    def __init__(self, base_url, api_key, organization=None, session=None,
+                 **kwargs):
         """
         Init method
 
@@ -190,12 +298,14 @@ class NonVerifiedAPIKeyAuthClient(APIKeyAuthClient):
         :param api_key: API key
         :param organization: For enterprise users, organization user belongs to
         :param session: requests' session object
+        :param kwargs: Pool and transport params of APIKeyAuthClient
         :type api_key: str
         :type organization: str
+        :type kwargs: kwargs
 
         :return:
         """
-        super(NonVerifiedAPIKeyAuthClient, self).__init__(base_url, api_key, organization, session)
+        super(NonVerifiedAPIKeyAuthClient, self).__init__(base_url, api_key, organization, session, **kwargs)
 
     def send(self, relative_path, http_method, **requests_args):
         """
@@ -213,17 +323,8 @@ class NonVerifiedAPIKeyAuthClient(APIKeyAuthClient):
         :raise:
             CartoException
         """
-        try:
-            http_method, requests_args = self.prepare_send(http_method, **requests_args)
-            requests_args["verify"] = False
-            response = super(APIKeyAuthClient, self).send(relative_path, http_method, **requests_args)
-        except Exception as e:
-            raise CartoException(e)
-
-        if CartoRateLimitException.is_rate_limited(response):
-            raise CartoRateLimitException(response)
-
-        return response
+        requests_args["verify"] = False
+        return super(NonVerifiedAPIKeyAuthClient, self).send(relative_path, http_method, **requests_args)
 
 
 class AuthAPIClient(_UsernameGetter, _BaseUrlChecker, BasicAuthClient):
@@ -0,0 +1,470 @@
+"""
+Encoding and decoding of the PostgreSQL COPY binary format
+
+.. module:: carto.binary_copy
+   :platform: Unix, Windows
+   :synopsis: Encoding and decoding of the PostgreSQL COPY binary format
+
+NumPy is needed to use this module, but it is not a dependency of the
+SDK: it is only imported when columns are encoded or decoded.
+
+"""
+
+from gettext import gettext as _
+import itertools
+import struct
+import uuid
+
+from .exceptions import CartoException
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+NULL_FIELD = struct.pack('>i', -1)
+
+# PostgreSQL timestamps and dates are relative to 2000-01-01
+POSTGRES_EPOCH_US = 946684800 * 1000000
+POSTGRES_EPOCH_DAYS = 10957
+
+# Rows encoded at once. Each block is a single chunk of the COPY request
+DEFAULT_BLOCK_ROWS = 10000
+
+# Rows decoded into each batch of arrays
+DEFAULT_BATCH_ROWS = 65536
+
+# Big-endian NumPy types used to send each PostgreSQL fixed-width type
+FIXED_WIDTH_TYPES = {
+    'bool': '?',
+    'int2': '>i2',
+    'int4': '>i4',
+    'int8': '>i8',
+    'float4': '>f4',
+    'float8': '>f8',
+    'date': '>i4',
+    'timestamp': '>i8',
+    'timestamptz': '>i8'
+}
+
+# struct formats used to decode each PostgreSQL fixed-width type
+STRUCT_FORMATS = {
+    'bool': '>?',
+    'int2': '>h',
+    'int4': '>i',
+    'int8': '>q',
+    'float4': '>f',
+    'float8': '>d',
+    'date': '>i',
+    'timestamp': '>q',
+    'timestamptz': '>q'
+}
+
+VARIABLE_WIDTH_TYPES = ['text', 'bytea', 'geometry']
+
+# Decoded as str, other types not listed in FIXED_WIDTH_TYPES as bytes
+TEXT_TYPES = ['text', 'varchar', 'bpchar', 'name', 'char', 'json', 'xml',
+              'citext', 'unknown']
+
+NUMERIC_NEGATIVE = 0x4000
+NUMERIC_NAN = 0xC000
+
+EWKB_SRID_FLAG = 0x20000000
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise CartoException(_("NumPy is required to work with the COPY "
+                               "binary format"))
+    return numpy
+
+
+def guess_pg_type(values):
+    """
+    Gets the PostgreSQL type a NumPy array is sent as by default
+
+    :param values: Column values
+    :type values: numpy.ndarray
+
+    :return: PostgreSQL type name
+    :rtype: str
+    """
+    kind, size = values.dtype.kind, values.dtype.itemsize
+    if kind == 'b':
+        return 'bool'
+    if kind == 'i':
+        return {1: 'int2', 2: 'int2', 4: 'int4'}.get(size, 'int8')
+    if kind == 'u':
+        return {1: 'int2', 2: 'int4'}.get(size, 'int8')
+    if kind == 'f':
+        return 'float8' if size > 4 else 'float4'
+    if kind == 'M':
+        return 'timestamp'
+    if kind == 'S':
+        return 'bytea'
+    if kind == 'U':
+        return 'text'
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (bytes, bytearray)):
+            return 'bytea'
+        if hasattr(value, 'wkb'):
+            return 'geometry'
+        return 'text'
+    return 'text'
+
+
+def _ewkb(wkb, srid):
+    # Inserts the SRID into a WKB geometry, turning it into EWKB
+    byte_order = '<' if wkb[0:1] == b'\x01' else '>'
+    geometry_type, = struct.unpack(byte_order + 'I', wkb[1:5])
+    if geometry_type & EWKB_SRID_FLAG:
+        return wkb
+    return (wkb[0:1] +
+            struct.pack(byte_order + 'II', geometry_type | EWKB_SRID_FLAG,
+                        srid) +
+            wkb[5:])
+
+
+def _fixed_values(np, values, nulls, pg_type):
+    # Converts the values to the representation PostgreSQL expects and
+    # flags NaN and NaT values as NULL
+    if pg_type in ('timestamp', 'timestamptz'):
+        if values.dtype.kind == 'M':
+            nulls = nulls | np.isnat(values)
+            values = values.astype('datetime64[us]').astype(np.int64) - \
+                POSTGRES_EPOCH_US
+    elif pg_type == 'date':
+        if values.dtype.kind == 'M':
+            nulls = nulls | np.isnat(values)
+            values = values.astype('datetime64[D]').astype(np.int64) - \
+                POSTGRES_EPOCH_DAYS
+    elif values.dtype.kind == 'f':
+        nulls = nulls | np.isnan(values)
+    return values, nulls
+
+
+def _encode_fixed_rows(np, columns, field_count):
+    # All the rows have the same size, so the whole block is built as a
+    # single structured array
+    dtype = [('count', '>i2')]
+    for i, (values, _nulls, pg_type) in enumerate(columns):
+        dtype += [('length{}'.format(i), '>i4'),
+                  ('value{}'.format(i), FIXED_WIDTH_TYPES[pg_type])]
+    rows = np.empty(len(columns[0][0]), dtype=dtype)
+    rows['count'] = field_count
+    for i, (values, _nulls, pg_type) in enumerate(columns):
+        rows['length{}'.format(i)] = \
+            np.dtype(FIXED_WIDTH_TYPES[pg_type]).itemsize
+        rows['value{}'.format(i)] = values
+    return rows.tobytes()
+
+
+def _encode_fixed(np, values, nulls, pg_type):
+    # Returns a list with the encoded field (length + value) of each row
+    value_type = np.dtype(FIXED_WIDTH_TYPES[pg_type])
+    fields = np.empty(len(values), dtype=[('length', '>i4'),
+                                          ('value', value_type)])
+    fields['length'] = value_type.itemsize
+    fields['value'] = np.where(nulls, 0, values)
+
+    width = fields.dtype.itemsize
+    data = fields.tobytes()
+    encoded = [data[i:i + width] for i in range(0, len(data), width)]
+    for i in np.flatnonzero(nulls):
+        encoded[i] = NULL_FIELD
+    return encoded
+
+
+def _encode_variable(values, nulls, pg_type, srid):
+    encoded = []
+    for value, null in zip(values, nulls):
+        if null or value is None:
+            encoded.append(NULL_FIELD)
+            continue
+        if hasattr(value, 'wkb'):
+            value = value.wkb
+        elif not isinstance(value, (bytes, bytearray)):
+            value = u'{}'.format(value).encode('utf-8')
+        if pg_type == 'geometry' and srid is not None:
+            value = _ewkb(bytes(value), srid)
+        encoded.append(struct.pack('>i', len(value)) + bytes(value))
+    return encoded
+
+
+def encode_columns(columns, pg_types=None, srid=None,
+                   block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    Encodes columns of values as PostgreSQL COPY binary data
+
+    Fixed-width columns (booleans, integers, floats, dates and timestamps)
+    are encoded with vectorized NumPy operations. NaN and NaT values are
+    sent as NULL.
+
+    :param columns: List of (name, values, nulls) tuples. values is a
+                    NumPy array and nulls an optional boolean NumPy array
+                    flagging NULL values
+    :param pg_types: PostgreSQL type to send each column as. It must match
+                     the type of the target column. Types are guessed from
+                     the NumPy types if not given
+    :param srid: SRID set to the WKB values of geometry columns
+    :param block_rows: Number of rows encoded at once
+    :type columns: list
+    :type pg_types: dict
+    :type srid: int
+    :type block_rows: int
+
+    :return: Generator of blocks of COPY binary data
+    :rtype: generator
+
+    :raise: CartoException
+    """
+    np = import_numpy()
+    pg_types = pg_types or {}
+
+    prepared = []
+    length = None
+    for name, values, nulls in columns:
+        values = np.asarray(values)
+        if length is None:
+            length = len(values)
+        elif len(values) != length:
+            raise CartoException(_("All the columns must have the same "
+                                   "length"))
+        nulls = np.zeros(len(values), dtype=bool) if nulls is None \
+            else np.asarray(nulls, dtype=bool)
+        pg_type = pg_types.get(name) or guess_pg_type(values)
+        if pg_type not in FIXED_WIDTH_TYPES and \
+                pg_type not in VARIABLE_WIDTH_TYPES:
+            raise CartoException(_("Unsupported type {pg_type} for column "
+                                   "{name}").format(pg_type=pg_type,
+                                                    name=name))
+        prepared.append((values, nulls, pg_type))
+
+    return _encode_blocks(np, prepared, length or 0, srid, block_rows)
+
+
+def _encode_blocks(np, prepared, length, srid, block_rows):
+    yield PGCOPY_HEADER
+
+    field_count = struct.pack('>h', len(prepared))
+    for start in range(0, length, block_rows):
+        end = min(start + block_rows, length)
+        block = []
+        for values, nulls, pg_type in prepared:
+            values, nulls = values[start:end], nulls[start:end]
+            if pg_type in FIXED_WIDTH_TYPES:
+                values, nulls = _fixed_values(np, values, nulls, pg_type)
+            block.append((values, nulls, pg_type))
+
+        if all(pg_type in FIXED_WIDTH_TYPES and not nulls.any()
+               for values, nulls, pg_type in block):
+            yield _encode_fixed_rows(np, block, len(block))
+            continue
+
+        encoded_columns = []
+        for values, nulls, pg_type in block:
+            if pg_type in FIXED_WIDTH_TYPES:
+                encoded_columns.append(_encode_fixed(np, values, nulls,
+                                                     pg_type))
+            else:
+                encoded_columns.append(_encode_variable(values, nulls,
+                                                        pg_type, srid))
+        rows = zip(itertools.repeat(field_count, end - start),
+                   *encoded_columns)
+        yield b''.join(itertools.chain.from_iterable(rows))
+
+    yield PGCOPY_TRAILER
+
+
+def _decode_numeric(data):
+    # Base 10000 digits, see numeric_send in PostgreSQL
+    ndigits, weight, sign, _dscale = struct.unpack_from('>hhHh', data)
+    if sign == NUMERIC_NAN:
+        return float('nan')
+    digits = struct.unpack_from('>{}h'.format(ndigits), data, 8)
+    value = 0
+    for digit in digits:
+        value = value * 10000 + digit
+    value = float(value) * 10000.0 ** (weight - ndigits + 1)
+    return -value if sign == NUMERIC_NEGATIVE else value
+
+
+def _decode_value(pg_type):
+    # Returns a function decoding a field of a variable width type
+    if pg_type in TEXT_TYPES:
+        return lambda data: data.decode('utf-8')
+    if pg_type == 'jsonb':
+        # Version byte followed by the JSON text
+        return lambda data: data[1:].decode('utf-8')
+    if pg_type == 'uuid':
+        return lambda data: str(uuid.UUID(bytes=data))
+    if pg_type == 'numeric':
+        return _decode_numeric
+    return bytes
+
+
+class _ColumnBuffer(object):
+    """
+    Preallocated array where the values of a column are decoded. It grows
+    when it is full unless the rows are split in batches
+    """
+    def __init__(self, np, name, pg_type, size):
+        self.np = np
+        self.name = name
+        self.pg_type = pg_type
+        if pg_type in FIXED_WIDTH_TYPES:
+            self.format = STRUCT_FORMATS[pg_type]
+            self.dtype = self.np.dtype(FIXED_WIDTH_TYPES[pg_type]) \
+                .newbyteorder('=')
+            self.decode = None
+        elif pg_type == 'numeric':
+            self.format = None
+            self.dtype = self.np.dtype('float64')
+            self.decode = _decode_numeric
+        else:
+            self.format = None
+            self.dtype = self.np.dtype(object)
+            self.decode = _decode_value(pg_type)
+        self.allocate(size)
+
+    def allocate(self, size):
+        self.values = self.np.empty(size, dtype=self.dtype)
+        self.nulls = self.np.zeros(size, dtype=bool)
+
+    def grow(self):
+        size = len(self.values)
+        values, nulls = self.values, self.nulls
+        self.allocate(size * 2)
+        self.values[:size] = values
+        self.nulls[:size] = nulls
+
+    def finish(self, length):
+        """
+        :return: The decoded values: timestamps as datetime64, NULL as NaN,
+                 NaT or None when the type allows it, otherwise a masked
+                 array. Also the NULL mask
+        """
+        np = self.np
+        values, nulls = self.values[:length], self.nulls[:length]
+        has_nulls = nulls.any()
+        if self.pg_type in ('timestamp', 'timestamptz'):
+            values = (values + POSTGRES_EPOCH_US).astype('datetime64[us]')
+            values[nulls] = np.datetime64('NaT')
+        elif self.pg_type == 'date':
+            values = (values.astype(np.int64) +
+                      POSTGRES_EPOCH_DAYS).astype('datetime64[D]')
+            values[nulls] = np.datetime64('NaT')
+        elif has_nulls and self.dtype.kind == 'f':
+            values[nulls] = np.nan
+        elif has_nulls and self.dtype.kind == 'O':
+            values[nulls] = None
+        elif has_nulls:
+            values = np.ma.MaskedArray(values, mask=nulls)
+        return values, nulls
+
+
+def decode_rows(chunks, columns, batch_size=DEFAULT_BATCH_ROWS):
+    """
+    Decodes PostgreSQL COPY binary data into batches of NumPy arrays
+
+    :param chunks: Blocks of COPY binary data, as they come from the
+                   response
+    :param columns: List of (name, pg_type) pairs with the columns of the
+                    rows, in order
+    :param batch_size: Number of rows of each batch. If None all the rows
+                       are returned in a single batch
+    :type chunks: generator
+    :type columns: list
+    :type batch_size: int
+
+    :return: Generator of lists of (name, values, nulls) tuples, one per
+             column
+    :rtype: generator
+
+    :raise: CartoException
+    """
+    np = import_numpy()
+    buffers = [_ColumnBuffer(np, name, pg_type, batch_size or 1024)
+               for name, pg_type in columns]
+    unpack_from = struct.unpack_from
+
+    def batch(length):
+        return [(column.name,) + column.finish(length) for column in buffers]
+
+    data = b''
+    pos = 0
+    row = 0
+    header = False
+    finished = False
+    for chunk in chunks:
+        data = data[pos:] + chunk
+        pos = 0
+        size = len(data)
+
+        if not header:
+            if size < 19:
+                continue
+            if data[:11] != PGCOPY_SIGNATURE:
+                raise CartoException(_("Invalid COPY binary signature"))
+            extension_length, = unpack_from('>i', data, 15)
+            if size < 19 + extension_length:
+                continue
+            pos = 19 + extension_length
+            header = True
+
+        while not finished and size - pos >= 2:
+            field_count, = unpack_from('>h', data, pos)
+            if field_count == -1:
+                finished = True
+                break
+            if field_count != len(buffers):
+                raise CartoException(_("Expected {expected} columns but got "
+                                       "{got}").format(expected=len(buffers),
+                                                       got=field_count))
+
+            # Fields are decoded before storing them, so that an incomplete
+            # row can be retried once more data arrives
+            fields = []
+            p = pos + 2
+            for column in buffers:
+                if size - p < 4:
+                    break
+                length, = unpack_from('>i', data, p)
+                p += 4
+                if length == -1:
+                    fields.append(None)
+                    continue
+                if size - p < length:
+                    break
+                if column.format is not None:
+                    fields.append(unpack_from(column.format, data, p)[0])
+                else:
+                    fields.append(column.decode(data[p:p + length]))
+                p += length
+            else:
+                if batch_size is None and row == len(buffers[0].values):
+                    for column in buffers:
+                        column.grow()
+                for column, value in zip(buffers, fields):
+                    if value is None:
+                        column.nulls[row] = True
+                    else:
+                        column.values[row] = value
+                row += 1
+                pos = p
+
+                if row == batch_size:
+                    yield batch(row)
+                    for column in buffers:
+                        column.allocate(batch_size)
+                    row = 0
+                continue
+            break
+
+    if not finished:
+        raise CartoException(_("Truncated COPY binary data"))
+    if row > 0 or batch_size is None:
+        yield batch(row)
@@ -0,0 +1,430 @@
+"""
+Module for caching the results of read-only SQL queries
+
+.. module:: carto.cache
+   :platform: Unix, Windows
+   :synopsis: Module for caching the results of read-only SQL queries
+
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_ENTRIES = 1024
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_TTL = 60  # seconds
+
+# String literals, quoted identifiers, comments and whitespace, in the
+# order they have to be matched
+SQL_TOKENS_RE = re.compile(r"""
+    (?P<literal>'(?:[^']|'')*')
+  | (?P<identifier>"(?:[^"]|"")*")
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+""", re.VERBOSE | re.DOTALL)
+
+READ_ONLY_STATEMENTS = ('select', 'with')
+# Keywords that make a SELECT or WITH statement write or lock rows
+WRITE_KEYWORDS_RE = re.compile(
+    r'\b(insert|update|delete|into|truncate|for\s+share|for\s+no\s+key|'
+    r'for\s+key\s+share)\b')
+
+
+def normalize_sql(sql):
+    """
+    Gets a canonical version of a query: comments are removed, whitespace
+    is collapsed and keywords and unquoted identifiers are lowercased, as
+    PostgreSQL does. String literals and quoted identifiers are kept as
+    they are
+
+    :param sql: The SQL
+    :type sql: str
+
+    :return: The normalized SQL
+    :rtype: str
+    """
+    parts = []
+    position = 0
+    for match in SQL_TOKENS_RE.finditer(sql):
+        if match.start() > position:
+            parts.append(sql[position:match.start()].lower())
+        if match.group('comment') or match.group('space'):
+            if not parts or parts[-1] != ' ':
+                parts.append(' ')
+        else:
+            parts.append(match.group(0))
+        position = match.end()
+    parts.append(sql[position:].lower())
+
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def is_read_only(sql):
+    """
+    Checks whether a query is a single SELECT or WITH statement that
+    doesn't write or lock rows
+
+    Functions with side effects called from a SELECT can't be detected,
+    results of such queries should not be cached.
+
+    :param sql: The SQL
+    :type sql: str
+
+    :return: Boolean
+    """
+    def blank(match):
+        if match.group('literal') or match.group('identifier') or \
+                match.group('dollar'):
+            return "''"
+        return ' '
+
+    statement = SQL_TOKENS_RE.sub(blank, sql).strip().rstrip(';').lower()
+    if ';' in statement:
+        return False
+    if not statement.split(None, 1) or \
+            statement.split(None, 1)[0] not in READ_ONLY_STATEMENTS:
+        return False
+    return WRITE_KEYWORDS_RE.search(statement) is None
+
+
+class QueryCache(object):
+    """
+    Base class of the caches of query results
+
+    Results are stored as the raw content of the responses, so that they
+    can be parsed again on every hit and callers never share the same
+    objects.
+    """
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES,
+                 max_bytes=DEFAULT_CACHE_BYTES, ttl=DEFAULT_CACHE_TTL):
+        """
+        :param max_entries: Maximum number of results kept
+        :param max_bytes: Maximum total size of the results kept
+        :param ttl: Default time to live of the results, in seconds
+        :type max_entries: int
+        :type max_bytes: int
+        :type ttl: float
+
+        :return:
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(sql, format=None, request_args=None, api_key=None,
+                 base_url=None):
+        """
+        Gets the key of the results of a query
+
+        :param sql: The SQL
+        :param format: Format of the results
+        :param request_args: Additional parameters sent with the query
+        :param api_key: API key the query is sent with
+        :param base_url: Base URL of the account the query is sent to. The
+                         same API key, such as default_public, can be used
+                         with several accounts
+        :type sql: str
+        :type format: str
+        :type request_args: dict
+        :type api_key: str
+        :type base_url: str
+
+        :return: Hash of all the arguments
+        :rtype: str
+        """
+        key = json.dumps([normalize_sql(sql), format, request_args or {},
+                          api_key, base_url], sort_keys=True, default=str)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Gets the content stored for a key
+
+        :param key: A key from make_key
+        :type key: str
+
+        :return: The content, or None if missing or expired
+        :rtype: bytes
+        """
+        with self.lock:
+            content = self._get(key, time.time())
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return content
+
+    def set(self, key, content, ttl=None):
+        """
+        Stores the content of a response, evicting the least recently used
+        results if the cache grows beyond its bounds
+
+        :param key: A key from make_key
+        :param content: Content of the response
+        :param ttl: Time to live, in seconds. Defaults to the one of the
+                    cache
+        :type key: str
+        :type content: bytes
+        :type ttl: float
+
+        :return:
+        """
+        if len(content) > self.max_bytes:
+            return
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self._set(key, content, expires)
+            self.evictions += self._evict()
+
+    def stats(self):
+        """
+        Gets the cache stats
+
+        :return: Hits, misses, hit ratio, evictions, expirations, and
+                 number and total size of the results kept
+        :rtype: dict
+        """
+        with self.lock:
+            entries, size = self._size()
+            requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': float(self.hits) / requests
+                    if requests else 0,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'entries': entries,
+                    'bytes': size}
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def _get(self, key, now):
+        raise NotImplementedError
+
+    def _set(self, key, content, expires):
+        raise NotImplementedError
+
+    def _evict(self):
+        raise NotImplementedError
+
+    def _size(self):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class MemoryQueryCache(QueryCache):
+    """
+    Cache of query results kept in memory
+    """
+    def __init__(self, *args, **kwargs):
+        super(MemoryQueryCache, self).__init__(*args, **kwargs)
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        content, expires = entry
+        if expires <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        # Moved to the end, as the most recently used
+        self.entries[key] = self.entries.pop(key)
+        return content
+
+    def _remove(self, key):
+        content, _ = self.entries.pop(key)
+        self.size -= len(content)
+
+    def _set(self, key, content, expires):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (content, expires)
+        self.size += len(content)
+
+    def _evict(self):
+        evicted = 0
+        while len(self.entries) > self.max_entries or \
+                self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            evicted += 1
+        return evicted
+
+    def _size(self):
+        return len(self.entries), self.size
+
+    def _clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class SQLiteQueryCache(QueryCache):
+    """
+    Cache of query results kept in a SQLite file, so that they survive
+    restarts and can be shared by several processes
+    """
+    def __init__(self, path, *args, **kwargs):
+        """
+        :param path: Path of the SQLite file
+        :param args: Bounds and TTL of QueryCache
+        :param kwargs: Bounds and TTL of QueryCache
+        :type path: str
+
+        :return:
+        """
+        super(SQLiteQueryCache, self).__init__(*args, **kwargs)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS query_cache ('
+                                'key TEXT PRIMARY KEY, content BLOB, '
+                                'size INTEGER, expires REAL, '
+                                'accessed REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS '
+                                'query_cache_accessed '
+                                'ON query_cache (accessed)')
+
+    def _get(self, key, now):
+        row = self.connection.execute(
+            'SELECT content, expires FROM query_cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        content, expires = row
+        if expires <= now:
+            self.connection.execute('DELETE FROM query_cache WHERE key = ?',
+                                    (key,))
+            self.expirations += 1
+            return None
+        self.connection.execute(
+            'UPDATE query_cache SET accessed = ? WHERE key = ?', (now, key))
+        return bytes(content)
+
+    def _set(self, key, content, expires):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO query_cache '
+            '(key, content, size, expires, accessed) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, sqlite3.Binary(content), len(content), expires,
+             time.time()))
+
+    def _evict(self):
+        evicted = 0
+        entries, size = self._size()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return evicted
+        rows = self.connection.execute(
+            'SELECT key, size FROM query_cache ORDER BY accessed').fetchall()
+        for key, entry_size in rows:
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM query_cache WHERE key = ?',
+                                    (key,))
+            entries -= 1
+            size -= entry_size
+            evicted += 1
+        return evicted
+
+    def _size(self):
+        entries, size = self.connection.execute(
+            'SELECT count(*), coalesce(sum(size), 0) '
+            'FROM query_cache').fetchone()
+        return entries, size
+
+    def _clear(self):
+        self.connection.execute('DELETE FROM query_cache')
+
+    def close(self):
+        self.connection.close()
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical calls made at the same time: the first caller of a
+    key runs the call and the rest wait for it and get the same outcome,
+    either its result or its exception
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.saved = 0
+
+    def do(self, key, function):
+        """
+        Runs function, unless a call with the same key is already in flight
+
+        :param key: Key of the call, such as a key from
+                    QueryCache.make_key. Callers with the same key get the
+                    same result, so it must identify the account too
+        :param function: Function to run, without arguments
+        :type key: str
+        :type function: callable
+
+        :return: The result of the call
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """
+        Gets the coalescing stats
+
+        :return: Calls executed, calls saved by waiting for an identical
+                 one, and calls in flight
+        :rtype: dict
+        """
+        with self.lock:
+            return {'executed': self.executed,
+                    'saved': self.saved,
+                    'in_flight': len(self.calls)}
@@ -0,0 +1,258 @@
+"""
+Conversion of SQL API results into typed columns
+
+.. module:: carto.columnar
+   :platform: Unix, Windows
+   :synopsis: Conversion of SQL API results into typed columns
+
+NumPy is needed to use this module, and pandas to get DataFrames, but they
+are not dependencies of the SDK: they are only imported when used.
+
+"""
+
+from gettext import gettext as _
+from collections import OrderedDict
+import binascii
+import datetime
+import struct
+
+from .binary_copy import import_numpy, EWKB_SRID_FLAG
+from .exceptions import CartoException
+
+INTEGER_PG_TYPES = ['int2', 'int4', 'int8', 'oid']
+DATETIME_PG_TYPES = ['date', 'timestamp', 'timestamptz']
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def import_pandas():
+    try:
+        import pandas
+    except ImportError:
+        raise CartoException(_("pandas is required to get DataFrames"))
+    return pandas
+
+
+def hex_ewkb_to_wkb(value):
+    """
+    Gets the WKB of a geometry as the SQL API returns it, removing the
+    SRID of the EWKB
+
+    :param value: Hex-encoded EWKB
+    :type value: str
+
+    :return: WKB
+    :rtype: bytes
+    """
+    ewkb = binascii.unhexlify(value)
+    byte_order = '<I' if ewkb[:1] == b'\x01' else '>I'
+    geometry_type = struct.unpack_from(byte_order, ewkb, 1)[0]
+    if not geometry_type & EWKB_SRID_FLAG:
+        return ewkb
+    return ewkb[:1] + struct.pack(byte_order,
+                                  geometry_type & ~EWKB_SRID_FLAG) + ewkb[9:]
+
+
+def _object_array(values, np):
+    # Assigned one by one, so that lists from JSON arrays are not
+    # broadcast
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _has_offset(value):
+    # Offsets are +HH, +HHMM or +HH:MM
+    return len(value) > 19 and (value[-3] in '+-' or value[-5] in '+-' or
+                                value[-6] in '+-')
+
+
+def _parse_datetime(value):
+    # The SQL API sends ISO 8601 strings, in UTC unless the offset is given
+    if value.endswith('Z'):
+        value = value[:-1]
+    offset = datetime.timedelta(0)
+    if _has_offset(value):
+        for length in (3, 5, 6):
+            if value[-length] in '+-':
+                break
+        digits = value[-length + 1:].replace(':', '')
+        sign = -1 if value[-length] == '-' else 1
+        offset = sign * datetime.timedelta(hours=int(digits[:2]),
+                                           minutes=int(digits[2:] or 0))
+        value = value[:-length]
+    value = value.replace(' ', 'T')
+    date_format = '%Y-%m-%dT%H:%M:%S' if 'T' in value else '%Y-%m-%d'
+    if '.' in value:
+        date_format += '.%f'
+    parsed = datetime.datetime.strptime(value, date_format) - offset
+    delta = parsed - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + \
+        delta.microseconds
+
+
+def column_array(values, field=None):
+    """
+    Builds a typed NumPy array with the values of a column
+
+    NULL values are NaN for numbers with decimals, NaT for dates and None
+    for strings and geometries. Integer and boolean columns with NULL
+    values are masked arrays
+
+    :param values: The values of the column, as parsed from JSON
+    :param field: The metadata of the column, from the fields of the
+                  result
+    :type values: list
+    :type field: dict
+
+    :return: The column
+    :rtype: numpy.ndarray
+    """
+    np = import_numpy()
+    field = field or {}
+    json_type = field.get('type')
+    pg_type = field.get('pgtype')
+
+    nulls = np.fromiter((value is None for value in values), dtype=bool,
+                        count=len(values))
+    has_nulls = nulls.any()
+
+    if json_type == 'geometry' or pg_type == 'geometry':
+        return _object_array([None if value is None else
+                              hex_ewkb_to_wkb(value) for value in values],
+                             np)
+
+    if json_type == 'date' or pg_type in DATETIME_PG_TYPES:
+        values = ['NaT' if value is None else
+                  value[:-1] if value.endswith('Z') else value
+                  for value in values]
+        if not any(_has_offset(value) for value in values):
+            return np.array(values, dtype='datetime64[us]')
+        return np.array([-2 ** 63 if value == 'NaT' else
+                         _parse_datetime(value) for value in values],
+                        dtype=np.int64).view('datetime64[us]')
+
+    if pg_type in INTEGER_PG_TYPES:
+        array = np.array([0 if value is None else int(value)
+                          for value in values], dtype=np.int64)
+    elif json_type == 'number':
+        return np.array([np.nan if value is None else float(value)
+                         for value in values], dtype=np.float64)
+    elif json_type == 'boolean' or pg_type == 'bool':
+        array = np.array([bool(value) for value in values], dtype=bool)
+    else:
+        return _object_array(values, np)
+
+    if has_nulls:
+        array = np.ma.MaskedArray(array, mask=nulls)
+    return array
+
+
+def build_columns(names, values, fields=None):
+    """
+    Builds typed NumPy arrays with the values of the columns of a result
+
+    :param names: Names of the columns, in order
+    :param values: List of values of every column
+    :param fields: The fields of the result, with the type of every
+                   column
+    :type names: list
+    :type values: list
+    :type fields: dict
+
+    :return: Arrays of the columns by name
+    :rtype: collections.OrderedDict
+    """
+    fields = fields or {}
+    return OrderedDict((name, column_array(column, fields.get(name)))
+                       for name, column in zip(names, values))
+
+
+def csv_query(sql, fields):
+    """
+    Wraps a query so that its CSV output can be typed without guessing:
+    geometries as hex-encoded WKB, dates and timestamps as ISO 8601 strings
+    in UTC and booleans as integers
+
+    :param sql: The SQL
+    :param fields: The fields of the result of the query, in the order
+                   of the columns
+    :type sql: str
+    :type fields: collections.OrderedDict
+
+    :return: The wrapped SQL and the names of its columns, in order
+    :rtype: tuple
+    """
+    names = []
+    columns = []
+    for name, field in fields.items():
+        names.append(name)
+        column = '"{name}"'.format(name=name.replace('"', '""'))
+        json_type = field.get('type')
+        pg_type = field.get('pgtype')
+        if json_type == 'geometry' or pg_type == 'geometry':
+            expression = "encode(ST_AsBinary({column}), 'hex')"
+        elif pg_type == 'timestamptz':
+            expression = "to_char({column} AT TIME ZONE 'UTC', " \
+                         "'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+        elif pg_type == 'timestamp':
+            expression = "to_char({column}, 'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+        elif json_type == 'boolean' or pg_type == 'bool':
+            expression = '{column}::int'
+        else:
+            columns.append(column)
+            continue
+        columns.append((expression + ' AS {column}').format(column=column))
+
+    wrapped_sql = 'SELECT {columns} FROM ({sql}\n) _csv'.format(
+        columns=', '.join(columns), sql=sql.strip().rstrip(';'))
+    return wrapped_sql, names
+
+
+def build_csv_columns(names, values, fields=None):
+    """
+    Builds typed NumPy arrays with the values of the columns of the CSV
+    output of a query wrapped with csv_query
+
+    Empty values are NULL, except in string columns, where NULL values
+    can't be told apart from empty strings
+
+    :param names: Names of the columns, in order
+    :param values: List of string values of every column
+    :param fields: The fields of the result, with the type of every
+                   column
+    :type names: list
+    :type values: list
+    :type fields: dict
+
+    :return: Arrays of the columns by name
+    :rtype: collections.OrderedDict
+    """
+    fields = fields or {}
+    parsed = []
+    for name, column in zip(names, values):
+        field = fields.get(name) or {}
+        if field.get('type') == 'string':
+            parsed.append(column)
+        elif field.get('type') == 'boolean' or field.get('pgtype') == 'bool':
+            parsed.append([None if value == '' else value in ('1', 't',
+                                                              'true')
+                           for value in column])
+        else:
+            parsed.append([None if value == '' else value
+                           for value in column])
+    return build_columns(names, parsed, fields)
+
+
+def columns_to_dataframe(columns):
+    """
+    Builds a DataFrame with the arrays of build_columns
+
+    :param columns: Arrays of the columns by name
+    :type columns: collections.OrderedDict
+
+    :return: The DataFrame
+    :rtype: pandas.DataFrame
+    """
+    pandas = import_pandas()
+    return pandas.DataFrame(columns, columns=list(columns.keys()))
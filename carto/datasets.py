@@ -15,8 +15,7 @@ import time
 import json
 from gettext import gettext as _
 
-from pyrestcli.fields import IntegerField, CharField, DateTimeField, \
-    BooleanField, DictField
+from pyrestcli.fields import IntegerField, CharField, BooleanField, DictField
 
 from .exceptions import CartoException
 from .file_import import FileImportJobManager
@@ -24,7 +23,7 @@ from .resources import WarnResource
 from .sync_tables import SyncTableJobManager
 from .tables import TableManager
 from .fields import (TableField, UserField, PermissionField,
-                     SynchronizationField, VisualizationField)
+                     SynchronizationField, VisualizationField, DateTimeField)
 from .paginators import CartoPaginator
 from .resources import Manager
 
@@ -140,6 +139,13 @@ class DatasetManager(Manager):
         except Exception as e:
             raise CartoException(e)
 
+    def changes_since(self, timestamp=None, snapshot=None, **search_args):
+        """
+        Gets the datasets created, updated or deleted since a given time.
+        See :func:`carto.resources.Manager._changes_since`
+        """
+        return self._changes_since(timestamp, snapshot, **search_args)
+
     def is_sync_table(self, archive, interval, **import_args):
         """
         Checks if this is a request for a sync dataset.
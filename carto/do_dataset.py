@@ -1,7 +1,7 @@
 import os
 import time
 import requests
-from .utils import ResponseStream
+from .utils import ResponseStream, DEFAULT_STREAM_CHUNK_SIZE
 from .exceptions import CartoException
 
 VALID_TYPES = [
@@ -118,13 +118,15 @@ class _DODatasetClient:
 
         return response
 
-    def download_stream(self, name_id, limit=None, order_by=None, sql_query=None, add_geom=None, is_geography=None):
+    def download_stream(self, name_id, limit=None, order_by=None, sql_query=None, add_geom=None, is_geography=None,
+                        chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
         return ResponseStream(self.download(name_id,
                                             limit=limit,
                                             order_by=order_by,
                                             sql_query=sql_query,
                                             add_geom=add_geom,
-                                            is_geography=is_geography))
+                                            is_geography=is_geography),
+                              chunk_size)
 
     def create(self, payload):
         params = {'api_key': self.api_key}
@@ -318,13 +320,15 @@ class DODataset:
             payload['ttl_seconds'] = self._ttl_seconds
         self._client.create(payload)
 
-    def download_stream(self, limit=None, order_by=None, sql_query=None, add_geom=None, is_geography=None):
+    def download_stream(self, limit=None, order_by=None, sql_query=None, add_geom=None, is_geography=None,
+                        chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
         return self._client.download_stream(name_id=self._name,
                                             limit=limit,
                                             order_by=order_by,
                                             sql_query=sql_query,
                                             add_geom=add_geom,
-                                            is_geography=is_geography)
+                                            is_geography=is_geography,
+                                            chunk_size=chunk_size)
 
     def upload(self, dataframe, geom_column=None):
         return self._client.upload(dataframe, self._name, params={'geom_column': geom_column})
@@ -11,8 +11,9 @@ Module for exporting visualizations
 
 """
 
-from pyrestcli.fields import CharField, DateTimeField
+from pyrestcli.fields import CharField
 
+from .fields import DateTimeField
 from .resources import WarnAsyncResource
 
 
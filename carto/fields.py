@@ -12,12 +12,104 @@ Module for defining response objects
 """
 
 import base64
+import threading
 
-from pyrestcli.fields import ResourceField, CharField
+from pyrestcli.fields import Field, ResourceField as PyRestCliResourceField, \
+    DateTimeField as PyRestCliDateTimeField, CharField
 
 PRIVACY_PUBLIC = 'public'
 PRIVACY_PASSWORD = 'password'
 
+# Values of lazy fields are kept in the instance under this prefix until
+# they are parsed
+RAW_VALUE_PREFIX = '_raw_'
+
+_MISSING = object()
+
+
+class _FieldHolder(object):
+    def __init__(self, client):
+        self.client = client
+
+
+def is_plain_field(field):
+    """
+    Checks whether a field stores values as they come in the JSON of the
+    API, with no parsing
+
+    :param field: The field
+    :type field: :class:`pyrestcli.fields.Field`
+
+    :return: Boolean
+    """
+    return type(field).__set__ is Field.__set__
+
+
+def decode_field(field, value, client):
+    """
+    Parses a JSON value as a field of a resource does when it is set, for
+    instance building the nested resources of a ResourceField
+
+    :param field: The field
+    :param value: The value, as it comes in the JSON of the API
+    :param client: Auth client of the nested resources
+    :type field: :class:`pyrestcli.fields.Field`
+    :type client: :class:`carto.auth.APIKeyAuthClient`
+
+    :return: The parsed value
+    """
+    holder = _FieldHolder(client)
+    field.__set__(holder, value)
+    return field.__get__(holder, _FieldHolder)
+
+
+class LazyField(object):
+    """
+    Mixin for fields that keep values as they come in the JSON of the API
+    and parse them on first access
+
+    Listings build many resources whose nested resources and datetimes are
+    never read, so they are not parsed unless needed. Parsed values are
+    kept, so every value is parsed once at most.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LazyField, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if instance is not None and self.name is not None:
+            raw_name = RAW_VALUE_PREFIX + self.name
+            values = instance.__dict__
+            if raw_name in values:
+                # Resources can be read from several threads. The raw
+                # value is only dropped once the parsed one is stored, so
+                # that no thread finds neither of them
+                with self.lock:
+                    raw = values.get(raw_name, _MISSING)
+                    if raw is not _MISSING:
+                        super(LazyField, self).__set__(instance, raw)
+                        values.pop(raw_name, None)
+        return super(LazyField, self).__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        if instance is not None and self.name is not None:
+            instance.__dict__.pop(self.name, None)
+            instance.__dict__[RAW_VALUE_PREFIX + self.name] = value
+
+
+class DateTimeField(LazyField, PyRestCliDateTimeField):
+    """
+    Datetimes, parsed on first access
+    """
+    pass
+
+
+class ResourceField(LazyField, PyRestCliResourceField):
+    """
+    Nested resources, built on first access
+    """
+    pass
+
 
 class VisualizationField(ResourceField):
     """
@@ -9,9 +9,10 @@ Module for working with custom map visualizations (aka Kuvizs)
 
 """
 
-from pyrestcli.fields import CharField, DateTimeField
+from pyrestcli.fields import CharField
 
-from .fields import Base64EncodedField, PasswordAndPrivacyFields
+from .fields import Base64EncodedField, PasswordAndPrivacyFields, \
+    DateTimeField
 from .resources import Manager, WarnResource
 from .paginators import CartoPaginator
 
@@ -18,35 +18,100 @@ class CartoPaginator(Paginator):
     """
     Used internally to retrieve results paginated
 
+    Pages are requested one after another, unless the paginator has more
+    than one worker: then the first page is requested alone, to know the
+    total number of entries, and the rest are requested concurrently by
+    the manager.
     """
-    def __init__(self, json_collection_attribute, base_url, params=None):
+    def __init__(self, json_collection_attribute, base_url, params=None,
+                 per_page=None, workers=1):
+        """
+        :param json_collection_attribute: Attribute of the response with the
+                                          entries of the page
+        :param base_url: Base URL of the API
+        :param params: Parameters of every request
+        :param per_page: Number of entries requested per page. Defaults to
+                         the page size of the API
+        :param workers: Number of pages requested at the same time
+        :type json_collection_attribute: str
+        :type base_url: str
+        :type params: dict
+        :type per_page: int
+        :type workers: int
+        """
         self.json_collection_attribute = json_collection_attribute
+        self.per_page = per_page
+        self.workers = workers
 
         super(CartoPaginator, self).__init__(base_url, params)
 
+    def page_params(self, page):
+        """
+        Gets the parameters to request a page
+
+        :param page: Number of the page, starting at 1
+        :type page: int
+
+        :return: The parameters
+        :rtype: dict
+        """
+        params = {"page": page}
+        if self.per_page is not None:
+            params["per_page"] = self.per_page
+        return params
+
+    @staticmethod
+    def get_total(response_json):
+        """
+        Gets the total number of entries of a paginated response
+
+        :param response_json: The response of any page
+        :type response_json: dict
+
+        :return: The total number of entries, 0 if unknown
+        :rtype: int
+        """
+        if "total_entries" in response_json:
+            return int(response_json["total_entries"])
+        elif "total_user_entries" in response_json:
+            return int(response_json["total_user_entries"])
+        elif "total" in response_json:
+            return int(response_json["total"])
+        return 0
+
+    def page_count(self, response_json, page_size):
+        """
+        Gets the number of pages of a collection from its first page
+
+        :param response_json: The response of the first page
+        :param page_size: Number of entries in the first page
+        :type response_json: dict
+        :type page_size: int
+
+        :return: The number of pages
+        :rtype: int
+        """
+        total = self.get_total(response_json)
+        # The API may cap per_page, the size of the first page is the one
+        # of every page
+        if page_size == 0 or total <= page_size:
+            return 1
+        return (total + page_size - 1) // page_size
+
     def get_urls(self, initial_url):
         self.url = initial_url
         self.total_count = 0
         self.page = 1
 
         while self.url is not None:
-            yield self.url, {"page": self.page}
+            yield self.url, self.page_params(self.page)
 
     def process_response(self, response):
         response_json = response.json()
         if self.json_collection_attribute in response_json:
             self.total_count += len(response_json[self.json_collection_attribute])
 
-        if "total_entries" in response_json:
-            total_count_from_api = int(response_json["total_entries"])
-        elif "total_user_entries" in response_json:
-            total_count_from_api = int(response_json["total_user_entries"])
-        elif "total" in response_json:
-            total_count_from_api = int(response_json["total"])
-        else:
-            total_count_from_api = 0
-
-        if self.total_count < total_count_from_api:
+        if self.total_count < self.get_total(response_json):
             self.page += 1
         else:
             self.url = None
@@ -12,9 +12,9 @@ Entity classes for defining permissions
 """
 
 from pyrestcli.resources import Resource
-from pyrestcli.fields import CharField, DateTimeField
+from pyrestcli.fields import CharField
 
-from .fields import UserField, EntityField
+from .fields import UserField, EntityField, DateTimeField
 
 
 PUBLIC = "PUBLIC"
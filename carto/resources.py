@@ -11,11 +11,36 @@ Extensions for pyrestcli Resource and Manager classes
 
 """
 
+from gettext import gettext as _
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 
+from dateutil.parser import parse as parse_datetime
+from dateutil.tz import tzutc
 from pyrestcli.resources import Resource, Manager as PyRestCliManager
 
 from .exceptions import CartoException
+from .fields import decode_field, is_plain_field
+from .paginators import CartoPaginator
+
+# Times the resources are listed to find deletions, if resources keep
+# moving between pages while they are listed
+MAX_CHANGES_LISTINGS = 3
+
+try:
+    text_type = basestring
+except NameError:
+    text_type = str
+
+
+def _get_updated_at(resource):
+    # pyrestcli only parses str values, so on Python 2 the dates of the JSON
+    # are left as unicode
+    updated_at = resource.updated_at
+    if isinstance(updated_at, text_type):
+        updated_at = parse_datetime(updated_at)
+    return updated_at
 
 
 class AsyncResource(Resource):
@@ -91,16 +116,401 @@ class WarnResource(Resource):
         super(WarnResource, self).__init__(auth_client, **kwargs)
 
 
+class ResourceRecord(object):
+    """
+    Read-only, compact representation of a resource from a listing
+
+    Values are kept in slots instead of a per-instance dict, and fields
+    that parse their values, such as nested resources and datetimes, are
+    only parsed on first access. Records can be promoted to full resources
+    to modify and save them.
+
+    Use :func:`get_record_class` to get the record class of a resource
+    class.
+    """
+    __slots__ = ('_client', '_pending')
+    resource_class = None
+    # (name, slot, field, lazy) of every field of the resource class
+    _fields = ()
+
+    def __init__(self, client, raw_resource):
+        """
+        :param client: Client to make (non)authorized requests
+        :param raw_resource: The resource, as it comes in the JSON of the
+                             API
+        :type raw_resource: dict
+
+        :return:
+        """
+        self._client = client
+        pending = 0
+        for i, (name, slot, field, lazy) in enumerate(self._fields):
+            value = raw_resource.get(name)
+            if lazy and value is not None:
+                pending |= 1 << i
+            slot.__set__(self, value)
+        self._pending = pending
+
+    def __str__(self):
+        return str(getattr(self, self.resource_class.Meta.name_field, None))
+
+    def __repr__(self):
+        return '<{name} {id}>'.format(name=type(self).__name__,
+                                      id=self.get_id())
+
+    def get_id(self):
+        return getattr(self, self.resource_class.Meta.id_field, None)
+
+    def promote(self):
+        """
+        Builds the full resource, that can be modified and saved
+
+        :return: The resource
+        :rtype: :class:`pyrestcli.resources.Resource`
+        """
+        resource = self.resource_class(self._client)
+        for i, (name, slot, field, lazy) in enumerate(self._fields):
+            value = slot.__get__(self)
+            if lazy and not self._pending & (1 << i):
+                # Already parsed, the field would parse it again
+                resource.__dict__[name] = value
+            else:
+                setattr(resource, name, value)
+        return resource
+
+
+def _record_property(i, slot, field):
+    def get(self):
+        value = slot.__get__(self)
+        if self._pending & (1 << i):
+            value = decode_field(field, value, self._client)
+            slot.__set__(self, value)
+            self._pending &= ~(1 << i)
+        return value
+    return property(get)
+
+
+_record_classes = {}
+
+
+def get_record_class(resource_class):
+    """
+    Gets the record class of a resource class, with a slot and a read-only
+    property for every field
+
+    :param resource_class: The resource class
+    :type resource_class: type
+
+    :return: Subclass of :class:`carto.resources.ResourceRecord`
+    :rtype: type
+    """
+    record_class = _record_classes.get(resource_class)
+    if record_class is not None:
+        return record_class
+
+    names = list(resource_class.fields)
+    record_class = type(resource_class.__name__ + 'Record', (ResourceRecord,),
+                        {'__slots__': tuple('_' + name for name in names),
+                         'resource_class': resource_class})
+    fields = []
+    for i, name in enumerate(names):
+        slot = getattr(record_class, '_' + name)
+        field = resource_class.__dict__[name]
+        lazy = not is_plain_field(field)
+        fields.append((name, slot, field, lazy))
+        setattr(record_class, name,
+                _record_property(i, slot, field) if lazy
+                else property(slot.__get__))
+    record_class._fields = tuple(fields)
+
+    _record_classes[resource_class] = record_class
+    return record_class
+
+
 class Manager(PyRestCliManager):
     """
     Manager class for resources
     """
-    def __init__(self, auth_client):
+    def __init__(self, auth_client, per_page=None, page_workers=1):
         """
         :param auth_client: Client to make (non)authorized requests
+        :param per_page: Number of resources requested per page, for
+                         paginated collections. Defaults to the page size
+                         of the API
+        :param page_workers: Number of pages requested at the same time,
+                             for paginated collections
+        :type per_page: int
+        :type page_workers: int
 
         :return:
         """
-        self.paginator = self.paginator_class(self.json_collection_attribute,
-                                              auth_client.base_url)
+        if issubclass(self.paginator_class, CartoPaginator):
+            self.paginator = self.paginator_class(
+                self.json_collection_attribute, auth_client.base_url,
+                per_page=per_page, workers=page_workers)
+        else:
+            self.paginator = self.paginator_class(
+                self.json_collection_attribute, auth_client.base_url)
         super(PyRestCliManager, self).__init__(auth_client)
+
+    def filter(self, **search_args):
+        """
+        Get a filtered list of resources
+
+        With more than one page worker, the pages after the first one are
+        requested concurrently, and resources are still returned in the
+        order of the pages.
+
+        :param search_args: To be translated into ?arg1=value1&arg2=value2...
+        :type search_args: kwargs
+
+        :return: A list of resources
+        :rtype: list
+        """
+        if getattr(self.paginator, "workers", 1) <= 1:
+            return super(Manager, self).filter(**search_args)
+
+        resources = []
+        for raw_resources in self._get_pages(search_args):
+            resources += self._build_resources(raw_resources)
+        return resources
+
+    def iter_all(self, **search_args):
+        """
+        Iterates over a filtered collection of resources as its pages arrive
+
+        Only the pages being consumed are kept in memory, and the next ones,
+        as many as page workers, are requested in the background while the
+        current one is consumed. Pages that are not needed are never
+        requested if the iteration is stopped early.
+
+        :param search_args: To be translated into ?arg1=value1&arg2=value2...
+        :type search_args: kwargs
+
+        :return: Iterator of resources
+        :rtype: iterator
+        """
+        if not self._reads_pages():
+            for resource in self.filter(**search_args):
+                yield resource
+            return
+
+        for response_data, raw_resources in self._iter_pages(search_args):
+            for resource in self._build_resources(raw_resources):
+                yield resource
+
+    def iter_records(self, **search_args):
+        """
+        Iterates over a filtered collection of resources as read-only
+        records, as its pages arrive
+
+        Records use a fraction of the memory of resources, see
+        :class:`carto.resources.ResourceRecord`. Pages are read ahead as in
+        iter_all.
+
+        :param search_args: To be translated into ?arg1=value1&arg2=value2...
+        :type search_args: kwargs
+
+        :return: Iterator of records
+        :rtype: iterator
+
+        :raise: CartoException
+        """
+        if not self._reads_pages():
+            raise CartoException(_("Records are not supported by {manager}").format(
+                manager=type(self).__name__))
+
+        record_class = get_record_class(self.resource_class)
+        for response_data, raw_resources in self._iter_pages(search_args):
+            for raw_resource in raw_resources:
+                yield record_class(self.client, raw_resource)
+
+    def _reads_pages(self):
+        # Pages can only be read on their own with CARTO's pagination and
+        # when filter is not overridden. Python 2 compares the functions of
+        # the unbound methods, as every access builds a new one
+        filter_method = type(self).filter
+        return isinstance(self.paginator, CartoPaginator) and \
+            getattr(filter_method, '__func__', filter_method) is \
+            getattr(Manager.filter, '__func__', Manager.filter)
+
+    def _iter_pages(self, search_args):
+        # Yields the response and the raw resources of every page, in
+        # order, reading ahead as many pages as page workers
+        url = self.get_collection_endpoint()
+        read_ahead = max(1, self.paginator.workers)
+        with ThreadPoolExecutor(max_workers=read_ahead) as executor:
+            pages = deque([executor.submit(self._get_page, url, search_args,
+                                           1)])
+            next_page = 2
+            page_count = None
+            try:
+                while pages:
+                    response_data = pages.popleft().result()
+                    raw_resources = self._get_raw_resources(response_data)
+                    if page_count is None:
+                        page_count = self.paginator.page_count(
+                            response_data, len(raw_resources))
+                    while next_page <= page_count and \
+                            len(pages) < read_ahead:
+                        pages.append(executor.submit(self._get_page, url,
+                                                     search_args, next_page))
+                        next_page += 1
+                    yield response_data, raw_resources
+            finally:
+                for page in pages:
+                    page.cancel()
+
+    def _changes_since(self, timestamp=None, snapshot=None, **search_args):
+        """
+        Gets the resources created, updated or deleted since a given time,
+        for managers of resources with an updated_at field whose
+        collection can be ordered by it
+
+        Resources are listed from the most recently updated one, and the
+        listing stops at the first one updated before the timestamp, so the
+        cost depends on the number of changes and not on the number of
+        resources. Deletions are detected by comparing the total number of
+        resources with the snapshot: only when some are missing, the rest
+        of them are listed to find which.
+
+        :param timestamp: Time of the last refresh, usually the watermark
+                          returned by the previous call, in UTC if naive.
+                          None to list all the resources
+        :param snapshot: Update time of every resource known so far by id,
+                         as returned by the previous call. It is updated in
+                         place
+        :param search_args: To be translated into ?arg1=value1&arg2=value2...
+        :type timestamp: datetime.datetime
+        :type snapshot: dict
+        :type search_args: kwargs
+
+        :return: The resources created or updated since the timestamp in
+                 changed, the ids of the deleted ones in deleted, the time
+                 of the last update in watermark and the updated snapshot
+        :rtype: dict
+
+        :raise: CartoException
+        """
+        if timestamp is not None and timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=tzutc())
+        snapshot = {} if snapshot is None else snapshot
+        search_args.update({"order": "updated_at",
+                            "order_direction": "desc"})
+
+        deleted = []
+        for listing in range(MAX_CHANGES_LISTINGS):
+            changed, ids, total, created, complete = self._list_changes(
+                timestamp, snapshot, search_args)
+            if not complete:
+                break
+            # A resource updated while the pages are listed moves to the
+            # first page and can be missed, which looks like a deletion.
+            # The counts don't add up then, and the listing is repeated. If
+            # they never do, deletions are left for the next call
+            missing = sorted(set(snapshot) - ids)
+            if total is None or \
+                    len(snapshot) + created - len(missing) == total:
+                deleted = missing
+                break
+
+        for resource_id in deleted:
+            del snapshot[resource_id]
+        watermark = timestamp
+        for resource in changed:
+            updated_at = _get_updated_at(resource)
+            snapshot[resource.get_id()] = updated_at
+            if updated_at is not None and \
+                    (watermark is None or updated_at > watermark):
+                watermark = updated_at
+
+        return {"changed": changed,
+                "deleted": deleted,
+                "watermark": watermark,
+                "snapshot": snapshot}
+
+    def _list_changes(self, timestamp, snapshot, search_args):
+        changed = []
+        ids = set()
+        total = None
+        created = 0
+        past_timestamp = False
+        complete = True
+        pages = self._iter_pages(search_args)
+        try:
+            for response_data, raw_resources in pages:
+                if total is None:
+                    total = self.paginator.get_total(response_data)
+                for raw_resource in raw_resources:
+                    ids.add(raw_resource.get("id"))
+                    if past_timestamp:
+                        continue
+                    resources = self._build_resources([raw_resource])
+                    if not resources:
+                        continue
+                    resource = resources[0]
+                    updated_at = _get_updated_at(resource)
+                    if timestamp is not None and updated_at is not None and \
+                            updated_at < timestamp:
+                        past_timestamp = True
+                        # Unless resources of the snapshot are missing
+                        # from the total, none was deleted
+                        if len(snapshot) + created <= total:
+                            complete = False
+                            break
+                        continue
+                    changed.append(resource)
+                    if resource.get_id() not in snapshot:
+                        created += 1
+                if not complete:
+                    break
+        finally:
+            pages.close()
+
+        return changed, ids, total, created, complete
+
+    def _get_page(self, url, search_args, page):
+        params = dict(search_args)
+        params.update(self.paginator.page_params(page))
+        response = self.send(url, "get", params=params)
+        return self.client.get_response_data(response, self.Meta.parse_json)
+
+    def _get_raw_resources(self, response_data):
+        if self.json_collection_attribute is None:
+            return response_data
+        return response_data[self.json_collection_attribute]
+
+    def _get_pages(self, search_args):
+        # Yields the raw resources of every page, in order
+        url = self.get_collection_endpoint()
+        first_page = self._get_page(url, search_args, 1)
+        raw_resources = self._get_raw_resources(first_page)
+        yield raw_resources
+
+        page_count = self.paginator.page_count(first_page,
+                                               len(raw_resources))
+        if page_count <= 1:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.paginator.workers) as \
+                executor:
+            pages = [executor.submit(self._get_page, url, search_args, page)
+                     for page in range(2, page_count + 1)]
+            try:
+                for page in pages:
+                    yield self._get_raw_resources(page.result())
+            finally:
+                for page in pages:
+                    page.cancel()
+
+    def _build_resources(self, raw_resources):
+        resources = []
+        for raw_resource in raw_resources:
+            try:
+                resource = self.resource_class(self.client)
+            except (ValueError, TypeError):
+                continue
+            else:
+                resource.update_from_dict(raw_resource)
+                resources.append(resource)
+        return resources
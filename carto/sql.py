@@ -12,12 +12,45 @@ Module for the SQL API
 """
 
 from gettext import gettext as _
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import functools
+import heapq
+import io
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import threading
 import zlib
 import time
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from os import replace as replace_file
+except ImportError:
+    def replace_file(source, target):
+        # os.rename doesn't overwrite files on Windows
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+
+from .columnar import build_columns, build_csv_columns, \
+    columns_to_dataframe, csv_query, INTEGER_PG_TYPES
+from .cache import MemoryQueryCache, QueryCache, SingleFlight, \
+    is_read_only
+from .binary_copy import encode_columns, decode_rows, import_numpy, \
+    DEFAULT_BLOCK_ROWS, DEFAULT_BATCH_ROWS
 from .exceptions import CartoException, CartoRateLimitException
 from requests import HTTPError
-from .utils import ResponseStream
+from .utils import ResponseStream, JSONRowsReader
 
 SQL_API_URL = 'api/{api_version}/sql'
 SQL_BATCH_API_URL = 'api/{api_version}/sql/job/'
@@ -37,25 +70,287 @@ DEFAULT_CHUNK_SIZE = 8 * 1024  # 8 KB provides good results in practice
 # the DB). Those levels are also gentle with platform CPU usage.
 DEFAULT_COMPRESSION_LEVEL = 1
 
+# Number of concurrent COPY requests issued by the parallel COPY methods.
+# Every worker holds its own connection to the SQL API.
+DEFAULT_PARALLEL_WORKERS = 4
+
+# Maximum number of compressed blocks waiting to be sent when the
+# compression of COPY FROM data is pipelined in a background thread
+DEFAULT_PIPELINE_DEPTH = 16
+
+# Size of the segments resumable COPY FROM loads split the source in. Each
+# segment is loaded in its own request and recorded in the checkpoint file
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Attempts to load a segment of a resumable COPY FROM before giving up,
+# with an exponential backoff starting at SEGMENT_RETRY_BACKOFF_SECONDS
+DEFAULT_SEGMENT_RETRIES = 3
+SEGMENT_RETRY_BACKOFF_SECONDS = 2
+
+# Maximum number of line-aligned blocks waiting to be sent per shard when
+# an iterable is fanned out to the parallel COPY workers
+PARALLEL_SHARD_QUEUE_SIZE = 8
+
+DEFAULT_PAGE_SIZE = 10000
+PAGINATED_QUERY = 'SELECT * FROM ({sql}\n) _page{where} ORDER BY {key} LIMIT {limit}'
+IDENTIFIER_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# Packed queries are wrapped in a subquery that aggregates their rows
+PACKED_QUERY = "(SELECT coalesce(json_agg(_q), '[]'::json) FROM ({sql}\n) _q) AS q{i}"
+
 BATCH_JOBS_PENDING_STATUSES = ['pending', 'running']
 BATCH_JOBS_DONE_STATUSES = ['done']
 BATCH_JOBS_FAILED_STATUSES = ['failed', 'canceled', 'unknown']
 BATCH_JOBS_FINISHED_STATUSES = BATCH_JOBS_DONE_STATUSES + BATCH_JOBS_FAILED_STATUSES
-BATCH_READ_STATUS_AFTER_SECONDS = 2
+
+# Job status is first read soon after creation, then less and less often
+BATCH_POLL_FIRST_DELAY = 0.25  # seconds
+BATCH_POLL_FACTOR = 2
+BATCH_POLL_MAX_DELAY = 15  # seconds
+BATCH_POLL_JITTER = 0.2
+
+
+class _CompressionPipeline(object):
+    """
+    Runs a chunk generator, typically reading and compressing COPY FROM
+    data, in a background thread that feeds a bounded queue of blocks.
+    zlib releases the GIL, so reading and compressing the next blocks
+    overlaps with sending the previous ones.
+    """
+    _done = object()
+
+    def __init__(self, chunk_generator, transform=None,
+                 depth=DEFAULT_PIPELINE_DEPTH):
+        """
+        :param chunk_generator: Generator of uncompressed data chunks
+        :param transform: Function turning a chunk generator into another
+                          one, such as CopySQLClient._compress_chunks
+        :param depth: Maximum number of blocks in the queue
+        :type chunk_generator: generator
+        :type transform: function
+        :type depth: int
+        """
+        self.chunk_generator = chunk_generator
+        self.transform = transform
+        self.blocks = queue.Queue(depth)
+        self.stopped = threading.Event()
+        self.error = None
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.block_count = 0
+        self.work_time = 0
+        self.producer_wait = 0
+        self.consumer_wait = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+    def _count(self, chunk_generator):
+        for chunk in chunk_generator:
+            self.bytes_in += len(chunk)
+            yield chunk
+
+    def _put(self, block):
+        started = time.time()
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.producer_wait += time.time() - started
+
+    def _produce(self):
+        try:
+            blocks = self._count(self.chunk_generator)
+            if self.transform is not None:
+                blocks = self.transform(blocks)
+            while not self.stopped.is_set():
+                started = time.time()
+                block = next(blocks, self._done)
+                self.work_time += time.time() - started
+                if block is self._done:
+                    break
+                if len(block) > 0:
+                    self._put(block)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(self._done)
+
+    def __iter__(self):
+        producer = threading.Thread(target=self._produce)
+        producer.daemon = True
+        producer.start()
+        try:
+            while True:
+                depth = self.blocks.qsize()
+                self.depth_total += depth
+                self.max_depth = max(self.max_depth, depth)
+
+                started = time.time()
+                block = self.blocks.get()
+                self.consumer_wait += time.time() - started
+                if block is self._done:
+                    break
+                self.block_count += 1
+                self.bytes_out += len(block)
+                yield block
+        finally:
+            self.stopped.set()
+            producer.join()
+
+        if self.error is not None:
+            raise CartoException(self.error)
+
+    def stats(self):
+        """
+        :return: Number of blocks and bytes read and sent, seconds spent
+                 reading and compressing, throughput of the compressor in
+                 bytes per second, seconds each side of the queue was
+                 blocked waiting for the other one and queue depths
+        :rtype: dict
+        """
+        return {
+            'blocks': self.block_count,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'compress_time': self.work_time,
+            'compress_throughput': self.bytes_in / self.work_time
+            if self.work_time > 0 else None,
+            'producer_wait': self.producer_wait,
+            'consumer_wait': self.consumer_wait,
+            'max_queue_depth': self.max_depth,
+            'mean_queue_depth': float(self.depth_total) / self.block_count
+            if self.block_count > 0 else 0
+        }
+
+
+class SQLRowIterator(object):
+    """
+    Rows of the result of a query, parsed as the response arrives
+
+    The fields, time and total_rows of the result come after the rows in
+    the response, so they are available once the rows have been consumed.
+    """
+    def __init__(self, response, row_type='dict', batch_size=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE * 8):
+        """
+        :param response: Streamed response of the SQL API
+        :param row_type: 'dict', 'tuple' or 'numpy'
+        :param batch_size: Number of rows in every batch, None to get the
+                           rows one by one
+        :param chunk_size: Size of the blocks read from the response
+        :type response: requests.models.Response
+        :type row_type: str
+        :type batch_size: int
+        :type chunk_size: int
+        """
+        if row_type not in ('dict', 'tuple', 'numpy'):
+            raise CartoException(_("Unknown row type: {row_type}").format(
+                row_type=row_type))
+        if row_type == 'numpy':
+            self.np = import_numpy()
+            batch_size = batch_size or DEFAULT_BATCH_ROWS
+
+        self.response = response
+        self.row_type = row_type
+        self.batch_size = batch_size
+        self.reader = JSONRowsReader(response.iter_content(chunk_size))
+        self.columns = None
+
+    @property
+    def fields(self):
+        return self.reader.metadata.get('fields')
+
+    @property
+    def time(self):
+        return self.reader.metadata.get('time')
+
+    @property
+    def total_rows(self):
+        return self.reader.metadata.get('total_rows')
+
+    def _rows(self):
+        rows = iter(self.reader)
+        first = next(rows, None)
+        if first is not None:
+            self.columns = list(first.keys())
+            rows = itertools.chain([first], rows)
+            if self.row_type != 'dict':
+                rows = (tuple(row.values()) for row in rows)
+            for row in rows:
+                yield row
+
+        # Errors found while streaming are sent after the rows
+        if 'error' in self.reader.metadata:
+            raise CartoException(self.reader.metadata['error'])
+
+    def _record_batch(self, rows):
+        arrays = []
+        for values in zip(*rows):
+            array = self.np.array(values)
+            if array.dtype == object and all(
+                    value is None or (isinstance(value, (int, float)) and
+                                      not isinstance(value, bool))
+                    for value in values):
+                array = self.np.array([self.np.nan if value is None
+                                       else value for value in values],
+                                      dtype=float)
+            arrays.append(array)
+        if not arrays:
+            return self.np.rec.array([])
+        return self.np.rec.fromarrays(arrays, names=self.columns)
+
+    def __iter__(self):
+        try:
+            rows = self._rows()
+            if self.batch_size is None:
+                for row in rows:
+                    yield row
+                return
+
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    return
+                if self.row_type == 'numpy':
+                    yield self._record_batch(batch)
+                else:
+                    yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 class SQLClient(object):
     """
     Allows you to send requests to CARTO's SQL API
     """
-    def __init__(self, auth_client, api_version='v2'):
+    def __init__(self, auth_client, api_version='v2', cache=None,
+                 coalesce=False):
         """
         :param auth_client: Auth client to make authorized requests, such as
                             APIKeyAuthClient
         :param api_version: Current version is 'v2'. 'v1' can be used to avoid
                             caching, but it's not guaranteed to work
+        :param cache: Cache for the results of read-only queries, or True
+                      to keep them in memory with the default bounds
+        :param coalesce: Whether identical read-only queries sent at the
+                         same time from several threads share a single
+                         request, or the carto.cache.SingleFlight to use
         :type auth_client: :class:`carto.auth.APIKeyAuthClient`
         :type api_version: str
+        :type cache: :class:`carto.cache.QueryCache`
+        :type coalesce: bool or :class:`carto.cache.SingleFlight`
 
         :return:
         """
@@ -66,20 +361,45 @@ class SQLClient(object):
         self.username = getattr(self.auth_client, 'username', None)
         self.base_url = self.auth_client.base_url
 
-    def send(self, sql, parse_json=True, do_post=True, format=None, **request_args):
+        if cache is True:
+            cache = MemoryQueryCache()
+        self.cache = cache or None
+
+        if coalesce is True:
+            coalesce = SingleFlight()
+        self.single_flight = coalesce or None
+
+    def send(self, sql, parse_json=True, do_post=True, format=None,
+             cache_ttl=None, result='json', **request_args):
         """
         Executes SQL query in a CARTO server
 
+        When the client has a cache, results of SELECT and WITH queries are
+        taken from it while they are fresh. When it coalesces requests,
+        callers sending the same SELECT or WITH query while it is in flight
+        wait for it and get its result or exception. Any other statement
+        is always sent to the server.
+
         :param sql: The SQL
         :param parse_json: Set it to False if you want raw reponse
         :param do_post: Set it to True to force post request
         :param format: Any of the data export formats allowed by CARTO's
                         SQL API
+        :param cache_ttl: Seconds the result is kept in the cache. Defaults
+                          to the TTL of the cache, 0 skips the cache
+        :param result: 'json' to get the response as it is, 'columns' to
+                       get a dict of typed NumPy arrays by column or
+                       'dataframe' to get a pandas DataFrame. Columnar
+                       results are built as the response arrives, and are
+                       neither cached nor coalesced. They can be sent in
+                       the JSON format or, more compactly, in the CSV one
         :param request_args: Additional parameters to send with the request
         :type sql: str
         :type parse_json: boolean
         :type do_post: boolean
         :type format: str
+        :type cache_ttl: float
+        :type result: str
         :type request_args: dictionary
 
         :return: response data, either as json or as a regular
@@ -88,6 +408,10 @@ class SQLClient(object):
 
         :raise: CartoException
         """
+        if result != 'json':
+            return self._send_columnar(sql, result, do_post, format,
+                                       request_args)
+
         try:
             params = {'q': sql}
             if format:
@@ -99,37 +423,477 @@ class SQLClient(object):
                 for attr in request_args:
                     params[attr] = request_args[attr]
 
+            key = None
+            if (self.cache is not None or self.single_flight is not None) \
+                    and is_read_only(sql):
+                key = QueryCache.make_key(sql, format, request_args,
+                                          self.api_key, self.base_url)
+            use_cache = key is not None and self.cache is not None and \
+                cache_ttl != 0
+
+            if use_cache:
+                content = self.cache.get(key)
+                if content is not None:
+                    return self._parse_content(content, parse_json)
+
+            if key is None:
+                resp = self._request(sql, params, do_post)
+                return self.auth_client.get_response_data(resp, parse_json)
+
+            def fetch():
+                resp = self._request(sql, params, do_post)
+                content = self.auth_client.get_response_data(resp, False)
+                if use_cache and content is not None:
+                    self.cache.set(key, content, cache_ttl)
+                return content
+
+            if self.single_flight is not None:
+                content = self.single_flight.do(key, fetch)
+            else:
+                content = fetch()
+            # Every caller gets its own copy of coalesced results
+            return self._parse_content(content, parse_json)
+        except CartoRateLimitException as e:
+            raise e
+        except Exception as e:
+            raise CartoException(e)
+
+    def iter_rows(self, sql, batch_size=None, row_type='dict',
+                  do_post=True, chunk_size=DEFAULT_CHUNK_SIZE * 8,
+                  **request_args):
+        """
+        Executes SQL query in a CARTO server and parses its rows as they
+        arrive
+
+        Memory usage doesn't depend on the size of the result, the whole
+        response is never kept in memory. Results are neither cached nor
+        coalesced.
+
+        :param sql: The SQL
+        :param batch_size: Number of rows in every batch, None to get the
+                           rows one by one. Defaults to DEFAULT_BATCH_ROWS
+                           for the 'numpy' row type
+        :param row_type: 'dict' to get rows as dicts, 'tuple' to get them as
+                         tuples in the order of the columns of the query or
+                         'numpy' to get batches as NumPy record arrays
+        :param do_post: Set it to True to force post request
+        :param chunk_size: Size of the blocks read from the response
+        :param request_args: Additional parameters to send with the request
+        :type sql: str
+        :type batch_size: int
+        :type row_type: str
+        :type do_post: boolean
+        :type chunk_size: int
+        :type request_args: dictionary
+
+        :return: Iterator of the rows or batches, with the fields, time and
+                 total_rows of the result as attributes. The name of the
+                 columns is available in columns once the first row is
+                 parsed
+        :rtype: :class:`carto.sql.SQLRowIterator`
+
+        :raise: CartoException
+        """
+        params = {'q': sql}
+        params.update(request_args)
+
+        try:
             if len(sql) < MAX_GET_QUERY_LEN and do_post is False:
-                resp = self.auth_client.send(self.api_url,
-                                             'GET',
-                                             params=params)
+                resp = self.auth_client.send(self.api_url, 'GET',
+                                             params=params, stream=True)
             else:
-                resp = self.auth_client.send(self.api_url, 'POST', data=params)
+                resp = self.auth_client.send(self.api_url, 'POST',
+                                             data=params, stream=True)
+            if resp.status_code >= 400:
+                self.auth_client.get_response_data(resp)
+        except CartoRateLimitException as e:
+            raise e
+        except Exception as e:
+            raise CartoException(e)
+
+        return SQLRowIterator(resp, row_type, batch_size, chunk_size)
+
+    @staticmethod
+    def _sql_literal(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (int, float)):
+            return repr(value)
+        return "'{value}'".format(value=str(value).replace("'", "''"))
+
+    def paginate(self, sql, key='cartodb_id', page_size=DEFAULT_PAGE_SIZE,
+                 prefetch=True, **send_args):
+        """
+        Executes a query in pages of rows, so that every request is short
+        no matter the size of the result
 
-            return self.auth_client.get_response_data(resp, parse_json)
+        The query is wrapped in keyset-paginated queries:
+        "SELECT * FROM (sql) WHERE key > last key ORDER BY key LIMIT
+        page_size". The key must be unique and is better indexed.
+
+        Every page costs the same, unlike with OFFSET, only if PostgreSQL
+        can push the key condition down into the query, which happens when
+        it is a plain SELECT of a table, with or without a WHERE clause.
+        Queries with ORDER BY, LIMIT, DISTINCT, GROUP BY, aggregates or
+        window functions are run in full for every page, so they are
+        better materialized into a table first.
+
+        :param sql: The SQL
+        :param key: Column to paginate by
+        :param page_size: Number of rows in every page
+        :param prefetch: Whether to request the next page while the current
+                         one is being consumed
+        :param send_args: Parameters for send
+        :type sql: str
+        :type key: str
+        :type page_size: int
+        :type prefetch: bool
+        :type send_args: kwargs
+
+        :return: Iterator of the rows of every page
+        :rtype: iterator
+
+        :raise: CartoException
+        """
+        quoted_key = key if IDENTIFIER_RE.match(key) else \
+            '"{key}"'.format(key=key.replace('"', '""'))
+        sql = sql.strip().rstrip(';')
+
+        def fetch(last):
+            where = '' if last is None else ' WHERE {key} > {last}'.format(
+                key=quoted_key, last=self._sql_literal(last))
+            page = self.send(PAGINATED_QUERY.format(sql=sql, where=where,
+                                                    key=quoted_key,
+                                                    limit=page_size),
+                             **send_args)
+            return page['rows']
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            rows = fetch(None)
+            while rows:
+                if len(rows) < page_size:
+                    yield rows
+                    return
+                try:
+                    last = rows[-1][key]
+                except KeyError:
+                    raise CartoException(_("The query doesn't return the "
+                                           "key column {key}").format(
+                        key=key))
+
+                if prefetch:
+                    future = executor.submit(fetch, last)
+                    yield rows
+                    rows = future.result()
+                else:
+                    yield rows
+                    rows = fetch(last)
+
+    def _send_captured(self, sql, send_args):
+        try:
+            return self.send(sql, **send_args)
+        except CartoException as e:
+            return e
+
+    def _send_packed(self, pack, send_args):
+        packed_sql = 'SELECT ' + ', '.join(
+            PACKED_QUERY.format(sql=sql.strip().rstrip(';'), i=i)
+            for i, (index, sql) in enumerate(pack))
+        try:
+            response = self.send(packed_sql, **send_args)
+        except CartoException:
+            # Find out which queries failed
+            return [(index, self._send_captured(sql, send_args))
+                    for index, sql in pack]
+
+        row = response['rows'][0]
+        results = []
+        for i, (index, sql) in enumerate(pack):
+            rows = row['q{i}'.format(i=i)]
+            results.append((index, {'rows': rows,
+                                    'total_rows': len(rows),
+                                    'time': response.get('time'),
+                                    'packed': True}))
+        return results
+
+    def _pack_queries(self, queries, pack_bytes):
+        pack = []
+        size = 0
+        for index, sql in enumerate(queries):
+            if not pack_bytes or not is_read_only(sql):
+                if pack:
+                    yield pack
+                    pack, size = [], 0
+                yield [(index, sql)]
+                continue
+
+            query_size = len(sql) + len(PACKED_QUERY)
+            if pack and size + query_size > pack_bytes:
+                yield pack
+                pack, size = [], 0
+            pack.append((index, sql))
+            size += query_size
+        if pack:
+            yield pack
+
+    def send_many(self, queries, concurrency=DEFAULT_PARALLEL_WORKERS,
+                  ordered=True, pack_bytes=None, **send_args):
+        """
+        Executes many independent queries concurrently
+
+        Queries are taken from the iterable as results are consumed, so
+        that no more than a few of them per worker are pending at any
+        time. Errors don't abort the rest of the queries, they are
+        returned in place of the result of the failed query.
+
+        With pack_bytes, consecutive read-only queries are sent together in
+        a single request, as long as their SQL fits in that budget. The
+        rows of every packed query are aggregated with json_agg, so they
+        are returned as JSON values (geometries as GeoJSON) and with no
+        fields metadata. If a pack fails, its queries are sent one by one
+        to find out which of them failed.
+
+        :param queries: The SQL queries
+        :param concurrency: Number of queries sent at the same time
+        :param ordered: Whether to return the results in the order of the
+                        queries. Otherwise they are returned as they are
+                        ready, along with the position of their query
+        :param pack_bytes: Maximum size of the SQL of packed queries, None
+                           to send every query in its own request
+        :param send_args: Parameters for send
+        :type queries: iterable
+        :type concurrency: int
+        :type ordered: bool
+        :type pack_bytes: int
+        :type send_args: kwargs
+
+        :return: Iterator of the results, or exceptions, of the queries,
+                 or of (position, result) tuples if not ordered
+        :rtype: iterator
+        """
+        if send_args.get('format') not in (None, 'json') or \
+                send_args.get('parse_json') is False:
+            pack_bytes = None
+
+        def run(pack):
+            if len(pack) == 1:
+                index, sql = pack[0]
+                return [(index, self._send_captured(sql, send_args))]
+            return self._send_packed(pack, send_args)
+
+        packs = self._pack_queries(queries, pack_bytes)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = deque()
+
+            def submit():
+                for pack in packs:
+                    futures.append(executor.submit(run, pack))
+                    return True
+                return False
+
+            for i in range(2 * concurrency):
+                if not submit():
+                    break
+
+            while futures:
+                if ordered:
+                    future = futures.popleft()
+                else:
+                    future = wait(futures,
+                                  return_when=FIRST_COMPLETED)[0].pop()
+                    futures.remove(future)
+                submit()
+                for index, result in future.result():
+                    yield result if ordered else (index, result)
+
+    def _send_columnar(self, sql, result, do_post, format, request_args):
+        if result not in ('columns', 'dataframe'):
+            raise CartoException(_("Unknown result type: {result}").format(
+                result=result))
+        if format == 'csv':
+            columns = self._send_columnar_csv(sql, do_post, request_args)
+        elif format in (None, 'json'):
+            columns = self._send_columnar_json(sql, do_post, request_args)
+        else:
+            raise CartoException(_("Columnar results need the JSON or CSV "
+                                   "format"))
+
+        if result == 'dataframe':
+            return columns_to_dataframe(columns)
+        return columns
+
+    def _send_columnar_json(self, sql, do_post, request_args):
+        # Values are kept by column, rows are never built as dicts
+        rows = self.iter_rows(sql, batch_size=DEFAULT_BATCH_ROWS,
+                              row_type='tuple', do_post=do_post,
+                              **request_args)
+        values = None
+        for batch in rows:
+            if values is None:
+                values = [[] for i in range(len(batch[0]))]
+            for column, column_values in zip(values, zip(*batch)):
+                column.extend(column_values)
+
+        fields = rows.fields or {}
+        names = rows.columns or list(fields.keys())
+        if values is None:
+            values = [[] for name in names]
+        return build_columns(names, values, fields)
+
+    def _get_fields(self, sql, do_post=True):
+        # Fields of an empty result of the query. The SQL API sends them in
+        # the order of the columns, which is kept
+        content = self.send('SELECT * FROM ({sql}\n) _q LIMIT 0'.format(
+            sql=sql.strip().rstrip(';')), parse_json=False, do_post=do_post)
+        return json.loads(content.decode('utf-8'),
+                          object_pairs_hook=OrderedDict)['fields']
+
+    def _send_columnar_csv(self, sql, do_post, request_args):
+        # CSV carries no types, they are taken from an empty JSON result of
+        # the same query, that is then wrapped so that every value can be
+        # parsed without guessing
+        fields = self._get_fields(sql, do_post)
+        wrapped_sql, columns = csv_query(sql, fields)
+        params = {'q': wrapped_sql, 'format': 'csv'}
+        params.update(request_args)
+
+        try:
+            resp = self._request(wrapped_sql, params, do_post, stream=True,
+                                 headers={'Accept-Encoding': 'gzip'})
+            if resp.status_code >= 400:
+                self.auth_client.get_response_data(resp)
+
+            try:
+                text = io.TextIOWrapper(
+                    io.BufferedReader(ResponseStream(resp,
+                                                     DEFAULT_CHUNK_SIZE * 8)),
+                    encoding='utf-8', newline='')
+                reader = csv.reader(text)
+                names = next(reader, None) or columns
+                values = [[] for name in names]
+                while True:
+                    batch = list(itertools.islice(reader, DEFAULT_BATCH_ROWS))
+                    if not batch:
+                        break
+                    for column, column_values in zip(values, zip(*batch)):
+                        column.extend(column_values)
+            finally:
+                resp.close()
         except CartoRateLimitException as e:
             raise e
         except Exception as e:
             raise CartoException(e)
 
+        return build_csv_columns(names, values, fields)
+
+    def _request(self, sql, params, do_post, **request_args):
+        if len(sql) < MAX_GET_QUERY_LEN and do_post is False:
+            return self.auth_client.send(self.api_url, 'GET', params=params,
+                                         **request_args)
+        return self.auth_client.send(self.api_url, 'POST', data=params,
+                                     **request_args)
+
+    def _parse_content(self, content, parse_json):
+        if content is None or not parse_json:
+            return content
+        return json.loads(content.decode('utf-8'))
+
+    def cache_stats(self):
+        """
+        Gets the stats of the cache of the client
+
+        :return: The stats of carto.cache.QueryCache.stats, or None if the
+                 client has no cache
+        :rtype: dict
+        """
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def coalesce_stats(self):
+        """
+        Gets the stats of the request coalescing of the client
+
+        :return: The stats of carto.cache.SingleFlight.stats, or None if
+                 the client doesn't coalesce requests
+        :rtype: dict
+        """
+        if self.single_flight is None:
+            return None
+        return self.single_flight.stats()
+
+
+class BatchPollStrategy(object):
+    """
+    Delays between reads of the status of a Batch SQL job while it runs
+
+    The first read is done soon after the job is created, so that short
+    jobs are not kept waiting, and then the delay grows exponentially up to
+    a maximum, so that long jobs are not read every few seconds. Delays are
+    randomized, so that jobs created at the same time are not read at the
+    same time.
+    """
+    def __init__(self, first_delay=BATCH_POLL_FIRST_DELAY,
+                 factor=BATCH_POLL_FACTOR, max_delay=BATCH_POLL_MAX_DELAY,
+                 jitter=BATCH_POLL_JITTER, timeout=None):
+        """
+        :param first_delay: Seconds before the first read
+        :param factor: Growth of the delay after every read
+        :param max_delay: Maximum seconds between reads
+        :param jitter: Fraction of every delay that is randomized
+        :param timeout: Seconds to wait for the job to finish at most, None
+                        to wait forever
+        :type first_delay: float
+        :type factor: float
+        :type max_delay: float
+        :type jitter: float
+        :type timeout: float
+
+        :return:
+        """
+        self.first_delay = first_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def delays(self):
+        """
+        Gets the delays before every read of the status of a job
+
+        :return: Infinite iterator of delays, in seconds
+        :rtype: iterator
+        """
+        delay = self.first_delay
+        while True:
+            yield min(self.max_delay,
+                      delay * random.uniform(1 - self.jitter,
+                                             1 + self.jitter))
+            delay = min(self.max_delay, delay * self.factor)
+
 
 class BatchSQLClient(object):
     """
     Allows you to send requests to CARTO's Batch SQL API
     """
-    def __init__(self, client, api_version='v2'):
+    def __init__(self, client, api_version='v2', poll_strategy=None):
         """
         :param client: Auth client to make authorized requests, such as
                         APIKeyAuthClient
         :param api_version: Current version is 'v2'. 'v1' can be used to avoid
                             caching, but it's not guaranteed to work
+        :param poll_strategy: How to wait for jobs to finish. Defaults to
+                              a BatchPollStrategy with the default delays
+                              and no timeout
         :type auth_client: :class:`carto.auth.APIKeyAuthClient`
         :type api_version: str
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
 
         :return:
         """
         self.client = client
         self.api_url = SQL_BATCH_API_URL.format(api_version=api_version)
+        self.poll_strategy = poll_strategy or BatchPollStrategy()
         self.api_key = self.client.api_key \
             if hasattr(self.client, "api_key") else None
 
@@ -202,7 +966,7 @@ class BatchSQLClient(object):
                          http_header=header)
         return data
 
-    def create_and_wait_for_completion(self, sql_query):
+    def create_and_wait_for_completion(self, sql_query, poll_strategy=None):
         """
         Creates a new batch SQL query and waits for its completion or failure
 
@@ -211,13 +975,21 @@ class BatchSQLClient(object):
         'failed', 'canceled', 'unknown'
 
         :param sql_query: The SQL query to be used
+        :param poll_strategy: How to wait for the job to finish. Defaults
+                              to the one of the client
         :type sql_query: str or list of str
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
 
         :return: Response data, either as json or as a regular response.content
-                    object
+                    object, with the number of reads of the job status and
+                    the seconds waited in poll_stats
         :rtype: object
 
-        :raise: CartoException when there's an exception in the BatchSQLJob execution or the batch job status is one of the BATCH_JOBS_FAILED_STATUSES ('failed', 'canceled', 'unknown')
+        :raise: CartoException when there's an exception in the BatchSQLJob
+                execution, the batch job status is one of the
+                BATCH_JOBS_FAILED_STATUSES ('failed', 'canceled', 'unknown')
+                or the job doesn't finish before the timeout of the poll
+                strategy
         """
         header = {'content-type': 'application/json'}
         data = self.send(self.api_url,
@@ -225,15 +997,165 @@ class BatchSQLClient(object):
                          json_body={"query": sql_query},
                          http_header=header)
 
+        return self._wait(data, poll_strategy)
+
+    def wait_for_completion(self, job_id, poll_strategy=None):
+        """
+        Waits for the completion or failure of a batch SQL job
+
+        :param job_id: The id of the job
+        :param poll_strategy: How to wait for the job to finish. Defaults
+                              to the one of the client
+        :type job_id: str
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+
+        :return: Response data, either as json or as a regular response.content
+                    object, with the number of reads of the job status and
+                    the seconds waited in poll_stats
+        :rtype: object
+
+        :raise: CartoException when there's an exception in the BatchSQLJob
+                execution, the batch job status is one of the
+                BATCH_JOBS_FAILED_STATUSES ('failed', 'canceled', 'unknown')
+                or the job doesn't finish before the timeout of the poll
+                strategy
+        """
+        return self._wait(self.read(job_id), poll_strategy)
+
+    def _wait(self, data, poll_strategy):
+        poll_strategy = poll_strategy or self.poll_strategy
+        start = time.time()
+        delays = poll_strategy.delays()
+        polls = 0
+
         while data and data['status'] in BATCH_JOBS_PENDING_STATUSES:
-            time.sleep(BATCH_READ_STATUS_AFTER_SECONDS)
+            delay = next(delays)
+            if poll_strategy.timeout is not None:
+                remaining = poll_strategy.timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise CartoException(_("Batch SQL job {job_id} not finished after {timeout} seconds").format(
+                        job_id=data['job_id'], timeout=poll_strategy.timeout))
+                delay = min(delay, remaining)
+            time.sleep(delay)
             data = self.read(data['job_id'])
+            polls += 1
+
+        data['poll_stats'] = {'polls': polls,
+                              'wait_time': time.time() - start}
 
         if data['status'] in BATCH_JOBS_FAILED_STATUSES:
             raise CartoException(_("Batch SQL job failed with result: {data}".format(data=data)))
 
         return data
 
+    def as_completed(self, job_ids, concurrency=DEFAULT_PARALLEL_WORKERS,
+                     poll_strategy=None):
+        """
+        Waits for many batch SQL jobs at the same time, returning every job
+        as soon as it finishes
+
+        A single scheduler reads the status of all the jobs, the one that is
+        due the soonest first, with no more than concurrency reads at the
+        same time. Every job is read with the delays of the poll strategy,
+        so long jobs are read less and less often and the number of
+        requests grows with the number of running jobs, not with the time
+        they take.
+
+        :param job_ids: The ids of the jobs
+        :param concurrency: Number of reads sent at the same time
+        :param poll_strategy: How to wait for the jobs to finish. Defaults
+                              to the one of the client. Its timeout applies
+                              to all the jobs
+        :type job_ids: iterable
+        :type concurrency: int
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+
+        :return: Iterator of the data of the jobs as they finish, failed
+                 or not, with their number of reads and the seconds waited
+                 in poll_stats
+        :rtype: iterator
+
+        :raise: CartoException when there's an exception reading the status
+                of a job or some jobs don't finish before the timeout of
+                the poll strategy
+        """
+        poll_strategy = poll_strategy or self.poll_strategy
+        start = time.time()
+        # Jobs due to be read: (due time, position, job id, delays, reads)
+        due = [(start, i, job_id, poll_strategy.delays(), 0)
+               for i, job_id in enumerate(job_ids)]
+        heapq.heapify(due)
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while due or pending:
+                now = time.time()
+                if poll_strategy.timeout is not None and \
+                        now - start >= poll_strategy.timeout:
+                    unfinished = sorted([job[2] for job in due] +
+                                        [job[1] for job in pending.values()])
+                    raise CartoException(_("Batch SQL jobs {job_ids} not finished after {timeout} seconds").format(
+                        job_ids=', '.join(unfinished),
+                        timeout=poll_strategy.timeout))
+
+                while due and due[0][0] <= now and \
+                        len(pending) < concurrency:
+                    next_read, i, job_id, delays, reads = heapq.heappop(due)
+                    future = executor.submit(self.read, job_id)
+                    pending[future] = (i, job_id, delays, reads + 1)
+
+                wait_time = None
+                if due and len(pending) < concurrency:
+                    wait_time = max(0, due[0][0] - now)
+                if poll_strategy.timeout is not None:
+                    remaining = max(0, start + poll_strategy.timeout - now)
+                    wait_time = remaining if wait_time is None \
+                        else min(wait_time, remaining)
+                if not pending:
+                    time.sleep(wait_time)
+                    continue
+
+                done, not_done = wait(pending, timeout=wait_time,
+                                      return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, job_id, delays, reads = pending.pop(future)
+                    data = future.result()
+                    if data['status'] in BATCH_JOBS_PENDING_STATUSES:
+                        heapq.heappush(due, (time.time() + next(delays), i,
+                                             job_id, delays, reads))
+                        continue
+                    data['poll_stats'] = {'polls': reads,
+                                          'wait_time': time.time() - start}
+                    yield data
+
+    def wait_all(self, job_ids, concurrency=DEFAULT_PARALLEL_WORKERS,
+                 poll_strategy=None):
+        """
+        Waits for many batch SQL jobs at the same time, see as_completed
+
+        :param job_ids: The ids of the jobs
+        :param concurrency: Number of reads sent at the same time
+        :param poll_strategy: How to wait for the jobs to finish. Defaults
+                              to the one of the client. Its timeout applies
+                              to all the jobs
+        :type job_ids: list
+        :type concurrency: int
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+
+        :return: The data of the jobs, failed or not, in the order of
+                 job_ids
+        :rtype: list
+
+        :raise: CartoException when there's an exception reading the status
+                of a job or some jobs don't finish before the timeout of
+                the poll strategy
+        """
+        job_ids = list(job_ids)
+        jobs = {}
+        for data in self.as_completed(job_ids, concurrency, poll_strategy):
+            jobs[data['job_id']] = data
+        return [jobs[job_id] for job_id in job_ids]
+
     def read(self, job_id):
         """
         Reads the information for a specific Batch API request
@@ -295,6 +1217,252 @@ class BatchSQLClient(object):
         return confirmation['status']
 
 
+class _BatchJobNode(object):
+    def __init__(self, name, sql_query, depends_on):
+        self.name = name
+        self.sql_query = sql_query
+        self.depends_on = depends_on
+        self.status = 'waiting'
+        self.job_id = None
+        self.data = None
+        self.ready_at = None
+        self.submitted_at = None
+        self.finished_at = None
+        self.reads = 0
+
+
+class BatchJobGraph(object):
+    """
+    Runs a pipeline of Batch SQL jobs that depend on each other
+
+    Jobs are created as soon as all the jobs they depend on are done, with
+    no more than a given number of jobs running at the same time. When a
+    job fails, the jobs that depend on it, directly or not, are skipped.
+    The rest of the jobs keep running, unless the graph fails fast.
+    """
+    def __init__(self, client, concurrency=DEFAULT_PARALLEL_WORKERS,
+                 poll_strategy=None, fail_fast=False):
+        """
+        :param client: Client to create, read and cancel the jobs
+        :param concurrency: Number of jobs running at the same time
+        :param poll_strategy: How to wait for the jobs to finish. Defaults
+                              to the one of the client. Its timeout applies
+                              to the whole graph
+        :param fail_fast: Whether to cancel every running job and skip the
+                          rest when a job fails
+        :type client: :class:`carto.sql.BatchSQLClient`
+        :type concurrency: int
+        :type poll_strategy: :class:`carto.sql.BatchPollStrategy`
+        :type fail_fast: bool
+
+        :return:
+        """
+        self.client = client
+        self.concurrency = concurrency
+        self.poll_strategy = poll_strategy or client.poll_strategy
+        self.fail_fast = fail_fast
+        self.nodes = OrderedDict()
+        self.started_at = None
+        self.finished_at = None
+
+    def add_job(self, name, sql_query, depends_on=None):
+        """
+        Adds a job to the graph
+
+        Jobs can only depend on jobs already added, so the graph can't
+        have cycles.
+
+        :param name: Unique name of the job in the graph
+        :param sql_query: The SQL query of the job. A list of queries is
+                          run by the Batch SQL API as a single job, one
+                          query after another
+        :param depends_on: Names of the jobs that must be done before this
+                           one is created
+        :type name: str
+        :type sql_query: str or list of str
+        :type depends_on: list
+
+        :return:
+
+        :raise: CartoException
+        """
+        if name in self.nodes:
+            raise CartoException(_("Duplicated job in the graph: {name}").format(
+                name=name))
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self.nodes:
+                raise CartoException(_("Unknown job in the graph: {name}").format(
+                    name=dependency))
+        self.nodes[name] = _BatchJobNode(name, sql_query, depends_on)
+
+    def run(self):
+        """
+        Runs the jobs of the graph and waits for all of them to finish
+
+        Running jobs are canceled if the run is interrupted, for instance by
+        the timeout of the poll strategy.
+
+        :return: The data of every job by name
+        :rtype: dict
+
+        :raise: CartoException when there's an exception in a request, some
+                job fails or is skipped, or the jobs don't finish before the
+                timeout of the poll strategy
+        """
+        self.started_at = time.time()
+        # Running jobs due to be read: (due time, position, node, delays)
+        due = []
+        positions = dict((name, i) for i, name in enumerate(self.nodes))
+
+        try:
+            while True:
+                self._skip_unreachable()
+                for node in self._ready_nodes():
+                    if len(due) >= self.concurrency:
+                        break
+                    data = self.client.create(node.sql_query)
+                    node.job_id = data['job_id']
+                    node.data = data
+                    node.submitted_at = time.time()
+                    node.status = data['status']
+                    delays = self.poll_strategy.delays()
+                    heapq.heappush(due, (node.submitted_at + next(delays),
+                                         positions[node.name], node, delays))
+
+                if not due:
+                    break
+
+                timeout = self.poll_strategy.timeout
+                now = time.time()
+                if timeout is not None and \
+                        now - self.started_at >= timeout:
+                    raise CartoException(_("Batch SQL job graph not finished after {timeout} seconds").format(
+                        timeout=timeout))
+                next_read = due[0][0]
+                if timeout is not None:
+                    next_read = min(next_read, self.started_at + timeout)
+                if next_read > now:
+                    time.sleep(next_read - now)
+                    continue
+
+                next_read, position, node, delays = heapq.heappop(due)
+                node.data = self.client.read(node.job_id)
+                node.reads += 1
+                node.status = node.data['status']
+                if node.status in BATCH_JOBS_PENDING_STATUSES:
+                    heapq.heappush(due, (time.time() + next(delays),
+                                         position, node, delays))
+                    continue
+
+                node.finished_at = time.time()
+                if node.status in BATCH_JOBS_FAILED_STATUSES and \
+                        self.fail_fast:
+                    self._cancel(self._running_nodes())
+                    due = []
+        except BaseException:
+            self._cancel(self._running_nodes())
+            raise
+        finally:
+            self.finished_at = time.time()
+
+        failed = [node.name for node in self.nodes.values()
+                  if node.status not in BATCH_JOBS_DONE_STATUSES]
+        if failed:
+            raise CartoException(_("Batch SQL jobs not done: {names}").format(
+                names=', '.join(failed)))
+
+        return dict((node.name, node.data) for node in self.nodes.values())
+
+    def _skip_unreachable(self):
+        # Dependencies come first, so a single pass skips every job
+        # depending on a failed one, directly or not
+        failed = self.fail_fast and any(
+            node.status in BATCH_JOBS_FAILED_STATUSES
+            for node in self.nodes.values())
+        for node in self.nodes.values():
+            if node.status != 'waiting':
+                continue
+            if failed or any(self.nodes[name].status in
+                             BATCH_JOBS_FAILED_STATUSES + ['skipped']
+                             for name in node.depends_on):
+                node.status = 'skipped'
+
+    def _running_nodes(self):
+        return [node for node in self.nodes.values()
+                if node.job_id is not None and
+                node.status in BATCH_JOBS_PENDING_STATUSES]
+
+    def _ready_nodes(self):
+        for node in self.nodes.values():
+            if node.status != 'waiting':
+                continue
+            dependencies = [self.nodes[name] for name in node.depends_on]
+            if all(dependency.status in BATCH_JOBS_DONE_STATUSES
+                   for dependency in dependencies):
+                if node.ready_at is None:
+                    node.ready_at = max([dependency.finished_at
+                                         for dependency in dependencies] or
+                                        [self.started_at])
+                yield node
+
+    def _cancel(self, nodes):
+        for node in nodes:
+            try:
+                self.client.cancel(node.job_id)
+            except CartoException:
+                pass
+            node.status = 'canceled'
+            node.finished_at = time.time()
+
+    def report(self):
+        """
+        Gets the timing of the last run of the graph
+
+        The critical path is the chain of jobs that determined the duration
+        of the run: it ends with the last job to finish, and goes back
+        through the dependency of every job that finished last. For every
+        job, queued is the time it was ready but waiting for a free slot,
+        and running the time from its creation to its end, including the
+        time in the queue of the Batch SQL API.
+
+        :return: Seconds of the whole run, the critical path from its first
+                 job, and the timing and status of every job by name
+        :rtype: dict
+        """
+        jobs = OrderedDict()
+        for node in self.nodes.values():
+            jobs[node.name] = {
+                'job_id': node.job_id,
+                'status': node.status,
+                'reads': node.reads,
+                'queued': node.submitted_at - node.ready_at
+                if node.submitted_at is not None else None,
+                'running': node.finished_at - node.submitted_at
+                if node.finished_at is not None and
+                node.submitted_at is not None else None
+            }
+
+        critical_path = []
+        finished = [node for node in self.nodes.values()
+                    if node.finished_at is not None and
+                    node.submitted_at is not None]
+        node = max(finished, key=lambda node: node.finished_at) \
+            if finished else None
+        while node is not None:
+            critical_path.insert(0, node.name)
+            dependencies = [self.nodes[name] for name in node.depends_on]
+            node = max(dependencies, key=lambda node: node.finished_at) \
+                if dependencies else None
+
+        elapsed = None
+        if self.started_at is not None and self.finished_at is not None:
+            elapsed = self.finished_at - self.started_at
+        return {'elapsed': elapsed,
+                'critical_path': critical_path,
+                'jobs': jobs}
+
+
 class CopySQLClient(object):
     """
     Allows to use the PostgreSQL COPY command for efficient streaming
@@ -316,14 +1484,105 @@ class CopySQLClient(object):
         self.api_url = SQL_API_URL.format(api_version=api_version)
         self.api_key = self.client.api_key \
             if hasattr(self.client, "api_key") else None
+        self.sql_client = SQLClient(client, api_version)
 
-    def _read_in_chunks(self, file_object, chunk_size=DEFAULT_CHUNK_SIZE):
-        while True:
-            data = file_object.read(chunk_size)
+    def _read_in_chunks(self, file_object, chunk_size=DEFAULT_CHUNK_SIZE,
+                        size=None):
+        while size is None or size > 0:
+            data = file_object.read(chunk_size if size is None
+                                    else min(chunk_size, size))
             if not data:
                 break
+            if size is not None:
+                size -= len(data)
             yield data
 
+    def _read_file_range(self, path, start, end, abort, header=None):
+        if header:
+            yield header
+        with open(path, 'rb') as f:
+            f.seek(start)
+            for chunk in self._read_in_chunks(f, size=end - start):
+                if abort.is_set():
+                    # Breaks the chunked upload so the server rolls it back
+                    raise CartoException(_("Parallel COPY aborted"))
+                yield chunk
+        if abort.is_set():
+            raise CartoException(_("Parallel COPY aborted"))
+
+    def _line_aligned_ranges(self, file_object, start, end, parts):
+        # Splits [start, end) into byte ranges of similar size that always
+        # begin right after a newline character
+        boundaries = [start]
+        for i in range(1, parts):
+            offset = start + (end - start) * i // parts
+            if offset <= boundaries[-1]:
+                continue
+            file_object.seek(offset - 1)
+            file_object.readline()
+            boundaries.append(min(file_object.tell(), end))
+        boundaries.append(end)
+        return [(a, b) for a, b in zip(boundaries, boundaries[1:]) if b > a]
+
+    def _split_lines(self, chunk_generator):
+        # Re-chunks arbitrary byte blocks so that every block ends on a
+        # line boundary
+        pending = b''
+        for chunk in chunk_generator:
+            pending += bytes(chunk)
+            cut = pending.rfind(b'\n') + 1
+            if cut:
+                yield pending[:cut]
+                pending = pending[cut:]
+        if pending:
+            yield pending
+
+    def _shard_generator(self, shard_queue, abort):
+        while True:
+            block = shard_queue.get()
+            if abort.is_set():
+                raise CartoException(_("Parallel COPY aborted"))
+            if block is None:
+                break
+            yield block
+
+    def _fan_out(self, blocks, shard_queues, abort, errors, header=None):
+        try:
+            if header:
+                for shard_queue in shard_queues:
+                    shard_queue.put(header)
+            for i, block in enumerate(blocks):
+                shard_queue = shard_queues[i % len(shard_queues)]
+                while not abort.is_set():
+                    try:
+                        shard_queue.put(block, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if abort.is_set():
+                    break
+        except Exception as e:
+            errors.append(e)
+            abort.set()
+        finally:
+            for shard_queue in shard_queues:
+                while True:
+                    if abort.is_set():
+                        # Nobody is going to send the pending blocks
+                        self._drain(shard_queue)
+                    try:
+                        shard_queue.put(None, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+    def _drain(self, shard_queue):
+        while True:
+            try:
+                shard_queue.get_nowait()
+            except queue.Empty:
+                break
+
     def _compress_chunks(self, chunk_generator, compression_level):
         zlib_mode = 16 + zlib.MAX_WBITS
         compressor = zlib.compressobj(compression_level,
@@ -336,7 +1595,8 @@ class CopySQLClient(object):
         yield compressor.flush()
 
     def copyfrom(self, query, iterable_data, compress=True,
-                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+                 compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 pipeline=False, pipeline_depth=DEFAULT_PIPELINE_DEPTH):
         """
         Gets data from an iterable object into a table
 
@@ -348,6 +1608,16 @@ class CopySQLClient(object):
                               to retrieve the data
         :type iterable_data: object
 
+        :param pipeline: Whether to read and compress the data in a
+                         background thread, so that it overlaps with
+                         sending it. The stats of the pipeline are
+                         returned under the 'pipeline' key
+        :type pipeline: bool
+
+        :param pipeline_depth: Maximum number of blocks waiting to be sent
+                               when the pipeline is enabled
+        :type pipeline_depth: int
+
         :return: Response data as json
         :rtype: str
 
@@ -360,10 +1630,17 @@ class CopySQLClient(object):
         }
         params = {'api_key': self.api_key, 'q': query}
 
+        transform = None
         if compress:
             headers['Content-Encoding'] = 'gzip'
-            _iterable_data = self._compress_chunks(iterable_data,
-                                                   compression_level)
+            transform = functools.partial(self._compress_chunks,
+                                          compression_level=compression_level)
+
+        if pipeline:
+            _iterable_data = _CompressionPipeline(iterable_data, transform,
+                                                  pipeline_depth)
+        elif transform is not None:
+            _iterable_data = transform(iterable_data)
         else:
             _iterable_data = iterable_data
 
@@ -380,10 +1657,15 @@ class CopySQLClient(object):
         except Exception as e:
             raise CartoException(e)
 
+        if pipeline:
+            response_json['pipeline'] = _iterable_data.stats()
+
         return response_json
 
     def copyfrom_file_object(self, query, file_object, compress=True,
-                             compression_level=DEFAULT_COMPRESSION_LEVEL):
+                             compression_level=DEFAULT_COMPRESSION_LEVEL,
+                             pipeline=False,
+                             pipeline_depth=DEFAULT_PIPELINE_DEPTH):
         """
         Gets data from a readable file object into a table
 
@@ -402,10 +1684,12 @@ class CopySQLClient(object):
         """
         chunk_generator = self._read_in_chunks(file_object)
         return self.copyfrom(query, chunk_generator, compress,
-                             compression_level)
+                             compression_level, pipeline, pipeline_depth)
 
     def copyfrom_file_path(self, query, path, compress=True,
-                           compression_level=DEFAULT_COMPRESSION_LEVEL):
+                           compression_level=DEFAULT_COMPRESSION_LEVEL,
+                           pipeline=False,
+                           pipeline_depth=DEFAULT_PIPELINE_DEPTH):
         """
         Gets data from a readable file into a table
 
@@ -423,9 +1707,505 @@ class CopySQLClient(object):
         """
         with open(path, 'rb') as f:
             result = self.copyfrom_file_object(query, f, compress,
-                                               compression_level)
+                                               compression_level, pipeline,
+                                               pipeline_depth)
         return result
 
+    def copyfrom_parallel(self, query, source,
+                          workers=DEFAULT_PARALLEL_WORKERS, header=False,
+                          compress=True,
+                          compression_level=DEFAULT_COMPRESSION_LEVEL,
+                          pipeline=False,
+                          pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """
+        Gets data into a table through several concurrent COPY FROM
+        requests, each one of them streaming a line-aligned shard of the
+        source
+
+        Every shard is loaded in its own transaction. If one of them fails
+        the shards still in progress are aborted, but those already
+        finished remain committed. Rows are split on newline characters,
+        so quoted values spanning several lines are not supported.
+
+        :param query: The "COPY table_name [(column_name[, ...])]
+                           FROM STDIN [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param source: A path to a file, a readable file-like object or
+                       an object that can be iterated to retrieve the data
+        :type source: str, file or object
+
+        :param workers: Number of concurrent COPY requests
+        :type workers: int
+
+        :param header: Whether the first line of the source is a header.
+                       It is sent at the beginning of every shard, so the
+                       query should use the HEADER option
+        :type header: bool
+
+        :return: Total number of rows, wall time in seconds and the rows,
+                 server time and elapsed time of every shard
+        :rtype: dict
+
+        :raise CartoException:
+        """
+        abort = threading.Event()
+        errors = []
+        fan_out = None
+
+        if hasattr(source, 'startswith'):
+            with open(source, 'rb') as f:
+                head = f.readline() if header else None
+                start = f.tell()
+                end = os.fstat(f.fileno()).st_size
+                ranges = self._line_aligned_ranges(f, start, end, workers)
+            shards = [self._read_file_range(source, a, b, abort, head)
+                      for a, b in ranges]
+        else:
+            if hasattr(source, 'read'):
+                source = self._read_in_chunks(source)
+            blocks = self._split_lines(source)
+            head = None
+            if header:
+                first = next(blocks, b'')
+                cut = first.find(b'\n') + 1 or len(first)
+                head = first[:cut]
+                blocks = itertools.chain([first[cut:]] if first[cut:] else [],
+                                         blocks)
+            shard_queues = [queue.Queue(PARALLEL_SHARD_QUEUE_SIZE)
+                            for _ in range(workers)]
+            shards = [self._shard_generator(shard_queue, abort)
+                      for shard_queue in shard_queues]
+            fan_out = threading.Thread(target=self._fan_out,
+                                       args=(blocks, shard_queues, abort,
+                                             errors, head))
+            fan_out.daemon = True
+            fan_out.start()
+
+        def load(shard):
+            started = time.time()
+            try:
+                result = self.copyfrom(query, shard, compress,
+                                       compression_level, pipeline,
+                                       pipeline_depth)
+            except Exception as e:
+                if not abort.is_set():
+                    errors.append(e)
+                abort.set()
+                raise
+            return result, time.time() - started
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as executor:
+            futures = [executor.submit(load, shard) for shard in shards]
+        if fan_out is not None:
+            fan_out.join()
+        elapsed = time.time() - started
+
+        if errors:
+            if isinstance(errors[0], CartoException):
+                raise errors[0]
+            raise CartoException(errors[0])
+
+        shard_results = []
+        for i, future in enumerate(futures):
+            result, shard_elapsed = future.result()
+            shard_result = {'shard': i,
+                            'total_rows': result.get('total_rows', 0),
+                            'time': result.get('time'),
+                            'elapsed': shard_elapsed}
+            if pipeline:
+                shard_result['pipeline'] = result['pipeline']
+            shard_results.append(shard_result)
+
+        return {'total_rows': sum(shard['total_rows']
+                                  for shard in shard_results),
+                'time': elapsed,
+                'shards': shard_results}
+
+    def copyfrom_arrays(self, table, columns, pg_types=None, srid=None,
+                        block_rows=DEFAULT_BLOCK_ROWS, compress=True,
+                        compression_level=DEFAULT_COMPRESSION_LEVEL,
+                        pipeline=False,
+                        pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """
+        Gets columns of NumPy arrays into a table, encoded in the
+        PostgreSQL COPY binary format instead of CSV text
+
+        The binary format requires every value to be sent with the exact
+        type of the target column (e.g. int4 for an integer column), so
+        use pg_types when the type guessed from the array does not match.
+        Geometries are sent as WKB bytes or objects with a wkb attribute,
+        such as shapely geometries.
+
+        :param table: The target table
+        :type table: str
+
+        :param columns: List of (name, values) pairs, or an ordered dict
+                        from column name to values. Missing values can be
+                        given as (name, values, nulls), nulls being a
+                        boolean array. NaN and NaT are sent as NULL
+        :type columns: list or dict
+
+        :param pg_types: PostgreSQL type of some of the columns. One of
+                         bool, int2, int4, int8, float4, float8, date,
+                         timestamp, timestamptz, text, bytea or geometry
+        :type pg_types: dict
+
+        :param srid: SRID of the WKB geometries
+        :type srid: int
+
+        :param block_rows: Number of rows encoded at once
+        :type block_rows: int
+
+        :return: Response data as json
+        :rtype: str
+
+        :raise CartoException:
+        """
+        if hasattr(columns, 'items'):
+            columns = list(columns.items())
+        columns = [tuple(column) + (None,) * (3 - len(column))
+                   for column in columns]
+
+        query = 'COPY {table} ({columns}) FROM STDIN WITH ' \
+                '(FORMAT binary)'.format(
+                    table=table,
+                    columns=', '.join(column[0] for column in columns))
+        data = encode_columns(columns, pg_types, srid, block_rows)
+
+        return self.copyfrom(query, data, compress, compression_level,
+                             pipeline, pipeline_depth)
+
+    def copyfrom_dataframe(self, table, dataframe, columns=None,
+                           pg_types=None, srid=None,
+                           block_rows=DEFAULT_BLOCK_ROWS, compress=True,
+                           compression_level=DEFAULT_COMPRESSION_LEVEL,
+                           pipeline=False,
+                           pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """
+        Gets the columns of a pandas DataFrame into a table, encoded in the
+        PostgreSQL COPY binary format. See :func:`copyfrom_arrays`
+
+        :param table: The target table
+        :type table: str
+
+        :param dataframe: The data. Missing values are sent as NULL
+        :type dataframe: pandas.DataFrame
+
+        :param columns: Columns of the DataFrame to send, all by default
+        :type columns: list
+
+        :param pg_types: PostgreSQL type of some of the columns
+        :type pg_types: dict
+
+        :param srid: SRID of the WKB geometries
+        :type srid: int
+
+        :param block_rows: Number of rows encoded at once
+        :type block_rows: int
+
+        :return: Response data as json
+        :rtype: str
+
+        :raise CartoException:
+        """
+        arrays = []
+        for name in columns or dataframe.columns:
+            series = dataframe[name]
+            nulls = series.isna().to_numpy()
+            dtype = series.dtype
+            if getattr(dtype, 'tz', None) is not None:
+                # Timezone aware timestamps, sent as UTC
+                series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+                dtype = series.dtype
+            if hasattr(dtype, 'numpy_dtype') and nulls.any():
+                # Nullable extension types, such as Int64
+                values = series.to_numpy(dtype=dtype.numpy_dtype,
+                                         na_value=0)
+            else:
+                values = series.to_numpy()
+            arrays.append((name, values, nulls))
+
+        return self.copyfrom_arrays(table, arrays, pg_types, srid, block_rows,
+                                    compress, compression_level, pipeline,
+                                    pipeline_depth)
+
+    def _save_checkpoint(self, checkpoint_path, checkpoint):
+        # Written to a temporary file first, so that a crash never leaves
+        # a half-written checkpoint behind
+        temporary_path = checkpoint_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+        replace_file(temporary_path, checkpoint_path)
+
+    def _count_rows(self, table, marker_column=None, marker=None):
+        query = 'SELECT count(*) AS count FROM {table}'.format(table=table)
+        if marker_column is not None:
+            query += ' WHERE {column} = {marker}'.format(column=marker_column,
+                                                         marker=marker)
+        return self.sql_client.send(query)['rows'][0]['count']
+
+    def _committed_rows(self, segment, table, marker_column):
+        # Number of rows a segment whose request outcome is unknown
+        # actually loaded, 0 if it was rolled back
+        if marker_column is not None:
+            return self._count_rows(table, marker_column, segment['index'])
+        if segment.get('rows_before') is None:
+            return 0
+        return max(self._count_rows(table) - segment['rows_before'], 0)
+
+    def _wait_before_retry(self, segment, attempts, max_retries):
+        if attempts >= max_retries:
+            raise CartoException(segment['error'])
+        if segment.get('retry_after') is not None:
+            time.sleep(segment['retry_after'])
+        else:
+            time.sleep(SEGMENT_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+    def _add_marker(self, blocks, delimiter, marker, quote=None):
+        # Appends the marker to every record, before its line ending.
+        # Newline characters inside quoted values don't end a record
+        suffix = u'{delimiter}{marker}'.format(
+            delimiter=delimiter, marker=marker).encode('utf-8')
+        quote = quote.encode('utf-8') if quote else None
+        in_quotes = False
+        pending = b''
+        for block in blocks:
+            lines = (pending + bytes(block)).split(b'\n')
+            pending = lines.pop()
+            records = []
+            for line in lines:
+                if quote and line.count(quote) % 2:
+                    in_quotes = not in_quotes
+                if in_quotes:
+                    records.append(line + b'\n')
+                elif line.endswith(b'\r'):
+                    records.append(line[:-1] + suffix + b'\r\n')
+                else:
+                    records.append(line + suffix + b'\n')
+            if records:
+                yield b''.join(records)
+        if pending:
+            # Last line of the file, with no line ending
+            if quote and pending.count(quote) % 2:
+                in_quotes = not in_quotes
+            yield pending if in_quotes else pending + suffix
+
+    def copyfrom_resumable(self, query, path, checkpoint_path=None,
+                           segment_size=DEFAULT_SEGMENT_SIZE, header=False,
+                           verify=True, marker_column=None, delimiter=',',
+                           max_retries=DEFAULT_SEGMENT_RETRIES, compress=True,
+                           compression_level=DEFAULT_COMPRESSION_LEVEL,
+                           pipeline=False,
+                           pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        """
+        Gets data from a readable file into a table in numbered segments,
+        recording the segments already loaded in a checkpoint file so that
+        an interrupted load can be resumed by calling this method again
+        with the same arguments
+
+        Every segment is loaded in its own COPY FROM request. When the
+        outcome of a request is unknown, because it failed or the process
+        died while it was in progress, the segment is checked against the
+        table before loading it again: either the table grew since the
+        segment started (row-count check, which assumes nobody else writes
+        to the table during the load) or, if marker_column is given, there
+        are rows with the number of the segment in that column. The table
+        is counted once at the beginning and after every failed request,
+        and the rows reported by every COPY are added up in between.
+
+        Segments begin right after a newline character, so quoted values
+        spanning several lines are not supported.
+
+        :param query: The "COPY table_name [(column_name[, ...])]
+                           FROM STDIN [WITH(option[,...])]" query to execute
+        :type query: str
+
+        :param path: A path to a file
+        :type path: str
+
+        :param checkpoint_path: Path of the checkpoint file. Default value
+                                is the path of the file plus '.checkpoint'
+        :type checkpoint_path: str
+
+        :param segment_size: Approximate size of each segment in bytes
+        :type segment_size: int
+
+        :param header: Whether the first line of the file is a header. It
+                       is sent at the beginning of every segment, so the
+                       query should use the HEADER option
+        :type header: bool
+
+        :param verify: Whether to check if a segment with an unknown
+                       outcome was committed before loading it again
+        :type verify: bool
+
+        :param marker_column: Column that gets the number of the segment
+                              of every row. It must be the last column of
+                              the query, the number is appended to every
+                              record after the delimiter
+        :type marker_column: str
+
+        :param delimiter: Column delimiter of the file, used to append the
+                          marker
+        :type delimiter: str
+
+        :param max_retries: Attempts to load a segment before giving up
+        :type max_retries: int
+
+        :return: Total number of rows, wall time in seconds, number of
+                 retries and the status, rows, size, attempts and elapsed
+                 time of every segment, as stored in the checkpoint
+        :rtype: dict
+
+        :raise CartoException:
+        """
+        checkpoint_path = checkpoint_path or path + '.checkpoint'
+        source_size = os.path.getsize(path)
+
+        table = None
+        if verify:
+            match = re.match(r'\s*COPY\s+([^\s(]+)', query, re.IGNORECASE)
+            if match is None:
+                raise CartoException(_("Could not find the table of the "
+                                       "COPY query to verify segments"))
+            table = match.group(1)
+
+        checkpoint = None
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint['query'] != query or \
+                    checkpoint['source_size'] != source_size:
+                raise CartoException(_("Checkpoint {checkpoint} belongs to "
+                                       "a different load").format(
+                                           checkpoint=checkpoint_path))
+
+        if checkpoint is None:
+            with open(path, 'rb') as f:
+                head = f.readline() if header else b''
+                start = f.tell()
+                parts = max(-(-(source_size - start) // segment_size), 1)
+                ranges = self._line_aligned_ranges(f, start, source_size,
+                                                   parts)
+            checkpoint = {
+                'query': query,
+                'source': path,
+                'source_size': source_size,
+                'header_size': len(head),
+                'segments': [{'index': i,
+                              'start': a,
+                              'end': b,
+                              'status': 'pending',
+                              'rows': None,
+                              'attempts': 0,
+                              'elapsed': 0}
+                             for i, (a, b) in enumerate(ranges)],
+                'stats': {}
+            }
+            self._save_checkpoint(checkpoint_path, checkpoint)
+
+        head = None
+        if checkpoint['header_size']:
+            with open(path, 'rb') as f:
+                head = f.read(checkpoint['header_size'])
+
+        quote = None
+        if re.search(r'\bCSV\b', query, re.IGNORECASE):
+            match = re.search(r"\bQUOTE\s+'(.)'", query, re.IGNORECASE)
+            quote = match.group(1) if match else '"'
+
+        # Rows in the table, known as long as every request succeeds
+        table_rows = None
+        started = time.time()
+        for segment in checkpoint['segments']:
+            if segment['status'] == 'done':
+                continue
+
+            attempts = 0
+            while True:
+                if segment['status'] == 'loading' and verify:
+                    rows = self._committed_rows(segment, table,
+                                                marker_column)
+                    if marker_column is None and \
+                            segment.get('rows_before') is not None:
+                        table_rows = segment['rows_before'] + rows
+                    if rows > 0:
+                        segment['status'] = 'done'
+                        segment['rows'] = rows
+                        segment.pop('error', None)
+                        segment.pop('retry_after', None)
+                        self._save_checkpoint(checkpoint_path, checkpoint)
+                        break
+                    if attempts > 0:
+                        self._wait_before_retry(segment, attempts,
+                                                max_retries)
+
+                attempts += 1
+                segment['attempts'] += 1
+                segment['status'] = 'loading'
+                if verify and marker_column is None:
+                    if table_rows is None:
+                        table_rows = self._count_rows(table)
+                    segment['rows_before'] = table_rows
+                self._save_checkpoint(checkpoint_path, checkpoint)
+
+                data = self._read_file_range(path, segment['start'],
+                                             segment['end'],
+                                             threading.Event(), head)
+                if marker_column is not None:
+                    data = self._add_marker(data, delimiter,
+                                            segment['index'], quote)
+
+                segment_started = time.time()
+                try:
+                    result = self.copyfrom(query, data, compress,
+                                           compression_level, pipeline,
+                                           pipeline_depth)
+                except CartoException as e:
+                    segment['elapsed'] += time.time() - segment_started
+                    segment['error'] = str(e)
+                    segment['retry_after'] = getattr(e, 'retry_after', None)
+                    table_rows = None
+                    self._save_checkpoint(checkpoint_path, checkpoint)
+                    if not verify:
+                        self._wait_before_retry(segment, attempts,
+                                                max_retries)
+                    continue
+
+                segment['elapsed'] += time.time() - segment_started
+                segment['status'] = 'done'
+                segment['rows'] = result.get('total_rows')
+                if table_rows is not None and segment['rows'] is not None:
+                    table_rows += segment['rows']
+                else:
+                    table_rows = None
+                segment.pop('error', None)
+                segment.pop('retry_after', None)
+                self._save_checkpoint(checkpoint_path, checkpoint)
+                break
+
+        elapsed = time.time() - started
+        segments = checkpoint['segments']
+        loaded_bytes = sum(segment['end'] - segment['start']
+                           for segment in segments)
+        load_time = sum(segment['elapsed'] for segment in segments)
+        checkpoint['stats'] = {
+            'total_rows': sum(segment['rows'] or 0 for segment in segments),
+            'bytes': loaded_bytes,
+            'time': load_time,
+            'throughput': loaded_bytes / load_time if load_time > 0 else None,
+            'retries': sum(max(segment['attempts'] - 1, 0)
+                           for segment in segments)
+        }
+        self._save_checkpoint(checkpoint_path, checkpoint)
+
+        return {'total_rows': checkpoint['stats']['total_rows'],
+                'time': elapsed,
+                'retries': checkpoint['stats']['retries'],
+                'segments': segments}
+
     def copyto(self, query):
         """
         Gets data from a table into a Response object that can be iterated
@@ -504,16 +2284,214 @@ class CopySQLClient(object):
         with open(path, file_mode) as f:
             self.copyto_file_object(query, f)
 
-    def copyto_stream(self, query):
+    def copyto_parallel(self, table, path, partition_column='cartodb_id',
+                        parts=DEFAULT_PARALLEL_WORKERS, columns='*',
+                        header=True):
+        """
+        Gets data from a table into a CSV file through several concurrent
+        COPY TO requests, each one of them exporting a range of values of
+        an integer partition column
+
+        The parts are downloaded next to the target file and stitched
+        in order, so the result only contains one header line. Rows with
+        a NULL partition column are exported by one more part, at the end.
+
+        :param table: The table to export
+        :type table: str
+
+        :param path: A path to a writable file
+        :type path: str
+
+        :param partition_column: Integer column used to split the table
+                                 in ranges. Default value is cartodb_id.
+                                 Columns of other types are rejected
+        :type partition_column: str
+
+        :param parts: Number of concurrent COPY requests
+        :type parts: int
+
+        :param columns: Columns to export. Default value is '*'
+        :type columns: str
+
+        :param header: Whether to write a CSV header line
+        :type header: bool
+
+        :return: Wall time in seconds and the range, size and elapsed time
+                 of every part. The range of the part of NULL values is None
+        :rtype: dict
+
+        :raise CartoException:
+        """
+        result = self.sql_client.send(
+            'SELECT min({column}) AS min, max({column}) AS max '
+            'FROM {table}'.format(column=partition_column, table=table))
+        pg_type = result.get('fields', {}).get('min', {}).get('pgtype')
+        if pg_type is not None and pg_type not in INTEGER_PG_TYPES:
+            raise CartoException(
+                _("The partition column {column} must be an integer column, "
+                  "not {pg_type}").format(column=partition_column,
+                                          pg_type=pg_type))
+        low, high = result['rows'][0]['min'], result['rows'][0]['max']
+
+        select = 'SELECT {columns} FROM {table}'.format(columns=columns,
+                                                        table=table)
+        if low is None:
+            # Empty table, or NULL values only
+            ranges = [None]
+            conditions = ['']
+        else:
+            low, high = int(low), int(high)
+            span = high - low + 1
+            parts = max(min(parts, span), 1)
+            limits = [low + span * i // parts for i in range(parts + 1)]
+            ranges = [(a, b - 1) for a, b in zip(limits, limits[1:])]
+            conditions = [' WHERE {column} BETWEEN {a} AND {b}'.format(
+                column=partition_column, a=a, b=b) for a, b in ranges]
+            # BETWEEN leaves NULL values out
+            ranges.append(None)
+            conditions.append(' WHERE {column} IS NULL'.format(
+                column=partition_column))
+
+        part_paths = ['{path}.part{i}'.format(path=path, i=i)
+                      for i in range(len(ranges))]
+
+        def export(i):
+            query = select + conditions[i]
+            query = 'COPY ({query}) TO STDOUT WITH (FORMAT csv, ' \
+                    'HEADER {header})'.format(
+                        query=query,
+                        header='true' if header and i == 0 else 'false')
+            started = time.time()
+            self.copyto_file_path(query, part_paths[i])
+            return {'part': i,
+                    'range': ranges[i],
+                    'bytes': os.path.getsize(part_paths[i]),
+                    'elapsed': time.time() - started}
+
+        started = time.time()
+        try:
+            # The part of NULL values waits for a free worker, so that
+            # there are never more requests than parts
+            workers = min(len(ranges), parts)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                part_results = list(executor.map(export, range(len(ranges))))
+
+            with open(path, 'wb') as f:
+                for part_path in part_paths:
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, f, DEFAULT_CHUNK_SIZE * 8)
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        return {'time': time.time() - started,
+                'parts': part_results}
+
+    def copyto_columns(self, query, schema=None,
+                       batch_size=DEFAULT_BATCH_ROWS, arrow=False,
+                       chunk_size=DEFAULT_CHUNK_SIZE * 8):
+        """
+        Gets the result of a query as batches of typed NumPy arrays or
+        Arrow record batches
+
+        The data is requested in the PostgreSQL COPY binary format and
+        decoded as it arrives, so memory usage is bounded by the batch
+        size instead of the size of the result.
+
+        Integers, floats and booleans are decoded as NumPy numbers (masked
+        arrays if there are NULL values), timestamps and dates as
+        datetime64, numeric as float64, text-like types as str and
+        geometries, as well as any other type, as raw bytes (EWKB for
+        geometries).
+
+        :param query: A SELECT query
+        :type query: str
+
+        :param schema: List of (name, pg_type) pairs with the columns of
+                       the result, in order. If not given, it is read from
+                       the fields returned by the SQL API for the query
+                       with LIMIT 0, which come in the order of the columns
+        :type schema: list
+
+        :param batch_size: Number of rows of each batch. If None all the
+                           rows are returned in a single batch
+        :type batch_size: int
+
+        :param arrow: Whether to return Arrow record batches (requires
+                      pyarrow) instead of dicts of NumPy arrays
+        :type arrow: bool
+
+        :return: Generator of dicts from column name to values, or of
+                 pyarrow.RecordBatch
+        :rtype: generator
+
+        :raise CartoException:
+        """
+        if schema is None:
+            schema = self.get_schema(query)
+        elif hasattr(schema, 'items'):
+            schema = list(schema.items())
+
+        if arrow:
+            try:
+                import pyarrow
+            except ImportError:
+                raise CartoException(_("pyarrow is required to get Arrow "
+                                       "record batches"))
+
+        response = self.copyto('COPY ({query}) TO STDOUT WITH '
+                               '(FORMAT binary)'.format(query=query))
+        for columns in decode_rows(response.iter_content(chunk_size), schema,
+                                   batch_size):
+            if arrow:
+                yield pyarrow.RecordBatch.from_arrays(
+                    [pyarrow.array(values.filled() if hasattr(values, 'filled')
+                                   else values,
+                                   mask=nulls if nulls.any() else None)
+                     for _name, values, nulls in columns],
+                    names=[name for name, _values, _nulls in columns])
+            else:
+                yield dict((name, values) for name, values, _nulls in columns)
+
+    def get_schema(self, query):
+        """
+        Gets the columns of the result of a query and their PostgreSQL
+        types, without running it
+
+        :param query: A SELECT query
+        :type query: str
+
+        :return: List of (name, pg_type) pairs
+        :rtype: list
+
+        :raise CartoException:
+        """
+        fields = self.sql_client._get_fields(query)
+        schema = []
+        for name, field in fields.items():
+            if 'pgtype' not in field:
+                raise CartoException(_("The SQL API did not return the type "
+                                       "of column {name}, please provide a "
+                                       "schema").format(name=name))
+            schema.append((name, field['pgtype']))
+        return schema
+
+    def copyto_stream(self, query, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         Gets data from a table into a stream
 
         :param query: The "COPY { table_name [(column_name[, ...])] | (query) } TO STDOUT [WITH(option[,...])]" query to execute
         :type query: str
 
+        :param chunk_size: Size of the blocks read from the response.
+                           Bigger values reduce the per-read overhead of
+                           consumers such as pandas.read_csv
+        :type chunk_size: int
+
         :return: the data from COPY TO query
         :rtype: raw binary (text stream)
 
         :raise: CartoException
         """
-        return ResponseStream(self.copyto(query))
+        return ResponseStream(self.copyto(query), chunk_size)
@@ -16,10 +16,10 @@ try:
 except ImportError:
     from urlparse import urljoin
 
-from pyrestcli.fields import IntegerField, CharField, BooleanField, \
-    DateTimeField
+from pyrestcli.fields import IntegerField, CharField, BooleanField
 
 from .exceptions import CartoException
+from .fields import DateTimeField
 from .resources import AsyncResource, Manager
 from .paginators import CartoPaginator
 
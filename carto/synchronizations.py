@@ -12,7 +12,9 @@ Entity classes for defining synchronizations
 """
 
 from pyrestcli.resources import Resource
-from pyrestcli.fields import CharField, DateTimeField, BooleanField, IntegerField
+from pyrestcli.fields import CharField, BooleanField, IntegerField
+
+from .fields import DateTimeField
 
 
 class Synchronization(Resource):
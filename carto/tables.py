@@ -11,9 +11,10 @@ Module for working with tables
 
 """
 
-from pyrestcli.fields import IntegerField, CharField, DateTimeField
+from pyrestcli.fields import IntegerField, CharField
 
-from .fields import PermissionField, VisualizationField, SynchronizationField
+from .fields import PermissionField, VisualizationField, SynchronizationField, \
+    DateTimeField
 from .paginators import CartoPaginator
 from .resources import Manager, WarnResource
 
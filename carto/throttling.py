@@ -0,0 +1,193 @@
+"""
+Module for client side throttling of the requests to CARTO's APIs
+
+.. module:: carto.throttling
+   :platform: Unix, Windows
+   :synopsis: Module for client side throttling of the requests to CARTO's
+              APIs
+
+
+"""
+
+import threading
+import time
+
+_now = getattr(time, 'monotonic', time.time)
+_sleep = time.sleep
+
+# Rate limits are applied by CARTO per API (SQL, Maps...), requests are
+# grouped by the first segments of their path, i.e. api/v2/sql
+BUCKET_PATH_SEGMENTS = 3
+
+
+class _Bucket(object):
+    """
+    Token bucket of an API, as known from the last response headers
+    """
+    def __init__(self):
+        self.limit = None
+        self.tokens = None
+        self.rate = None
+        self.updated_at = _now()
+        self.blocked_until = 0
+
+    def refill(self, now):
+        if self.tokens is not None and self.rate:
+            self.tokens = min(self.limit, self.tokens +
+                              (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimitThrottler(object):
+    """
+    Paces the requests of one or several auth clients to stay within the
+    CARTO rate limits
+
+    The size and refill rate of the bucket of every API are learnt from the
+    Carto-Rate-Limit-* headers of every response, so that requests are
+    delayed before the server starts rejecting them. A rate limited
+    response blocks every thread sharing the throttler for the time given
+    by its Retry-After header.
+
+    More info about CARTO rate limits:
+    https://carto.com/developers/fundamentals/limits/#rate-limits
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.requests = 0
+        self.delayed_requests = 0
+        self.wait_time = 0
+        self.rate_limited = 0
+
+    @staticmethod
+    def bucket_key(relative_path):
+        """
+        Gets the key of the bucket a request path counts against
+
+        :param relative_path: URL path relative to the base URL
+        :type relative_path: str
+
+        :return: The first segments of the path
+        :rtype: str
+        """
+        path = relative_path.split('?')[0].strip('/')
+        return '/'.join(path.split('/')[:BUCKET_PATH_SEGMENTS])
+
+    def _get_bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _Bucket()
+        return bucket
+
+    def acquire(self, relative_path):
+        """
+        Takes a token from the bucket of the API, waiting for it if
+        needed
+
+        Tokens are reserved before waiting, so that threads waiting at the
+        same time are released one refill period apart and not all at once.
+
+        :param relative_path: URL path relative to the base URL
+        :type relative_path: str
+
+        :return: Seconds waited
+        :rtype: float
+        """
+        key = self.bucket_key(relative_path)
+        waited = 0
+        while True:
+            with self.lock:
+                bucket = self._get_bucket(key)
+                now = _now()
+                bucket.refill(now)
+
+                wait = bucket.blocked_until - now
+                if wait <= 0:
+                    wait = 0
+                    if bucket.tokens is not None:
+                        bucket.tokens -= 1
+                        if bucket.tokens < 0 and bucket.rate:
+                            wait = -bucket.tokens / bucket.rate
+
+                    self.requests += 1
+                    if wait > 0 or waited > 0:
+                        self.delayed_requests += 1
+                        self.wait_time += wait
+                    break
+
+                self.wait_time += wait
+
+            _sleep(wait)
+            waited += wait
+
+        if wait > 0:
+            _sleep(wait)
+        return waited + wait
+
+    def update(self, relative_path, response):
+        """
+        Learns the state of the bucket of the API from a response
+
+        :param relative_path: URL path relative to the base URL
+        :param response: Any response of the API, rate limited or not
+        :type relative_path: str
+        :type response: requests.models.Response class
+
+        :return:
+        """
+        headers = response.headers
+        try:
+            limit = int(headers['Carto-Rate-Limit-Limit'])
+            remaining = int(headers['Carto-Rate-Limit-Remaining'])
+            reset = int(headers['Carto-Rate-Limit-Reset'])
+        except (KeyError, ValueError):
+            return
+        try:
+            retry_after = int(headers.get('Retry-After', -1))
+        except ValueError:
+            retry_after = -1
+
+        with self.lock:
+            bucket = self._get_bucket(self.bucket_key(relative_path))
+            now = _now()
+            bucket.refill(now)
+
+            # Reset is the time until the bucket is full again
+            if reset > 0 and limit > remaining:
+                bucket.rate = float(limit - remaining) / reset
+            bucket.limit = limit
+            # Other clients may be using the same API key, but requests of
+            # ours still in flight are not counted by the server yet
+            if bucket.tokens is None or remaining < bucket.tokens:
+                bucket.tokens = remaining
+
+            if retry_after >= 0:
+                self.rate_limited += 1
+                bucket.tokens = min(bucket.tokens, 0)
+                bucket.blocked_until = max(bucket.blocked_until,
+                                           now + retry_after)
+
+    def stats(self):
+        """
+        Gets the throttling stats
+
+        :return: Number of requests sent, delayed and rate limited by the
+                 server, total seconds waited and the state of every bucket
+        :rtype: dict
+        """
+        with self.lock:
+            now = _now()
+            buckets = {}
+            for key, bucket in self.buckets.items():
+                bucket.refill(now)
+                buckets[key] = {'limit': bucket.limit,
+                                'remaining': bucket.tokens,
+                                'rate': bucket.rate,
+                                'blocked_for': max(0, bucket.blocked_until -
+                                                   now)}
+            return {'requests': self.requests,
+                    'delayed_requests': self.delayed_requests,
+                    'wait_time': self.wait_time,
+                    'rate_limited': self.rate_limited,
+                    'buckets': buckets}
@@ -0,0 +1,159 @@
+"""
+Module for the HTTP transport shared by the API clients
+
+.. module:: carto.transport
+   :platform: Unix, Windows
+   :synopsis: Module for the HTTP transport shared by the API clients
+
+
+"""
+
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+# Same defaults as requests: connection pools for up to 10 hosts, with up
+# to 10 reusable connections each. Raise pool_maxsize when the clients are
+# used from more threads than that, or connections will be discarded
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that sets TCP options on the sockets of its pools
+    """
+    def __init__(self, tcp_nodelay=True, tcp_keep_alive=True, **kwargs):
+        """
+        :param tcp_nodelay: Whether to disable Nagle's algorithm
+        :param tcp_keep_alive: Whether to send TCP keep-alive probes, so
+                               that idle pooled connections are not dropped
+        :param kwargs: Arguments for requests.adapters.HTTPAdapter
+        :type tcp_nodelay: bool
+        :type tcp_keep_alive: bool
+        :type kwargs: kwargs
+        """
+        self.socket_options = [
+            option for option in HTTPConnection.default_socket_options
+            if option[:2] != (socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        ]
+        if tcp_nodelay:
+            self.socket_options.append((socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY, 1))
+        if tcp_keep_alive:
+            self.socket_options.append((socket.SOL_SOCKET,
+                                        socket.SO_KEEPALIVE, 1))
+
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+class PooledSession(requests.Session):
+    """
+    requests session with tunable connection pools, default timeouts and
+    usage stats
+
+    A single instance can be shared by several auth clients (for instance
+    with different API keys) through their session parameter, and then
+    every SQLClient, BatchSQLClient, CopySQLClient and Manager built on
+    them uses the same pools.
+    """
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False,
+                 max_retries=0, timeout=None, keep_alive=True,
+                 tcp_nodelay=True):
+        """
+        :param pool_connections: Number of hosts to keep pools for
+        :param pool_maxsize: Maximum number of connections kept per host
+        :param pool_block: Whether to wait for a free connection when the
+                           pool of a host is exhausted instead of opening
+                           one that is discarded after the request
+        :param max_retries: Retries on connection errors, or an
+                            urllib3.util.Retry instance
+        :param timeout: Default timeout of the requests, in seconds, as
+                        a number or a (connect, read) tuple
+        :param keep_alive: Whether to reuse connections between requests
+                           and send TCP keep-alive probes on idle ones
+        :param tcp_nodelay: Whether to disable Nagle's algorithm
+        :type pool_connections: int
+        :type pool_maxsize: int
+        :type pool_block: bool
+        :type max_retries: int
+        :type timeout: float or tuple
+        :type keep_alive: bool
+        :type tcp_nodelay: bool
+
+        :return:
+        """
+        super(PooledSession, self).__init__()
+
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.adapter = PooledHTTPAdapter(tcp_nodelay=tcp_nodelay,
+                                         tcp_keep_alive=keep_alive,
+                                         pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize,
+                                         pool_block=pool_block,
+                                         max_retries=max_retries)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        with self._lock:
+            self.request_count += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return super(PooledSession, self).request(method, url, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def pool_stats(self):
+        """
+        Gets usage stats of the session and its connection pools
+
+        :return: Number of requests sent, in flight right now and at most
+                 at the same time, and for every host the number of
+                 connections opened, requests sent through the pool and
+                 idle connections ready to be reused
+        :rtype: dict
+        """
+        pools = {}
+        poolmanager = self.adapter.poolmanager
+        for key in list(poolmanager.pools.keys()):
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools['{scheme}://{host}:{port}'.format(
+                scheme=pool.scheme, host=pool.host, port=pool.port)] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                # Free slots of the pool are None placeholders
+                'idle_connections': sum(
+                    1 for conn in list(pool.pool.queue) if conn is not None)
+                if pool.pool is not None else 0,
+                'maxsize': self.pool_maxsize
+            }
+
+        with self._lock:
+            return {'requests': self.request_count,
+                    'in_flight': self.in_flight,
+                    'max_in_flight': self.max_in_flight,
+                    'pools': pools}
@@ -1,20 +1,243 @@
+from gettext import gettext as _
 from io import RawIOBase
+import codecs
+import json
+import re
+
+from .exceptions import CartoException
+
+DEFAULT_STREAM_CHUNK_SIZE = 8 * 1024
+
+WHITESPACE_RE = re.compile(r'\s*')
+JSON_DELIMITERS = ',]} \t\r\n'
+SEPARATOR_RE = re.compile(r'\s*([,\]])\s*')
 
 
 class ResponseStream(RawIOBase):
-    def __init__(self, response):
-        self.it = response.iter_content(8 * 1024)
-        self.leftover = None
+    """
+    Read-only file-like object over the body of a streamed response
+
+    Chunks coming from the response are never sliced: a cursor over a
+    memoryview of the current chunk tracks what has already been read, so
+    every byte is copied just once, into the caller's buffer.
+    """
+    def __init__(self, response, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+        """
+        :param response: A response object sent with stream=True
+        :param chunk_size: Size of the blocks read from the response
+        :type response: requests.models.Response
+        :type chunk_size: int
+        """
+        self.it = response.iter_content(chunk_size)
+        self.data = b''
+        self.chunk = memoryview(self.data)
+        self.offset = 0
 
     def readable(self):
         return True
 
-    def readinto(self, b):
-        try:
-            length = len(b)
-            chunk = self.leftover or next(self.it)
-            output, self.leftover = chunk[:length], chunk[length:]
-            b[:len(output)] = output
-            return len(output)
-        except StopIteration:
+    def _next_chunk(self):
+        # Returns False once the response has been consumed
+        for chunk in self.it:
+            if chunk:
+                self.data = chunk
+                self.chunk = memoryview(chunk)
+                self.offset = 0
+                return True
+        self.data = b''
+        self.chunk = memoryview(self.data)
+        self.offset = 0
+        return False
+
+    def readinto1(self, b):
+        """
+        Reads into b at most one chunk of the response
+        """
+        if self.offset >= len(self.chunk) and not self._next_chunk():
             return 0
+        length = min(len(b), len(self.chunk) - self.offset)
+        b[:length] = self.chunk[self.offset:self.offset + length]
+        self.offset += length
+        return length
+
+    def readinto(self, b):
+        """
+        Fills b with as many chunks of the response as needed
+        """
+        offset = self.offset
+        length = len(b)
+        if offset + length <= len(self.chunk):
+            # Fast path, the current chunk is enough
+            b[:length] = self.chunk[offset:offset + length]
+            self.offset = offset + length
+            return length
+
+        # Python 2 has no memoryview.cast, but its buffers are of bytes
+        # already
+        target = memoryview(b)
+        if hasattr(target, 'cast'):
+            target = target.cast('B')
+        total = 0
+        while total < length:
+            read = self.readinto1(target[total:])
+            if read == 0:
+                break
+            total += read
+        return total
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        if self.offset >= len(self.chunk) and not self._next_chunk():
+            return b''
+        if self.offset == 0 and size >= len(self.chunk):
+            # The whole chunk is requested, hand it over without copying
+            data = self.data
+            self.data = b''
+            self.chunk = memoryview(self.data)
+            return data
+        length = min(size, len(self.chunk) - self.offset)
+        data = self.chunk[self.offset:self.offset + length].tobytes()
+        self.offset += length
+        return data
+
+    def readall(self):
+        parts = [self.chunk[self.offset:].tobytes()]
+        parts.extend(self.it)
+        self.data = b''
+        self.chunk = memoryview(self.data)
+        self.offset = 0
+        return b''.join(parts)
+
+
+class JSONRowsReader(object):
+    """
+    Incremental parser of a JSON object with an array of rows, such as the
+    responses of the SQL API
+
+    Rows are yielded as soon as they are complete, so that only the current
+    one and a chunk of the body are in memory. The rest of the keys of the
+    object are kept in metadata as they are found.
+    """
+    def __init__(self, chunks, array_key='rows'):
+        """
+        :param chunks: Blocks of the body, such as the ones from
+                       response.iter_content
+        :param array_key: Key of the array of rows
+        :type chunks: iterable
+        :type array_key: str
+        """
+        self.chunks = iter(chunks)
+        self.array_key = array_key
+        self.metadata = {}
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Returns False once the body has been consumed
+        if self.eof:
+            return False
+        text = None
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                break
+        if not text:
+            text = self.decoder.decode(b'', True)
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return bool(text) or not self.eof
+
+    def _peek(self):
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise CartoException(_("Unexpected end of JSON response"))
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise CartoException(_("Invalid JSON response: expected "
+                                   "{char} at {context}").format(
+                char=char, context=self.buffer[self.pos:self.pos + 50]))
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer,
+                                                          self.pos)
+            except ValueError as e:
+                if self._fill():
+                    continue
+                raise CartoException(e)
+            # Numbers and literals may go on in the next chunk
+            if self.eof or end < len(self.buffer) and (
+                    isinstance(value, (dict, list, str)) or
+                    self.buffer[end] in JSON_DELIMITERS):
+                self.pos = end
+                return value
+            self._fill()
+
+    def __iter__(self):
+        self._expect('{')
+        while True:
+            char = self._peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self._value()
+            self._expect(':')
+            if key != self.array_key:
+                self.metadata[key] = self._value()
+                continue
+
+            self._expect('[')
+            for row in self._rows():
+                yield row
+
+    def _rows(self):
+        scan = self.json_decoder.scan_once
+        separator = SEPARATOR_RE.match
+        after_value = False
+        while True:
+            # Fast path, rows followed by their separator in the buffer
+            buffer = self.buffer
+            pos = self.pos
+            while True:
+                try:
+                    value, end = scan(buffer, pos)
+                except (StopIteration, ValueError):
+                    break
+                match = separator(buffer, end)
+                if match is None:
+                    break
+                after_value = False
+                yield value
+                pos = match.end()
+                if match.group(1) == ']':
+                    self.pos = pos
+                    return
+            self.pos = pos
+
+            # Slow path, a row split between chunks or whitespace
+            char = self._peek()
+            if char == ']':
+                self.pos += 1
+                return
+            if after_value:
+                self._expect(',')
+                self._peek()
+                after_value = False
+                continue
+            yield self._value()
+            after_value = True
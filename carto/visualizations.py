@@ -14,11 +14,11 @@ Module for working with map visualizations
 import time
 from gettext import gettext as _
 
-from pyrestcli.fields import IntegerField, CharField, DateTimeField, \
-    BooleanField, DictField
+from pyrestcli.fields import IntegerField, CharField, BooleanField, DictField
 
 from .exceptions import CartoException
-from .fields import TableField, PermissionField, SynchronizationField
+from .fields import TableField, PermissionField, SynchronizationField, \
+    DateTimeField
 from .resources import Manager, WarnResource
 from .paginators import CartoPaginator
 from .export import ExportJob
@@ -154,6 +154,13 @@ class VisualizationManager(Manager):
         except Exception as e:
             raise CartoException(e)
 
+    def changes_since(self, timestamp=None, snapshot=None, **search_args):
+        """
+        Gets the visualizations created, updated or deleted since a given time.
+        See :func:`carto.resources.Manager._changes_since`
+        """
+        return self._changes_since(timestamp, snapshot, **search_args)
+
     def create(self, **kwargs):
         """
         Creating visualizations is better done by using the Maps API
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import time
+import warnings
+
+from carto.auth import APIKeyAuthClient
+from carto.sql import SQLClient
+
+warnings.filterwarnings('ignore')
+
+# python sql_formats_benchmark.py "select * from mytable" --limits 1000 100000
+
+# Logger (better than print)
+logging.basicConfig(
+    level=logging.INFO,
+    format=' %(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%I:%M:%S %p')
+logger = logging.getLogger()
+
+# set input arguments
+parser = argparse.ArgumentParser(
+    description='Compare the time to get columnar results of a query ' +
+    'in the JSON and CSV formats')
+parser.add_argument('query', type=str,
+                    help='Set query to benchmark')
+
+parser.add_argument('--limits', type=int, nargs='+', dest='limits',
+                    default=[1000, 10000, 100000],
+                    help='Number of rows of every run')
+
+parser.add_argument('--repeat', type=int, dest='repeat', default=3,
+                    help='Number of times every run is repeated')
+
+parser.add_argument('--organization', type=str, dest='organization',
+                    default=os.environ['CARTO_ORG'] if 'CARTO_ORG' in os.environ else '',
+                    help='Set the name of the organization' +
+                    ' account (defaults to env variable CARTO_ORG)')
+
+parser.add_argument('--base_url', type=str, dest='CARTO_BASE_URL',
+                    default=os.environ['CARTO_API_URL'] if 'CARTO_API_URL' in os.environ else '',
+                    help='Set the base URL. For example:' +
+                    ' https://username.carto.com/ ' +
+                    '(defaults to env variable CARTO_API_URL)')
+
+parser.add_argument('--api_key', dest='CARTO_API_KEY',
+                    default=os.environ['CARTO_API_KEY'] if 'CARTO_API_KEY' in os.environ else '',
+                    help='Api key of the account' +
+                    ' (defaults to env variable CARTO_API_KEY)')
+
+args = parser.parse_args()
+
+# Authenticate to CARTO account
+if args.CARTO_BASE_URL and args.CARTO_API_KEY:
+    auth_client = APIKeyAuthClient(
+        args.CARTO_BASE_URL, args.CARTO_API_KEY, args.organization)
+else:
+    logger.error('You need to provide valid credentials, run with -h parameter for details')
+    import sys
+    sys.exit(1)
+
+# SQL wrapper
+sql = SQLClient(auth_client)
+
+for limit in args.limits:
+    query = 'SELECT * FROM ({query}) _q LIMIT {limit}'.format(
+        query=args.query, limit=limit)
+    for format in ['json', 'csv']:
+        times = []
+        for i in range(args.repeat):
+            start = time.time()
+            columns = sql.send(query, result='columns', format=format)
+            times.append(time.time() - start)
+        rows = len(next(iter(columns.values()))) if columns else 0
+        logger.info('{format}: {rows} rows in {time:.3f} s (best of {repeat})'.format(
+            format=format, rows=rows, time=min(times), repeat=args.repeat))
@@ -5,7 +5,8 @@ try:
     with open('requirements.txt') as f:
         required = f.read().splitlines()
 except:
-    required = ['requests>=2.7.0', 'pyrestcli>=0.6.4']
+    required = ['requests>=2.7.0', 'pyrestcli>=0.6.4',
+                'futures; python_version < "3"']
 
 try:
     with open('test_requirements.txt') as f:
@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import zlib
+
+import pytest
+
+from carto.auth import APIKeyAuthClient
+from carto.exceptions import CartoException, CartoRateLimitException
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from carto.async_sql import AsyncClient, AsyncSQLClient, \
+    AsyncBatchSQLClient, AsyncCopySQLClient  # noqa: E402
+from carto.sql import BatchPollStrategy  # noqa: E402
+
+COPY_DATA = b''.join(b'%d,name %d\n' % (i, i) for i in range(1000))
+
+
+def make_app(requests_log):
+    jobs = {}
+
+    async def sql(request):
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        requests_log.append((request.method, params))
+        if params['q'] == 'rate limited':
+            return web.json_response(
+                {'error': ['You are over platform\'s limits']},
+                status=429,
+                headers={'Carto-Rate-Limit-Limit': '10',
+                         'Carto-Rate-Limit-Remaining': '0',
+                         'Carto-Rate-Limit-Reset': '1',
+                         'Retry-After': '1'})
+        if params['q'] == 'wrong':
+            return web.json_response({'error': ['syntax error']},
+                                     status=400)
+        return web.json_response({'rows': [{'q': params['q']}],
+                                  'total_rows': 1})
+
+    async def copyfrom(request):
+        # aiohttp decompresses gzipped bodies
+        body = await request.read()
+        return web.json_response(
+            {'total_rows': body.count(b'\n'),
+             'encoding': request.headers.get('Content-Encoding')})
+
+    async def copyto(request):
+        if 'wrong' in request.query['q']:
+            return web.json_response({'error': ['relation does not exist']},
+                                     status=400)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(0, len(COPY_DATA), 1000):
+            await response.write(COPY_DATA[i:i + 1000])
+        await response.write_eof()
+        return response
+
+    async def create_job(request):
+        body = await request.json()
+        job_id = str(len(jobs))
+        jobs[job_id] = {'job_id': job_id, 'query': body['query'],
+                        'status': 'pending', 'reads': 0}
+        return web.json_response(jobs[job_id], status=201)
+
+    async def read_job(request):
+        job = jobs[request.match_info['job_id']]
+        job['reads'] += 1
+        if job['reads'] == 2:
+            job['status'] = 'done'
+        return web.json_response(job)
+
+    app = web.Application()
+    app.router.add_route('*', '/api/v2/sql', sql)
+    app.router.add_post('/api/v2/sql/copyfrom', copyfrom)
+    app.router.add_route('*', '/api/v2/sql/copyto', copyto)
+    app.router.add_post('/api/v2/sql/job/', create_job)
+    app.router.add_get('/api/v2/sql/job/{job_id}', read_job)
+    return app
+
+
+def run(test):
+    requests_log = []
+
+    async def main():
+        server = TestServer(make_app(requests_log), host='127.0.0.1')
+        await server.start_server()
+        try:
+            auth_client = APIKeyAuthClient(
+                'https://test.carto.com', 'some_api_key')
+            # Requests go to the local server, credentials come from the
+            # auth client
+            auth_client.base_url = str(server.make_url('/'))
+            async with AsyncClient(auth_client) as client:
+                await test(client)
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+    return requests_log
+
+
+def test_async_sql_send():
+    async def test(client):
+        sql = AsyncSQLClient(client)
+        assert (await sql.send('select 1', do_post=False))['rows'] == \
+            [{'q': 'select 1'}]
+        await sql.send('select 2')
+        await sql.send('select ' + 'x' * 2000, do_post=False)
+
+    requests_log = run(test)
+    assert [method for method, params in requests_log] == \
+        ['GET', 'POST', 'POST']
+    assert requests_log[0][1]['api_key'] == 'some_api_key'
+    assert 'client' in requests_log[0][1]
+
+
+def test_async_sql_concurrent_queries():
+    async def test(client):
+        sql = AsyncSQLClient(client)
+        results = await asyncio.gather(*[
+            sql.send('select {}'.format(i), do_post=False)
+            for i in range(200)])
+        assert [r['rows'][0]['q'] for r in results] == \
+            ['select {}'.format(i) for i in range(200)]
+
+    assert len(run(test)) == 200
+
+
+def test_async_sql_errors():
+    async def test(client):
+        sql = AsyncSQLClient(client)
+        with pytest.raises(CartoRateLimitException) as e:
+            await sql.send('rate limited')
+        assert e.value.retry_after == 1
+        assert e.value.limit == 10
+
+        with pytest.raises(CartoException) as e:
+            await sql.send('wrong')
+        assert 'syntax error' in str(e.value)
+
+    run(test)
+
+
+def test_async_batch_create_and_wait():
+    async def test(client):
+        batch = AsyncBatchSQLClient(
+            client, poll_strategy=BatchPollStrategy(first_delay=0))
+        job = await batch.create_and_wait_for_completion('select 1')
+        assert job['status'] == 'done'
+        assert job['reads'] == 2
+        assert job['poll_stats']['polls'] == 2
+
+    run(test)
+
+
+def test_async_copyfrom_async_iterator():
+    async def chunks():
+        for i in range(0, len(COPY_DATA), 512):
+            yield COPY_DATA[i:i + 512]
+
+    async def test(client):
+        copy = AsyncCopySQLClient(client)
+        result = await copy.copyfrom('COPY t (a, b) FROM stdin', chunks())
+        assert result['total_rows'] == 1000
+        assert result['encoding'] == 'gzip'
+
+        result = await copy.copyfrom('COPY t (a, b) FROM stdin',
+                                     [COPY_DATA], compress=False)
+        assert result['total_rows'] == 1000
+
+    run(test)
+
+
+def test_async_copyfrom_file_path(tmpdir, mocker):
+    path = tmpdir.join('copyfrom.csv')
+    path.write_binary(COPY_DATA)
+    compressobj = zlib.compressobj
+    threads = set()
+
+    class Compressor(object):
+        def __init__(self, *args):
+            self.compressor = compressobj(*args)
+
+        def compress(self, chunk):
+            threads.add(threading.current_thread())
+            return self.compressor.compress(chunk)
+
+        def flush(self):
+            return self.compressor.flush()
+
+    mocker.patch('carto.async_sql.zlib.compressobj', Compressor)
+
+    async def test(client):
+        copy = AsyncCopySQLClient(client)
+        result = await copy.copyfrom_file_path('COPY t (a, b) FROM stdin',
+                                               path.strpath)
+        assert result['total_rows'] == 1000
+        assert result['encoding'] == 'gzip'
+
+    run(test)
+    # Compressed out of the thread of the event loop
+    assert threads and threading.main_thread() not in threads
+
+
+def test_async_copyto(tmpdir):
+    path = str(tmpdir.join('copyto.csv'))
+
+    async def test(client):
+        copy = AsyncCopySQLClient(client)
+        await copy.copyto_file_path('COPY t TO stdout', path)
+
+        with pytest.raises(CartoException) as e:
+            await copy.copyto('COPY wrong TO stdout')
+        assert 'relation does not exist' in str(e.value)
+
+    run(test)
+    with open(path, 'rb') as f:
+        assert f.read() == COPY_DATA
@@ -1,5 +1,6 @@
 import pytest
 import re
+import socket
 import requests
 import requests_mock
 
@@ -9,6 +10,7 @@ from carto.exceptions import CartoException
 from conftest import USR_BASE_URL, DEFAULT_PUBLIC_API_KEY
 from carto.auth import AuthAPIClient
 from carto.auth import _ClientIdentifier
+from carto.transport import PooledSession
 
 
 def test_wrong_url():
@@ -130,3 +132,70 @@ def test_client_id_in_requests():
     client = APIKeyAuthClient('https://test.carto.com', 'some_api_key')
     http_method, requests_args = client.prepare_send('post')
     assert requests_args['params']['client'] == expected_client_id
+
+
+def test_pooled_session_by_default():
+    client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                              pool_maxsize=32, timeout=(3, 30))
+    assert isinstance(client.session, PooledSession)
+    assert client.session.adapter._pool_maxsize == 32
+    assert client.session.timeout == (3, 30)
+
+    session = requests.Session()
+    client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                              session=session)
+    assert client.session is session
+    assert client.pool_stats() is None
+
+
+def test_pooled_session_socket_options():
+    adapter = PooledSession().adapter
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in \
+        adapter.socket_options
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in \
+        adapter.socket_options
+    assert adapter.poolmanager.connection_pool_kw['socket_options'] == \
+        adapter.socket_options
+
+    session = PooledSession(tcp_nodelay=False, keep_alive=False)
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) not in \
+        session.adapter.socket_options
+    assert session.headers['Connection'] == 'close'
+
+
+def test_pooled_session_shared_by_clients():
+    session = PooledSession(timeout=5)
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('GET', 'https://test.carto.com/api/v2/sql',
+                         json={'rows': []})
+
+    clients = [APIKeyAuthClient('https://test.carto.com', api_key,
+                                session=session)
+               for api_key in ('key1', 'key2')]
+    for client in clients:
+        client.send('api/v2/sql', 'get', params={'q': 'select 1'})
+
+    assert adapter.call_count == 2
+    assert adapter.last_request.timeout == 5
+    stats = clients[0].pool_stats()
+    assert stats == clients[1].pool_stats()
+    assert stats['requests'] == 2
+    assert stats['in_flight'] == 0
+    assert stats['max_in_flight'] == 1
+
+
+def test_pooled_session_pool_stats():
+    session = PooledSession(pool_maxsize=4)
+    connection_pool = session.adapter.poolmanager.connection_from_url(
+        'https://test.carto.com')
+
+    pool = session.pool_stats()['pools']['https://test.carto.com:443']
+    assert pool == {'connections_opened': 0, 'requests': 0,
+                    'idle_connections': 0, 'maxsize': 4}
+
+    # A connection is opened and given back to the pool
+    connection_pool._put_conn(connection_pool._get_conn())
+    pool = session.pool_stats()['pools']['https://test.carto.com:443']
+    assert pool['connections_opened'] == 1
+    assert pool['idle_connections'] == 1
@@ -0,0 +1,120 @@
+import struct
+
+import pytest
+
+from carto.binary_copy import encode_columns, decode_rows, PGCOPY_HEADER, \
+    PGCOPY_TRAILER
+from carto.exceptions import CartoException
+
+np = pytest.importorskip('numpy')
+
+
+def test_encode_fixed_width_columns():
+    data = b''.join(encode_columns([
+        ('id', np.array([1, 2], dtype=np.int32), None),
+        ('value', np.array([0.5, -1.0]), None),
+        ('valid', np.array([True, False]), None)
+    ]))
+
+    row = struct.pack('>hi i id i?', 3, 4, 1, 8, 0.5, 1, True)
+    assert data.startswith(PGCOPY_HEADER)
+    assert data.endswith(PGCOPY_TRAILER)
+    assert data[len(PGCOPY_HEADER):len(PGCOPY_HEADER) + len(row)] == row
+    assert len(data) == len(PGCOPY_HEADER) + 2 * len(row) + \
+        len(PGCOPY_TRAILER)
+
+
+def test_encode_nulls_and_variable_width_columns():
+    data = b''.join(encode_columns([
+        ('value', np.array([np.nan, 2.0]), None),
+        ('name', np.array([u'añ', None], dtype=object), None),
+        ('created_at', np.array(['2000-01-02', 'NaT'],
+                                dtype='datetime64[us]'), None),
+        ('count', np.array([7, 0], dtype=np.int64),
+         np.array([False, True]))
+    ], block_rows=1))
+
+    body = data[len(PGCOPY_HEADER):-len(PGCOPY_TRAILER)]
+    assert body == (
+        struct.pack('>hi', 4, -1) +
+        struct.pack('>i', 3) + u'añ'.encode('utf-8') +
+        struct.pack('>iq', 8, 86400 * 1000000) +
+        struct.pack('>iq', 8, 7) +
+        struct.pack('>hid', 4, 8, 2.0) +
+        struct.pack('>iii', -1, -1, -1)
+    )
+
+
+def test_encode_geometry_srid():
+    # POINT(1 2) as little endian WKB
+    wkb = b'\x01\x01\x00\x00\x00' + struct.pack('<dd', 1, 2)
+    data = b''.join(encode_columns(
+        [('the_geom', np.array([wkb], dtype=object), None)],
+        pg_types={'the_geom': 'geometry'}, srid=4326))
+
+    ewkb = b'\x01' + struct.pack('<II', 0x20000001, 4326) + wkb[5:]
+    assert data[len(PGCOPY_HEADER):-len(PGCOPY_TRAILER)] == \
+        struct.pack('>hi', 1, len(ewkb)) + ewkb
+
+
+def test_encode_columns_errors():
+    with pytest.raises(CartoException):
+        encode_columns([('a', np.arange(2), None), ('b', np.arange(3), None)])
+    with pytest.raises(CartoException):
+        encode_columns([('a', np.arange(2), None)], pg_types={'a': 'json'})
+
+
+def split(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_decode_roundtrip():
+    columns = [
+        ('id', np.array([1, 2, 3], dtype=np.int64), None),
+        ('value', np.array([0.5, np.nan, 2.0]), None),
+        ('name', np.array([u'añ', None, u'b'], dtype=object), None),
+        ('created_at', np.array(['2020-01-02T03:04:05', 'NaT', '1999-12-31'],
+                                dtype='datetime64[us]'), None),
+        ('count', np.array([7, 0, 1], dtype=np.int32),
+         np.array([False, True, False]))
+    ]
+    schema = [('id', 'int8'), ('value', 'float8'), ('name', 'text'),
+              ('created_at', 'timestamp'), ('count', 'int4')]
+    data = b''.join(encode_columns(columns, pg_types=dict(schema)))
+
+    batches = list(decode_rows(split(data, 7), schema, batch_size=2))
+
+    assert [len(batch[0][1]) for batch in batches] == [2, 1]
+    decoded = dict((name, np.concatenate([dict((n, v) for n, v, _ in b)[name]
+                                          for b in batches]))
+                   for name, _ in schema)
+    assert decoded['id'].tolist() == [1, 2, 3]
+    assert np.isnan(decoded['value'][1])
+    assert decoded['name'].tolist() == [u'añ', None, u'b']
+    assert decoded['created_at'].tolist()[0].isoformat() == \
+        '2020-01-02T03:04:05'
+    assert np.isnat(decoded['created_at'][1])
+    count = batches[0][4][1]
+    assert count.mask.tolist() == [False, True]
+    assert count[0] == 7
+
+
+def test_decode_numeric_and_growth():
+    # 12345.678 as numeric: digits 1, 2345, 6780 with weight 1
+    numeric = struct.pack('>hhHh3h', 3, 1, 0, 3, 1, 2345, 6780)
+    row = struct.pack('>hi', 1, len(numeric)) + numeric
+    data = PGCOPY_HEADER + row * 3000 + PGCOPY_TRAILER
+
+    batches = list(decode_rows(split(data, 1000), [('n', 'numeric')],
+                               batch_size=None))
+
+    assert len(batches) == 1
+    values = batches[0][0][1]
+    assert len(values) == 3000
+    assert values[0] == pytest.approx(12345.678)
+
+
+def test_decode_truncated():
+    with pytest.raises(CartoException):
+        list(decode_rows([PGCOPY_HEADER + struct.pack('>hi', 1, 4)],
+                         [('a', 'int4')]))
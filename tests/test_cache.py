@@ -0,0 +1,302 @@
+import threading
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from carto import cache as cache_module
+from carto.auth import APIKeyAuthClient
+from carto.cache import normalize_sql, is_read_only, MemoryQueryCache, \
+    SQLiteQueryCache, SingleFlight
+from carto.exceptions import CartoException
+from carto.sql import SQLClient
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, 'time', clock.time)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmpdir):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return MemoryQueryCache(**kwargs)
+        return SQLiteQueryCache(str(tmpdir.join('cache.sqlite')), **kwargs)
+    return make
+
+
+def test_normalize_sql():
+    assert normalize_sql('  SELECT *\n  FROM t -- comment\n WHERE a = 1; ') \
+        == 'select * from t where a = 1'
+    assert normalize_sql("SELECT 'a   b'  /* x */ FROM \"T\"") == \
+        "select 'a   b' from \"T\""
+
+
+def test_is_read_only():
+    assert is_read_only('SELECT * FROM t')
+    assert is_read_only('  with a as (select 1) select * from a;')
+    assert is_read_only("SELECT 'delete; insert' FROM t")
+    assert is_read_only('-- comment\nSELECT 1')
+
+    assert not is_read_only('INSERT INTO t VALUES (1)')
+    assert not is_read_only('UPDATE t SET a = 1')
+    assert not is_read_only('SELECT 1; DROP TABLE t')
+    assert not is_read_only('SELECT * INTO t2 FROM t')
+    assert not is_read_only('SELECT * FROM t FOR UPDATE')
+    assert not is_read_only(
+        'WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d')
+    assert not is_read_only('')
+
+
+def test_make_key():
+    key = MemoryQueryCache.make_key('SELECT  1', 'json', {'a': 1}, 'key')
+    assert key == MemoryQueryCache.make_key('SELECT 1;', 'json', {'a': 1},
+                                            'key')
+    assert key != MemoryQueryCache.make_key('SELECT 1', 'csv', {'a': 1},
+                                            'key')
+    assert key != MemoryQueryCache.make_key('SELECT 1', 'json', {'a': 2},
+                                            'key')
+    assert key != MemoryQueryCache.make_key('SELECT 1', 'json', {'a': 1},
+                                            'other key')
+    assert key != MemoryQueryCache.make_key('SELECT 1', 'json', {'a': 1},
+                                            'key', 'https://other.carto.com/')
+
+
+def test_cache_ttl(clock, make_cache):
+    cache = make_cache(ttl=10)
+    cache.set('a', b'1')
+    cache.set('b', b'2', ttl=100)
+
+    clock.now += 50
+    assert cache.get('a') is None
+    assert cache.get('b') == b'2'
+    assert cache.stats()['expirations'] == 1
+
+
+def test_cache_lru_by_entries(clock, make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set('a', b'1')
+    clock.now += 1
+    cache.set('b', b'2')
+    clock.now += 1
+    assert cache.get('a') == b'1'
+    clock.now += 1
+    cache.set('c', b'3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+    assert cache.get('c') == b'3'
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_cache_lru_by_bytes(clock, make_cache):
+    cache = make_cache(max_bytes=10)
+    cache.set('a', b'x' * 6)
+    clock.now += 1
+    cache.set('b', b'x' * 6)
+    # Too big to be cached at all
+    cache.set('c', b'x' * 11)
+
+    assert cache.get('a') is None
+    assert cache.get('c') is None
+    assert cache.stats()['bytes'] == 6
+
+
+@pytest.fixture
+def sql_api():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         json={'rows': [{'a': 1}], 'total_rows': 1})
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return auth_client, adapter
+
+
+def test_sql_client_cache(sql_api):
+    auth_client, adapter = sql_api
+    sql = SQLClient(auth_client, cache=True)
+
+    first = sql.send('SELECT a FROM t')
+    first['rows'].append('modified')
+    assert sql.send('select  a from t') == {'rows': [{'a': 1}],
+                                            'total_rows': 1}
+    assert adapter.call_count == 1
+
+    sql.send('SELECT a FROM t', cache_ttl=0)
+    sql.send('SELECT a FROM t', format='csv')
+    sql.send('UPDATE t SET a = 2')
+    sql.send('UPDATE t SET a = 2')
+    assert adapter.call_count == 5
+
+    stats = sql.cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+
+
+def test_sql_client_cache_accounts():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://', adapter)
+    for username in ('user1', 'user2'):
+        adapter.register_uri(
+            'POST', 'https://{user}.carto.com/api/v2/sql'.format(
+                user=username),
+            json={'rows': [{'user': username}], 'total_rows': 1})
+    cache = MemoryQueryCache()
+    clients = [SQLClient(APIKeyAuthClient(
+        'https://{user}.carto.com'.format(user=username), 'default_public',
+        session=session), cache=cache) for username in ('user1', 'user2')]
+
+    results = [sql.send('SELECT user FROM t') for sql in clients * 2]
+
+    assert [result['rows'][0]['user'] for result in results] == \
+        ['user1', 'user2', 'user1', 'user2']
+    assert adapter.call_count == 2
+    assert cache.stats()['hits'] == 2
+
+
+def test_sql_client_without_cache(sql_api):
+    auth_client, adapter = sql_api
+    sql = SQLClient(auth_client)
+
+    sql.send('SELECT a FROM t')
+    sql.send('SELECT a FROM t')
+    assert adapter.call_count == 2
+    assert sql.cache_stats() is None
+
+
+def run_concurrently(sql, queries, threads):
+    results = [None] * len(queries)
+
+    def send(i):
+        try:
+            results[i] = sql.send(queries[i])
+        except Exception as e:
+            results[i] = e
+
+    workers = [threading.Thread(target=send, args=(i,))
+               for i in range(len(queries))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+@pytest.fixture
+def slow_sql_api():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    single_flight = SingleFlight()
+
+    def callback(request, context):
+        # Wait for the rest of the callers to join the request
+        deadline = time.time() + 5
+        while single_flight.stats()['saved'] < 9 and time.time() < deadline:
+            time.sleep(0.01)
+        if 'wrong' in request.text:
+            context.status_code = 400
+            return {'error': ['syntax error']}
+        return {'rows': [{'a': 1}], 'total_rows': 1}
+
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         json=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return SQLClient(auth_client, coalesce=single_flight), adapter
+
+
+def test_sql_client_coalesces_identical_queries(slow_sql_api):
+    sql, adapter = slow_sql_api
+
+    results = run_concurrently(sql, ['SELECT count(*) FROM t'] * 10, 10)
+
+    assert adapter.call_count == 1
+    assert all(result == {'rows': [{'a': 1}], 'total_rows': 1}
+               for result in results)
+    # Results are not shared between callers
+    assert len(set(id(result) for result in results)) == 10
+    assert sql.coalesce_stats() == {'executed': 1, 'saved': 9,
+                                    'in_flight': 0}
+
+
+def test_sql_client_coalesces_errors(slow_sql_api):
+    sql, adapter = slow_sql_api
+
+    results = run_concurrently(sql, ['SELECT wrong FROM t'] * 10, 10)
+
+    assert adapter.call_count == 1
+    assert all(isinstance(result, CartoException) for result in results)
+    assert all('syntax error' in str(result) for result in results)
+
+
+def test_sql_client_coalesces_per_account():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://', adapter)
+    # Both requests must be in flight at the same time
+    lock = threading.Lock()
+    requests_in_flight = []
+    all_in_flight = threading.Event()
+
+    def callback(request, context):
+        with lock:
+            requests_in_flight.append(request)
+            if len(requests_in_flight) == 2:
+                all_in_flight.set()
+        all_in_flight.wait(5)
+        return {'rows': [{'user': request.hostname.split('.')[0]}],
+                'total_rows': 1}
+
+    for username in ('user1', 'user2'):
+        adapter.register_uri(
+            'POST', 'https://{user}.carto.com/api/v2/sql'.format(
+                user=username), json=callback)
+    single_flight = SingleFlight()
+    clients = [SQLClient(APIKeyAuthClient(
+        'https://{user}.carto.com'.format(user=username), 'default_public',
+        session=session), coalesce=single_flight)
+        for username in ('user1', 'user2')]
+    results = [None, None]
+
+    def send(i):
+        results[i] = clients[i].send('SELECT user FROM t')
+
+    workers = [threading.Thread(target=send, args=(i,)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [result['rows'][0]['user'] for result in results] == \
+        ['user1', 'user2']
+    assert single_flight.stats()['executed'] == 2
+
+
+def test_sql_client_does_not_coalesce_writes(sql_api):
+    auth_client, adapter = sql_api
+    sql = SQLClient(auth_client, coalesce=True)
+
+    run_concurrently(sql, ['UPDATE t SET a = 1'] * 5, 5)
+
+    assert adapter.call_count == 5
+    assert sql.coalesce_stats()['executed'] == 0
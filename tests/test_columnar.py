@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import struct
+
+import pytest
+
+from carto.columnar import build_columns, build_csv_columns, column_array, \
+    csv_query, hex_ewkb_to_wkb
+
+np = pytest.importorskip('numpy')
+
+# POINT(1 2) with SRID 4326
+POINT_EWKB = '0101000020E6100000000000000000F03F0000000000000040'
+POINT_WKB = struct.pack('<BIdd', 1, 1, 1.0, 2.0)
+
+
+def test_hex_ewkb_to_wkb():
+    assert hex_ewkb_to_wkb(POINT_EWKB) == POINT_WKB
+    assert hex_ewkb_to_wkb(POINT_WKB.hex()) == POINT_WKB
+
+
+def test_column_array_numbers():
+    ints = column_array([1, 2, 3], {'type': 'number', 'pgtype': 'int4'})
+    assert ints.dtype == np.int64
+    assert not isinstance(ints, np.ma.MaskedArray)
+
+    ints = column_array([1, None, 3], {'type': 'number', 'pgtype': 'int8'})
+    assert ints.dtype == np.int64
+    assert ints.mask.tolist() == [False, True, False]
+
+    floats = column_array([1.5, None], {'type': 'number',
+                                        'pgtype': 'float8'})
+    assert floats.dtype == np.float64
+    assert np.isnan(floats[1])
+
+
+def test_column_array_booleans_and_strings():
+    flags = column_array([True, False, None], {'type': 'boolean',
+                                               'pgtype': 'bool'})
+    assert flags.dtype == bool
+    assert flags.mask.tolist() == [False, False, True]
+
+    texts = column_array(['a', None, [1, 2]], {'type': 'string'})
+    assert texts.dtype == object
+    assert texts.tolist() == ['a', None, [1, 2]]
+
+
+def test_column_array_dates():
+    dates = column_array(['2020-01-01T10:00:00.500Z', None, '2020-01-02'],
+                         {'type': 'date', 'pgtype': 'timestamptz'})
+    assert dates.dtype == np.dtype('datetime64[us]')
+    assert dates[0] == np.datetime64('2020-01-01T10:00:00.500')
+    assert np.isnat(dates[1])
+
+    dates = column_array(['2020-01-01T10:00:00+02:00', None],
+                         {'type': 'date', 'pgtype': 'timestamptz'})
+    assert dates[0] == np.datetime64('2020-01-01T08:00:00')
+    assert np.isnat(dates[1])
+
+    dates = column_array(['2020-01-01 10:00:00-03', '2020-01-01'],
+                         {'type': 'date', 'pgtype': 'timestamptz'})
+    assert dates[0] == np.datetime64('2020-01-01T13:00:00')
+    assert dates[1] == np.datetime64('2020-01-01T00:00:00')
+
+
+def test_build_columns():
+    columns = build_columns(
+        ['cartodb_id', 'the_geom'], [[1, 2], [POINT_EWKB, None]],
+        {'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+         'the_geom': {'type': 'geometry', 'wkbtype': 'Point'}})
+
+    assert list(columns.keys()) == ['cartodb_id', 'the_geom']
+    assert columns['cartodb_id'].tolist() == [1, 2]
+    assert columns['the_geom'].tolist() == [POINT_WKB, None]
+
+
+def test_csv_query():
+    sql, names = csv_query('SELECT * FROM t;', OrderedDict([
+        ('cartodb_id', {'type': 'number', 'pgtype': 'int4'}),
+        ('the_geom', {'type': 'geometry', 'wkbtype': 'Point'}),
+        ('flag', {'type': 'boolean', 'pgtype': 'bool'}),
+        ('created', {'type': 'date', 'pgtype': 'timestamptz'})]))
+
+    assert sql.startswith('SELECT "cartodb_id", '
+                          'encode(ST_AsBinary("the_geom"), \'hex\') '
+                          'AS "the_geom", "flag"::int AS "flag", '
+                          'to_char("created" AT TIME ZONE \'UTC\'')
+    assert sql.endswith('FROM (SELECT * FROM t\n) _csv')
+    assert names == ['cartodb_id', 'the_geom', 'flag', 'created']
+
+
+def test_build_csv_columns():
+    columns = build_csv_columns(
+        ['cartodb_id', 'name', 'flag', 'value', 'created'],
+        [['1', '2'], ['', 'b'], ['1', ''], ['1.5', ''],
+         ['2020-01-01T10:00:00.000000', '']],
+        {'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+         'name': {'type': 'string', 'pgtype': 'text'},
+         'flag': {'type': 'boolean', 'pgtype': 'bool'},
+         'value': {'type': 'number', 'pgtype': 'float8'},
+         'created': {'type': 'date', 'pgtype': 'timestamptz'}})
+
+    assert columns['cartodb_id'].tolist() == [1, 2]
+    assert columns['name'].tolist() == ['', 'b']
+    assert columns['flag'].tolist() == [True, None]
+    assert np.isnan(columns['value'][1])
+    assert columns['created'][0] == np.datetime64('2020-01-01T10:00:00')
+    assert np.isnat(columns['created'][1])
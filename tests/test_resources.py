@@ -0,0 +1,295 @@
+import datetime
+import threading
+import time
+
+import pytest
+import requests
+import requests_mock
+from dateutil.tz import tzutc
+
+from carto.auth import APIKeyAuthClient
+from carto.datasets import Dataset, DatasetManager
+from carto.paginators import CartoPaginator
+from carto.resources import get_record_class
+from carto.visualizations import Visualization, VisualizationManager
+
+TOTAL_ENTRIES = 23
+
+
+@pytest.fixture
+def mock_viz_api():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.pages = []
+    lock = threading.Lock()
+
+    def callback(request, context):
+        page = int(request.qs['page'][0])
+        # The API caps the page size
+        per_page = min(int(request.qs.get('per_page', ['20'])[0]), 10)
+        with lock:
+            adapter.pages.append(page)
+        start = (page - 1) * per_page
+        ids = range(start, min(start + per_page, TOTAL_ENTRIES))
+        return {'visualizations': [{'id': str(i), 'name': 'viz{i}'.format(i=i)}
+                                   for i in ids],
+                'total_entries': TOTAL_ENTRIES}
+
+    adapter.register_uri('GET', 'https://test.carto.com/api/v1/viz/',
+                         json=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return auth_client, adapter
+
+
+def test_paginator_page_count():
+    paginator = CartoPaginator('visualizations', 'https://test.carto.com/',
+                               per_page=50)
+    assert paginator.page_params(3) == {'page': 3, 'per_page': 50}
+    assert paginator.page_count({'total_entries': 120}, 50) == 3
+    assert paginator.page_count({'total_user_entries': 20}, 20) == 1
+    assert paginator.page_count({}, 0) == 1
+
+
+@pytest.mark.parametrize('page_workers', [1, 4])
+def test_filter_pages(mock_viz_api, page_workers):
+    auth_client, adapter = mock_viz_api
+    manager = VisualizationManager(auth_client, per_page=10,
+                                   page_workers=page_workers)
+
+    visualizations = manager.all()
+
+    assert [viz.id for viz in visualizations] == \
+        [str(i) for i in range(TOTAL_ENTRIES)]
+    assert sorted(adapter.pages) == [1, 2, 3]
+    assert adapter.request_history[0].qs['type'] == ['derived']
+
+
+def test_filter_pages_capped_page_size(mock_viz_api):
+    auth_client, adapter = mock_viz_api
+    manager = DatasetManager(auth_client, per_page=100, page_workers=2)
+
+    with pytest.warns(FutureWarning):
+        datasets = manager.filter(tags='osm')
+
+    assert len(datasets) == TOTAL_ENTRIES
+    assert adapter.pages[0] == 1
+    assert sorted(adapter.pages) == [1, 2, 3]
+    assert all(request.qs['tags'] == ['osm']
+               for request in adapter.request_history)
+
+
+@pytest.mark.parametrize('page_workers', [1, 2])
+def test_iter_all(mock_viz_api, page_workers):
+    auth_client, adapter = mock_viz_api
+    manager = VisualizationManager(auth_client, per_page=5,
+                                   page_workers=page_workers)
+    for visualization in manager.iter_all(tags='osm'):
+        if visualization.id == '5':
+            break
+
+    # Pages are only read ahead of the one being consumed
+    assert sorted(adapter.pages)[:2] == [1, 2]
+    assert max(adapter.pages) <= 2 + page_workers
+    assert all(request.qs['tags'] == ['osm']
+               for request in adapter.request_history)
+
+    assert [viz.id for viz in manager.iter_all()] == \
+        [str(i) for i in range(TOTAL_ENTRIES)]
+
+
+@pytest.fixture
+def mock_catalog():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    catalog = dict((str(i), '2020-01-{day:02d}T00:00:00+00:00'.format(
+        day=i + 1)) for i in range(12))
+    adapter.catalog = catalog
+    adapter.pages = []
+    adapter.before_page = {}
+
+    def callback(request, context):
+        assert request.qs['order'] == ['updated_at']
+        assert request.qs['order_direction'] == ['desc']
+        page = int(request.qs['page'][0])
+        adapter.pages.append(page)
+        if page in adapter.before_page:
+            adapter.before_page.pop(page)()
+        entries = sorted(catalog.items(), key=lambda entry: entry[1],
+                         reverse=True)[(page - 1) * 5:page * 5]
+        return {'visualizations': [{'id': i, 'updated_at': updated_at}
+                                   for i, updated_at in entries],
+                'total_entries': len(catalog)}
+
+    adapter.register_uri('GET', 'https://test.carto.com/api/v1/viz/',
+                         json=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return VisualizationManager(auth_client, per_page=5), adapter
+
+
+def test_changes_since(mock_catalog):
+    manager, adapter = mock_catalog
+
+    changes = manager.changes_since()
+    assert len(changes['changed']) == 12
+    assert changes['deleted'] == []
+    assert changes['watermark'] == datetime.datetime(
+        2020, 1, 12, tzinfo=tzutc())
+    snapshot = changes['snapshot']
+    assert len(snapshot) == 12
+
+    # Only the first page is needed for a couple of changes
+    adapter.pages = []
+    adapter.catalog['3'] = '2020-02-01T00:00:00+00:00'
+    adapter.catalog['new'] = '2020-02-02T00:00:00+00:00'
+    changes = manager.changes_since(changes['watermark'], snapshot)
+    assert [viz.id for viz in changes['changed']] == ['new', '3', '11']
+    assert changes['deleted'] == []
+    assert adapter.pages == [1]
+    assert len(snapshot) == 13
+
+    # Deletions need to list the rest of the catalog
+    adapter.pages = []
+    del adapter.catalog['0']
+    changes = manager.changes_since(changes['watermark'], snapshot)
+    assert [viz.id for viz in changes['changed']] == ['new']
+    assert changes['deleted'] == ['0']
+    assert sorted(adapter.pages) == [1, 2, 3]
+    assert '0' not in snapshot
+
+
+def test_changes_since_moved_entry(mock_catalog):
+    manager, adapter = mock_catalog
+    changes = manager.changes_since()
+    snapshot = changes['snapshot']
+
+    # While the catalog is listed to find the deletion, an entry of the
+    # last page is updated and moves to the first one, so it is missed
+    del adapter.catalog['0']
+
+    def update():
+        adapter.catalog['2'] = '2020-02-01T00:00:00+00:00'
+
+    adapter.before_page[2] = update
+
+    adapter.pages = []
+    changes = manager.changes_since(changes['watermark'], snapshot)
+    assert changes['deleted'] == ['0']
+    assert [viz.id for viz in changes['changed']] == ['2', '11']
+    # Listed twice, as the counts didn't add up the first time
+    assert sorted(adapter.pages) == [1, 1, 2, 2, 3, 3]
+    assert sorted(snapshot) == sorted(adapter.catalog)
+
+
+def test_iter_records(mock_catalog):
+    manager, adapter = mock_catalog
+
+    records = list(manager.iter_records(order='updated_at',
+                                        order_direction='desc'))
+
+    assert len(records) == 12
+    record = records[0]
+    assert record.id == '11'
+    assert record.get_id() == '11'
+    assert record.name is None
+    with pytest.raises(AttributeError):
+        record.name = 'other'
+    with pytest.raises(AttributeError):
+        record.other = 'other'
+
+    # Datetimes are parsed on first access
+    assert record._pending != 0
+    assert record.updated_at == datetime.datetime(
+        2020, 1, 12, tzinfo=tzutc())
+    assert record._pending == 0
+
+    visualization = record.promote()
+    assert isinstance(visualization, Visualization)
+    assert visualization.id == '11'
+    assert visualization.updated_at == record.updated_at
+
+
+def test_record_nested_resources():
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key')
+    record_class = get_record_class(Dataset)
+    assert get_record_class(Dataset) is record_class
+
+    record = record_class(auth_client, {
+        'id': 'a', 'name': 'dataset',
+        'permission': {'id': 'p', 'owner': {'id': 'u', 'username': 'user'}},
+        'table': {'id': 't', 'name': 'dataset'},
+        'synchronization': None})
+
+    assert str(record) == 'dataset'
+    assert record.synchronization is None
+    with pytest.warns(FutureWarning):
+        assert record.table.name == 'dataset'
+    assert record.permission.owner.username == 'user'
+
+    with pytest.warns(FutureWarning):
+        dataset = record.promote()
+    assert dataset.table is record.table
+    assert dataset.permission.owner.username == 'user'
+
+
+def test_lazy_fields():
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key')
+    dataset = Dataset(auth_client)
+    dataset.update_from_dict({
+        'id': 'a', 'name': 'dataset',
+        'created_at': '2020-01-12T00:00:00+00:00',
+        'permission': {'id': 'p', 'owner': {'id': 'u', 'username': 'user'}}})
+
+    # Values are kept as they come until they are read
+    assert 'created_at' not in dataset.__dict__
+    assert 'permission' not in dataset.__dict__
+
+    created_at = dataset.created_at
+    assert created_at == datetime.datetime(2020, 1, 12,
+                                           tzinfo=tzutc())
+    assert dataset.created_at is created_at
+    assert dataset.permission is dataset.permission
+    assert dataset.permission.owner.username == 'user'
+
+    dataset.created_at = '2021-01-12T00:00:00+00:00'
+    assert dataset.created_at.year == 2021
+
+
+def test_lazy_fields_threads(mocker):
+    from pyrestcli.fields import DateTimeField
+
+    parse = DateTimeField.__set__
+    calls = []
+
+    def slow_parse(field, instance, value):
+        calls.append(value)
+        time.sleep(0.05)
+        parse(field, instance, value)
+
+    mocker.patch.object(DateTimeField, '__set__', slow_parse)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key')
+    dataset = Dataset(auth_client)
+    dataset.update_from_dict({'id': 'a',
+                              'created_at': '2020-01-12T00:00:00+00:00'})
+    start = threading.Event()
+    results = []
+
+    def read():
+        start.wait()
+        results.append(dataset.created_at)
+
+    workers = [threading.Thread(target=read) for i in range(8)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join()
+
+    # Parsed once, and every thread gets the parsed value
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert results[0].year == 2020
@@ -1,12 +1,23 @@
+import json
 import os
 import pytest
+import re
+import requests
+import requests_mock
 import time
 
+from carto.auth import APIKeyAuthClient
 from carto.exceptions import CartoException
-from carto.sql import SQLClient, BatchSQLClient
+from carto.sql import SQLClient, BatchSQLClient, BatchPollStrategy, \
+    BatchJobGraph
 from secret import EXISTING_POINT_DATASET, BATCH_SQL_SINGLE_QUERY, \
     BATCH_SQL_MULTI_QUERY
 
+try:
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from urllib.parse import parse_qs, urlparse
+
 
 def test_sql_error(api_key_auth_client_usr):
     sql = SQLClient(api_key_auth_client_usr)
@@ -147,3 +158,488 @@ def test_sql_additional_params(api_key_auth_client_usr):
                         do_post=True)
 
     assert "the_geom_webmercator" in data['rows'][0]
+
+
+@pytest.fixture
+def mock_sql_api():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    queries = []
+
+    def callback(request, context):
+        sql = parse_qs(request.text)['q'][0]
+        queries.append(sql)
+        if 'json_agg' in sql:
+            if 'wrong' in sql:
+                context.status_code = 400
+                return {'error': ['syntax error']}
+            packed = re.findall(r'FROM \(SELECT (\d+)\n\) _q\) AS (q\d+)',
+                                sql)
+            return {'rows': [dict((name, [{'n': int(n)}])
+                                  for n, name in packed)],
+                    'time': 0.1, 'total_rows': 1}
+        if 'wrong' in sql:
+            context.status_code = 400
+            return {'error': ['syntax error']}
+        # Later queries are answered first
+        time.sleep(0.001 * (20 - len(queries) % 20))
+        return {'rows': [{'n': sql}], 'time': 0.1, 'total_rows': 1}
+
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         json=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return SQLClient(auth_client), queries
+
+
+def test_send_many_ordered(mock_sql_api):
+    sql, queries = mock_sql_api
+    statements = ['UPDATE t SET a = {}'.format(i) for i in range(50)]
+    statements[10] = 'wrong'
+
+    results = list(sql.send_many(iter(statements), concurrency=8))
+
+    assert len(results) == 50
+    assert isinstance(results[10], CartoException)
+    assert [r['rows'][0]['n'] for i, r in enumerate(results) if i != 10] \
+        == [s for i, s in enumerate(statements) if i != 10]
+
+
+def test_send_many_unordered(mock_sql_api):
+    sql, queries = mock_sql_api
+    statements = ['UPDATE t SET a = {}'.format(i) for i in range(20)]
+
+    results = list(sql.send_many(statements, concurrency=4, ordered=False))
+
+    assert sorted(index for index, result in results) == list(range(20))
+    for index, result in results:
+        assert result['rows'][0]['n'] == statements[index]
+
+
+def test_send_many_packed(mock_sql_api):
+    sql, queries = mock_sql_api
+    statements = ['SELECT {}'.format(i) for i in range(6)]
+    statements.insert(3, 'UPDATE t SET a = 1')
+
+    results = list(sql.send_many(statements, pack_bytes=1000))
+
+    # Two packs and the update
+    assert len(queries) == 3
+    assert [r['rows'] for i, r in enumerate(results) if i != 3] == \
+        [[{'n': i}] for i in range(6)]
+    assert results[0]['packed'] and results[0]['total_rows'] == 1
+    assert results[3]['rows'] == [{'n': 'UPDATE t SET a = 1'}]
+
+
+def test_send_many_packed_error(mock_sql_api):
+    sql, queries = mock_sql_api
+    statements = ['SELECT 1', 'SELECT wrong', 'SELECT 3']
+
+    results = list(sql.send_many(statements, pack_bytes=1000))
+
+    # The pack and then every query on its own
+    assert len(queries) == 4
+    assert isinstance(results[1], CartoException)
+    assert results[2]['rows'] == [{'n': 'SELECT 3'}]
+
+
+ITER_ROWS_RESPONSE = {
+    'rows': [{'cartodb_id': i, 'name': 'name {}'.format(i),
+              'value': i / 2.0 if i % 10 else None} for i in range(1000)],
+    'time': 0.25,
+    'fields': {'cartodb_id': {'type': 'number'},
+               'name': {'type': 'string'},
+               'value': {'type': 'number'}},
+    'total_rows': 1000
+}
+
+
+@pytest.fixture
+def mock_rows_client():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql',
+        content=json.dumps(ITER_ROWS_RESPONSE).encode('utf-8'))
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return SQLClient(auth_client)
+
+
+def test_iter_rows(mock_rows_client):
+    rows = mock_rows_client.iter_rows('SELECT * FROM t', chunk_size=100)
+
+    assert list(rows) == ITER_ROWS_RESPONSE['rows']
+    assert rows.fields == ITER_ROWS_RESPONSE['fields']
+    assert rows.time == 0.25
+    assert rows.total_rows == 1000
+
+
+def test_iter_rows_tuple_batches(mock_rows_client):
+    rows = mock_rows_client.iter_rows('SELECT * FROM t', batch_size=300,
+                                      row_type='tuple')
+    batches = list(rows)
+
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+    assert rows.columns == ['cartodb_id', 'name', 'value']
+    assert batches[0][1] == (1, 'name 1', 0.5)
+
+
+def test_iter_rows_numpy(mock_rows_client):
+    np = pytest.importorskip('numpy')
+    batches = list(mock_rows_client.iter_rows('SELECT * FROM t',
+                                              batch_size=500,
+                                              row_type='numpy'))
+
+    assert len(batches) == 2
+    assert batches[0].cartodb_id.dtype == np.int64
+    assert batches[0].name[1] == 'name 1'
+    assert np.isnan(batches[0].value[0])
+    assert batches[1].value[1] == 250.5
+
+
+def test_iter_rows_error():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         status_code=400,
+                         json={'error': ['relation "t" does not exist']})
+    adapter.register_uri('GET', 'https://test.carto.com/api/v2/sql',
+                         content=b'{"rows":[{"a":1}],"error":["timeout"]}')
+    sql = SQLClient(APIKeyAuthClient('https://test.carto.com',
+                                     'some_api_key', session=session))
+
+    with pytest.raises(CartoException):
+        sql.iter_rows('SELECT * FROM t')
+    with pytest.raises(CartoException):
+        list(sql.iter_rows('SELECT * FROM t', do_post=False))
+
+
+@pytest.fixture
+def mock_pages_client():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    table = [{'cartodb_id': i * 2, 'name': "o'{}".format(i)}
+             for i in range(25)]
+    queries = []
+
+    def callback(request, context):
+        sql = parse_qs(request.text)['q'][0]
+        queries.append(sql)
+        key = re.search(r'ORDER BY (\w+|"[^"]+") LIMIT', sql).group(1)
+        key = key.strip('"')
+        last = re.search(r'WHERE \S+ > (.+) ORDER BY', sql)
+        limit = int(re.search(r'LIMIT (\d+)$', sql).group(1))
+        if key not in table[0]:
+            context.status_code = 400
+            return {'error': ['column "{}" does not exist'.format(key)]}
+        rows = sorted(table, key=lambda row: row[key])
+        if last is not None:
+            value = json.loads(last.group(1)) if key == 'cartodb_id' \
+                else last.group(1)[1:-1].replace("''", "'")
+            rows = [row for row in rows if row[key] > value]
+        return {'rows': rows[:limit], 'total_rows': len(rows[:limit])}
+
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         json=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return SQLClient(auth_client), table, queries
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_paginate(mock_pages_client, prefetch):
+    sql, table, queries = mock_pages_client
+
+    pages = list(sql.paginate('SELECT * FROM t;', page_size=10,
+                              prefetch=prefetch))
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [row for page in pages for row in page] == table
+    assert queries[0] == 'SELECT * FROM (SELECT * FROM t\n) _page ' \
+                         'ORDER BY cartodb_id LIMIT 10'
+    assert 'WHERE cartodb_id > 38 ORDER BY cartodb_id' in queries[2]
+
+
+def test_paginate_by_text_key(mock_pages_client):
+    sql, table, queries = mock_pages_client
+
+    pages = list(sql.paginate('SELECT * FROM t', key='name', page_size=10))
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sorted(row['cartodb_id'] for page in pages for row in page) == \
+        [row['cartodb_id'] for row in table]
+    assert "WHERE name > 'o''17' ORDER BY name" in queries[1]
+
+    with pytest.raises(CartoException):
+        list(sql.paginate('SELECT * FROM t', key='Missing', page_size=10))
+    assert queries[-1].endswith('ORDER BY "Missing" LIMIT 10')
+
+
+COLUMNAR_RESPONSE = {
+    'rows': [{'cartodb_id': 1, 'the_geom': None, 'name': 'a',
+              'value': 1.5, 'created': '2020-01-01T00:00:00Z'},
+             {'cartodb_id': 2,
+              'the_geom': '0101000020E6100000000000000000F03F'
+                          '0000000000000040',
+              'name': None, 'value': None, 'created': None}],
+    'time': 0.1,
+    'fields': {'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+               'the_geom': {'type': 'geometry', 'wkbtype': 'Point',
+                            'srid': 4326},
+               'name': {'type': 'string', 'pgtype': 'text'},
+               'value': {'type': 'number', 'pgtype': 'float8'},
+               'created': {'type': 'date', 'pgtype': 'timestamptz'}},
+    'total_rows': 2
+}
+
+
+@pytest.fixture
+def mock_columnar_client():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         json=COLUMNAR_RESPONSE)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return SQLClient(auth_client)
+
+
+def test_send_columns(mock_columnar_client):
+    np = pytest.importorskip('numpy')
+    columns = mock_columnar_client.send('SELECT * FROM t', result='columns')
+
+    assert list(columns.keys()) == ['cartodb_id', 'the_geom', 'name',
+                                    'value', 'created']
+    assert columns['cartodb_id'].dtype == np.int64
+    assert columns['the_geom'][1][:1] == b'\x01'
+    assert columns['name'].tolist() == ['a', None]
+    assert np.isnan(columns['value'][1])
+    assert columns['created'].dtype == np.dtype('datetime64[us]')
+
+
+def test_send_dataframe(mock_columnar_client):
+    pytest.importorskip('pandas')
+    df = mock_columnar_client.send('SELECT * FROM t', result='dataframe')
+
+    assert list(df.columns) == ['cartodb_id', 'the_geom', 'name', 'value',
+                                'created']
+    assert df['cartodb_id'].tolist() == [1, 2]
+    assert len(df) == 2
+
+    with pytest.raises(CartoException):
+        mock_columnar_client.send('SELECT * FROM t', result='rows')
+
+
+def test_send_columns_csv():
+    np = pytest.importorskip('numpy')
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+
+    def callback(request, context):
+        params = parse_qs(request.text if request.method == 'POST'
+                          else urlparse(request.url).query)
+        if params.get('format') != ['csv']:
+            return json.dumps({'rows': [], 'time': 0.1, 'total_rows': 0,
+                               'fields': COLUMNAR_RESPONSE['fields']})
+        assert 'ST_AsBinary("the_geom")' in params['q'][0]
+        context.headers['Content-Type'] = 'text/csv'
+        return ('cartodb_id,the_geom,name,value,created\r\n'
+                '1,,a,1.5,2020-01-01T00:00:00.000000\r\n'
+                '2,0101000000000000000000f03f0000000000000040,'
+                '"b, c",,\r\n')
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql',
+                         text=callback)
+    adapter.register_uri('GET', 'https://test.carto.com/api/v2/sql',
+                         text=callback)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    sql = SQLClient(auth_client)
+
+    columns = sql.send('SELECT * FROM t', result='columns', format='csv')
+    assert adapter.last_request.method == 'POST'
+
+    assert list(columns.keys()) == ['cartodb_id', 'the_geom', 'name',
+                                    'value', 'created']
+    assert columns['cartodb_id'].tolist() == [1, 2]
+    assert columns['the_geom'][1][:1] == b'\x01'
+    assert columns['name'].tolist() == ['a', 'b, c']
+    assert np.isnan(columns['value'][1])
+    assert np.isnat(columns['created'][1])
+
+    columns = sql.send('SELECT * FROM t', result='columns', format='csv',
+                       do_post=False)
+    assert [request.method for request in adapter.request_history[-2:]] == \
+        ['GET', 'GET']
+    assert columns['name'].tolist() == ['a', 'b, c']
+
+    with pytest.raises(CartoException):
+        sql.send('SELECT * FROM t', result='columns', format='geojson')
+
+
+@pytest.fixture
+def mock_batch_client():
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    jobs = {}
+
+    def create(request, context):
+        job_id = 'job{n}'.format(n=len(jobs))
+        jobs[job_id] = {'job_id': job_id, 'status': 'pending', 'reads': 0,
+                        'query': request.json()['query']}
+        return dict(jobs[job_id])
+
+    def read(request, context):
+        job = jobs[request.path.rsplit('/', 1)[1]]
+        job['reads'] += 1
+        if job['reads'] >= job['query'].count(';') + 1:
+            job['status'] = 'failed' if 'fail' in job['query'] else 'done'
+        else:
+            job['status'] = 'running'
+        return dict(job)
+
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql/job/',
+                         json=create)
+
+    def cancel(request, context):
+        job = jobs[request.path.rsplit('/', 1)[1]]
+        job['status'] = 'cancelled'
+        return dict(job)
+
+    adapter.register_uri('GET', re.compile(
+        r'https://test\.carto\.com/api/v2/sql/job/\w+'), json=read)
+    adapter.register_uri('DELETE', re.compile(
+        r'https://test\.carto\.com/api/v2/sql/job/\w+'), json=cancel)
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   session=session)
+    return BatchSQLClient(auth_client)
+
+
+def test_batch_poll_strategy_delays():
+    delays = BatchPollStrategy(first_delay=0.5, factor=2, max_delay=3,
+                               jitter=0).delays()
+    assert [next(delays) for i in range(5)] == [0.5, 1, 2, 3, 3]
+
+    delays = BatchPollStrategy(first_delay=1, jitter=0.2).delays()
+    assert 0.8 <= next(delays) <= 1.2
+
+
+def test_batch_wait_with_backoff(mock_batch_client, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+
+    job = mock_batch_client.create_and_wait_for_completion(
+        'select 1; select 2; select 3',
+        BatchPollStrategy(first_delay=0.1, factor=2, jitter=0))
+
+    assert job['status'] == 'done'
+    assert job['poll_stats']['polls'] == 3
+    assert sleeps == [0.1, 0.2, 0.4]
+
+    with pytest.raises(CartoException):
+        mock_batch_client.create_and_wait_for_completion(
+            'select fail', BatchPollStrategy(jitter=0))
+
+
+def test_batch_wait_timeout(mock_batch_client, monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    job = mock_batch_client.create('select 1; select 2; select 3')
+
+    with pytest.raises(CartoException) as e:
+        mock_batch_client.wait_for_completion(
+            job['job_id'], BatchPollStrategy(first_delay=0, timeout=0))
+    assert 'not finished' in str(e.value)
+
+    job = mock_batch_client.wait_for_completion(job['job_id'])
+    assert job['status'] == 'done'
+
+
+def test_batch_as_completed(mock_batch_client):
+    queries = ['select 1; select 2; select 3', 'select 1',
+               'select fail; select 2']
+    job_ids = [mock_batch_client.create(query)['job_id']
+               for query in queries]
+    strategy = BatchPollStrategy(first_delay=0, jitter=0)
+
+    jobs = list(mock_batch_client.as_completed(job_ids, concurrency=2,
+                                               poll_strategy=strategy))
+
+    assert jobs[0]['job_id'] == 'job1'
+    assert dict((job['job_id'], job['poll_stats']['polls'])
+                for job in jobs) == {'job0': 3, 'job1': 1, 'job2': 2}
+
+    jobs = mock_batch_client.wait_all(job_ids, poll_strategy=strategy)
+    assert [job['job_id'] for job in jobs] == job_ids
+    assert [job['status'] for job in jobs] == ['done', 'done', 'failed']
+
+
+def test_batch_as_completed_timeout(mock_batch_client):
+    job_ids = [mock_batch_client.create('select 1; select 2')['job_id'],
+               mock_batch_client.create('select 1')['job_id']]
+
+    with pytest.raises(CartoException) as e:
+        mock_batch_client.wait_all(job_ids, poll_strategy=BatchPollStrategy(
+            first_delay=10, timeout=0.1))
+    assert 'job0' in str(e.value)
+
+
+def test_batch_job_graph(mock_batch_client):
+    graph = BatchJobGraph(mock_batch_client, poll_strategy=BatchPollStrategy(
+        first_delay=0, jitter=0))
+    graph.add_job('load', 'select 1; select 2')
+    graph.add_job('index', ['select 1', 'select 2; select 3'],
+                  depends_on=['load'])
+    graph.add_job('stats', 'select 1', depends_on=['load'])
+    graph.add_job('publish', 'select 1', depends_on=['index', 'stats'])
+
+    with pytest.raises(CartoException):
+        graph.add_job('other', 'select 1', depends_on=['missing'])
+
+    jobs = graph.run()
+
+    assert sorted(jobs.keys()) == ['index', 'load', 'publish', 'stats']
+    assert all(job['status'] == 'done' for job in jobs.values())
+    report = graph.report()
+    assert report['critical_path'][0] == 'load'
+    assert report['critical_path'][-1] == 'publish'
+    assert report['jobs']['load']['reads'] == 2
+    assert report['elapsed'] >= report['jobs']['load']['running']
+
+
+def test_batch_job_graph_failure(mock_batch_client):
+    strategy = BatchPollStrategy(first_delay=0, jitter=0)
+    graph = BatchJobGraph(mock_batch_client, poll_strategy=strategy)
+    graph.add_job('load', 'select fail')
+    graph.add_job('index', 'select 1', depends_on=['load'])
+    graph.add_job('publish', 'select 1', depends_on=['index'])
+    graph.add_job('other', 'select 1; select 2')
+
+    with pytest.raises(CartoException) as e:
+        graph.run()
+    assert 'load, index, publish' in str(e.value)
+
+    statuses = dict((name, job['status'])
+                    for name, job in graph.report()['jobs'].items())
+    assert statuses == {'load': 'failed', 'index': 'skipped',
+                        'publish': 'skipped', 'other': 'done'}
+
+    graph = BatchJobGraph(mock_batch_client, poll_strategy=strategy,
+                          fail_fast=True)
+    graph.add_job('load', 'select fail')
+    graph.add_job('other', 'select 1; select 2; select 3')
+    graph.add_job('publish', 'select 1', depends_on=['other'])
+
+    with pytest.raises(CartoException):
+        graph.run()
+
+    statuses = dict((name, job['status'])
+                    for name, job in graph.report()['jobs'].items())
+    assert statuses == {'load': 'failed', 'other': 'canceled',
+                        'publish': 'skipped'}
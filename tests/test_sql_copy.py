@@ -1,16 +1,26 @@
+import json
 import os
 import pytest
 import time
 import random
+import re
+import threading
+import zlib
+
+import requests
+import requests_mock
 
 # Make the tests compatible with python 2 and 3
 try:
     # python 2
     from StringIO import cStringIO as InMemIO
+    from urlparse import parse_qs
 except ImportError:
     # python 3
     from io import BytesIO as InMemIO
+    from urllib.parse import parse_qs
 
+from carto.auth import APIKeyAuthClient
 from carto.exceptions import CartoException
 from carto.sql import SQLClient, BatchSQLClient, CopySQLClient
 
@@ -175,3 +185,361 @@ def test_copyto_stream(copy_client, copyto_sample_query, copyto_expected_result)
     response = copy_client.copyto_stream(copyto_sample_query)
 
     assert response.read() == copyto_expected_result
+
+
+@pytest.fixture()
+def mock_copy_session():
+    adapter = requests_mock.Adapter()
+    session = requests.Session()
+    session.mount('https://test.carto.com', adapter)
+    session.adapter = adapter
+    session.payloads = []
+
+    def copyfrom(request, context):
+        payload = zlib.decompress(b''.join(request.body),
+                                  16 + zlib.MAX_WBITS)
+        session.payloads.append(payload)
+        return json.dumps({'total_rows': payload.count(b'\n'), 'time': 0.1})
+
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql/copyfrom',
+                         text=copyfrom)
+    return session
+
+
+@pytest.fixture()
+def mock_copy_client(mock_copy_session):
+    auth_client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                                   None, mock_copy_session)
+    return CopySQLClient(auth_client)
+
+
+PARALLEL_ROWS = [u'{i},name {i}\n'.format(i=i).encode('utf-8')
+                 for i in range(1000)]
+
+
+def test_copyfrom_parallel_file_path(mock_copy_client, mock_copy_session,
+                                     tmpdir):
+    source = tmpdir.join('parallel.csv')
+    source.write_binary(b'cartodb_id,name\n' + b''.join(PARALLEL_ROWS))
+
+    result = mock_copy_client.copyfrom_parallel(COPY_FROM_QUERY,
+                                                source.strpath,
+                                                workers=3, header=True)
+
+    assert len(result['shards']) == 3
+    assert result['total_rows'] == len(PARALLEL_ROWS) + 3
+    for payload in mock_copy_session.payloads:
+        assert payload.startswith(b'cartodb_id,name\n')
+    loaded = [row for payload in mock_copy_session.payloads
+              for row in payload.splitlines(True)[1:]]
+    assert sorted(loaded) == sorted(PARALLEL_ROWS)
+
+
+def test_copyfrom_parallel_iterable(mock_copy_client, mock_copy_session):
+    # Blocks that do not end on line boundaries
+    data = b''.join(PARALLEL_ROWS)
+    blocks = (data[i:i + 100] for i in range(0, len(data), 100))
+
+    result = mock_copy_client.copyfrom_parallel(COPY_FROM_QUERY, blocks,
+                                                workers=4)
+
+    assert result['total_rows'] == len(PARALLEL_ROWS)
+    assert sum(shard['total_rows'] for shard in result['shards']) == \
+        len(PARALLEL_ROWS)
+    loaded = [row for payload in mock_copy_session.payloads
+              for row in payload.splitlines(True)]
+    assert sorted(loaded) == sorted(PARALLEL_ROWS)
+
+
+def test_copyfrom_parallel_error(mock_copy_client, mock_copy_session):
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql/copyfrom',
+        status_code=400, json={'error': ['invalid input syntax']})
+
+    with pytest.raises(CartoException):
+        mock_copy_client.copyfrom_parallel(COPY_FROM_QUERY,
+                                           iter(PARALLEL_ROWS), workers=2)
+
+
+def test_copyto_parallel(mock_copy_client, mock_copy_session, tmpdir):
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql',
+        json={'rows': [{'min': 1, 'max': 10}],
+              'fields': {'min': {'type': 'number', 'pgtype': 'int4'},
+                         'max': {'type': 'number', 'pgtype': 'int4'}}})
+
+    lock = threading.Lock()
+    requests_in_flight = {'now': 0, 'max': 0}
+
+    def copyto(request, context):
+        with lock:
+            requests_in_flight['now'] += 1
+            requests_in_flight['max'] = max(requests_in_flight['max'],
+                                            requests_in_flight['now'])
+        time.sleep(0.05)
+        with lock:
+            requests_in_flight['now'] -= 1
+        query = request.qs['q'][0]
+        if 'is null' in query:
+            return u'11,name null\n'
+        a, b = [int(n) for n in
+                re.search(r'between (\d+) and (\d+)', query).groups()]
+        lines = [u'{i},name {i}\n'.format(i=i) for i in range(a, b + 1)]
+        if 'header true' in query:
+            lines.insert(0, u'cartodb_id,name\n')
+        return u''.join(lines)
+
+    mock_copy_session.adapter.register_uri(
+        'GET', 'https://test.carto.com/api/v2/sql/copyto', text=copyto)
+    target_path = tmpdir.join('carto-python-sdk-copy-parallel.csv')
+
+    result = mock_copy_client.copyto_parallel('my_table', target_path.strpath,
+                                              parts=3)
+
+    assert [part['range'] for part in result['parts']] == \
+        [(1, 3), (4, 6), (7, 10), None]
+    assert requests_in_flight['max'] == 3
+    assert target_path.read() == u'cartodb_id,name\n' + u''.join(
+        u'{i},name {i}\n'.format(i=i) for i in range(1, 11)) + \
+        u'11,name null\n'
+    assert tmpdir.listdir() == [target_path]
+
+
+def test_copyto_parallel_not_integer(mock_copy_client, mock_copy_session,
+                                     tmpdir):
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql',
+        json={'rows': [{'min': 'a', 'max': 'z'}],
+              'fields': {'min': {'type': 'string', 'pgtype': 'text'},
+                         'max': {'type': 'string', 'pgtype': 'text'}}})
+
+    with pytest.raises(CartoException):
+        mock_copy_client.copyto_parallel(
+            'my_table', tmpdir.join('parallel.csv').strpath,
+            partition_column='name')
+    assert tmpdir.listdir() == []
+
+
+def test_copyfrom_pipeline(mock_copy_client, mock_copy_session):
+    result = mock_copy_client.copyfrom(COPY_FROM_QUERY, iter(PARALLEL_ROWS),
+                                       pipeline=True, pipeline_depth=2)
+
+    assert result['total_rows'] == len(PARALLEL_ROWS)
+    assert mock_copy_session.payloads == [b''.join(PARALLEL_ROWS)]
+    stats = result['pipeline']
+    assert stats['bytes_in'] == len(b''.join(PARALLEL_ROWS))
+    assert stats['blocks'] > 0
+    assert stats['max_queue_depth'] <= 2
+
+
+def test_copyfrom_pipeline_source_error(mock_copy_client):
+    def rows():
+        yield PARALLEL_ROWS[0]
+        raise IOError('broken source')
+
+    with pytest.raises(CartoException) as e:
+        mock_copy_client.copyfrom(COPY_FROM_QUERY, rows(), pipeline=True)
+    assert 'broken source' in str(e.value)
+
+
+def test_copyfrom_dataframe(mock_copy_client, mock_copy_session):
+    pd = pytest.importorskip('pandas')
+    dataframe = pd.DataFrame({'name': [u'fulano', None],
+                              'age': pd.array([30, None], dtype='Int32')})
+
+    mock_copy_client.copyfrom_dataframe('carto_python_sdk_copy_test',
+                                        dataframe,
+                                        pg_types={'age': 'int4'})
+
+    request = mock_copy_session.adapter.last_request
+    assert request.qs['q'] == [
+        'copy carto_python_sdk_copy_test (name, age) from stdin with '
+        '(format binary)'
+    ]
+    payload = mock_copy_session.payloads[0]
+    assert payload.startswith(b'PGCOPY\n\xff\r\n\x00')
+    assert b'fulano' in payload
+
+
+def test_copyto_columns(mock_copy_client, mock_copy_session):
+    np = pytest.importorskip('numpy')
+    from carto.binary_copy import encode_columns
+
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql',
+        json={'rows': [], 'fields': {
+            'cartodb_id': {'type': 'number', 'pgtype': 'int4'},
+            'name': {'type': 'string', 'pgtype': 'text'}}})
+    data = b''.join(encode_columns(
+        [('cartodb_id', np.arange(10, dtype=np.int32), None),
+         ('name', np.array([u'name'] * 10, dtype=object), None)]))
+    mock_copy_session.adapter.register_uri(
+        'GET', 'https://test.carto.com/api/v2/sql/copyto', content=data)
+
+    batches = list(mock_copy_client.copyto_columns(
+        'SELECT cartodb_id, name FROM my_table', batch_size=4))
+
+    assert mock_copy_session.adapter.last_request.qs['q'] == [
+        'copy (select cartodb_id, name from my_table) to stdout with '
+        '(format binary)']
+    assert [len(batch['cartodb_id']) for batch in batches] == [4, 4, 2]
+    assert batches[2]['cartodb_id'].tolist() == [8, 9]
+    assert batches[0]['name'][0] == u'name'
+
+
+def test_get_schema(mock_copy_client, mock_copy_session):
+    # Fields in the order of the columns, not sorted
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql',
+        text='{"rows": [], "fields": {'
+             '"name": {"type": "string", "pgtype": "text"}, '
+             '"cartodb_id": {"type": "number", "pgtype": "int4"}, '
+             '"age": {"type": "number", "pgtype": "int2"}}}')
+
+    schema = mock_copy_client.get_schema(
+        'SELECT name, cartodb_id, age FROM my_table;\n')
+
+    assert schema == [('name', 'text'), ('cartodb_id', 'int4'),
+                      ('age', 'int2')]
+    query = parse_qs(mock_copy_session.adapter.last_request.text)['q'][0]
+    assert query == 'SELECT * FROM (SELECT name, cartodb_id, age FROM ' \
+                    'my_table\n) _q LIMIT 0'
+
+    mock_copy_client.get_schema('SELECT * FROM my_table -- comment')
+    query = parse_qs(mock_copy_session.adapter.last_request.text)['q'][0]
+    assert query == 'SELECT * FROM (SELECT * FROM my_table -- comment\n) ' \
+                    '_q LIMIT 0'
+
+
+def test_copyto_columns_arrow(mock_copy_client, mock_copy_session):
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('pyarrow')
+    from carto.binary_copy import encode_columns
+
+    data = b''.join(encode_columns(
+        [('cartodb_id', np.arange(3, dtype=np.int32),
+          np.array([False, True, False])),
+         ('value', np.array([0.5, np.nan, 1.5]), None)]))
+    mock_copy_session.adapter.register_uri(
+        'GET', 'https://test.carto.com/api/v2/sql/copyto', content=data)
+
+    batches = list(mock_copy_client.copyto_columns(
+        'SELECT cartodb_id, value FROM my_table',
+        schema=[('cartodb_id', 'int4'), ('value', 'float8')], arrow=True))
+
+    assert len(batches) == 1
+    assert batches[0].to_pydict() == {'cartodb_id': [0, None, 2],
+                                      'value': [0.5, None, 1.5]}
+
+
+def test_copyfrom_resumable(mock_copy_client, mock_copy_session, tmpdir,
+                            mocker):
+    mocker.patch('carto.sql.time.sleep')
+    source = tmpdir.join('resumable.csv')
+    source.write_binary(b'cartodb_id,name\n' + b''.join(PARALLEL_ROWS))
+    checkpoint_path = tmpdir.join('resumable.checkpoint').strpath
+    table_rows = {'count': 0}
+    counts = []
+
+    def count(request, context):
+        counts.append(table_rows['count'])
+        return {'rows': [{'count': table_rows['count']}]}
+
+    def copyfrom(request, context):
+        payload = zlib.decompress(b''.join(request.body),
+                                  16 + zlib.MAX_WBITS)
+        mock_copy_session.payloads.append(payload)
+        if len(mock_copy_session.payloads) == 3:
+            context.status_code = 500
+            return json.dumps({'error': ['connection lost']})
+        rows = payload.count(b'\n') - 1
+        table_rows['count'] += rows
+        return json.dumps({'total_rows': rows, 'time': 0.1})
+
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql', json=count)
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql/copyfrom', text=copyfrom)
+
+    with pytest.raises(CartoException):
+        mock_copy_client.copyfrom_resumable(COPY_FROM_QUERY, source.strpath,
+                                            checkpoint_path,
+                                            segment_size=3000, header=True,
+                                            max_retries=1)
+    with open(checkpoint_path) as f:
+        statuses = [segment['status'] for segment in json.load(f)['segments']]
+    assert statuses[:3] == ['done', 'done', 'loading']
+    assert set(statuses[3:]) == set(['pending'])
+
+    result = mock_copy_client.copyfrom_resumable(COPY_FROM_QUERY,
+                                                 source.strpath,
+                                                 checkpoint_path,
+                                                 segment_size=3000,
+                                                 header=True)
+
+    assert result['total_rows'] == len(PARALLEL_ROWS) == table_rows['count']
+    assert result['retries'] == 1
+    # Counted at the beginning and to check the failed segment in each
+    # call, not before every segment
+    assert len(result['segments']) > 3
+    assert len(counts) == 3
+    assert all(segment['status'] == 'done' for segment in result['segments'])
+    loaded = [row for payload in mock_copy_session.payloads
+              for row in payload.splitlines(True)[1:]]
+    assert sorted(loaded) == sorted(PARALLEL_ROWS + [
+        row for row in mock_copy_session.payloads[2].splitlines(True)[1:]])
+
+
+def test_copyfrom_resumable_committed_segment(mock_copy_client,
+                                              mock_copy_session, tmpdir):
+    source = tmpdir.join('resumable.csv')
+    source.write_binary(b''.join(PARALLEL_ROWS))
+    markers = {}
+
+    def count(request, context):
+        query = parse_qs(request.text)['q'][0]
+        marker = int(re.search(r'segment = (\d+)', query).group(1))
+        return {'rows': [{'count': markers.get(marker, 0)}]}
+
+    def copyfrom(request, context):
+        payload = zlib.decompress(b''.join(request.body),
+                                  16 + zlib.MAX_WBITS)
+        mock_copy_session.payloads.append(payload)
+        for line in payload.splitlines():
+            marker = int(line.split(b',')[-1])
+            markers[marker] = markers.get(marker, 0) + 1
+        # The data is committed but the response never arrives
+        context.status_code = 502
+        return json.dumps({'error': ['bad gateway']})
+
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql', json=count)
+    mock_copy_session.adapter.register_uri(
+        'POST', 'https://test.carto.com/api/v2/sql/copyfrom', text=copyfrom)
+
+    result = mock_copy_client.copyfrom_resumable(
+        'COPY my_table (cartodb_id, name, segment) FROM stdin WITH '
+        '(FORMAT csv)', source.strpath, segment_size=6000,
+        marker_column='segment')
+
+    assert len(mock_copy_session.payloads) == len(result['segments'])
+    assert mock_copy_session.payloads[0].startswith(b'0,name 0,0\n')
+    assert result['total_rows'] == len(PARALLEL_ROWS)
+    assert result['retries'] == 0
+
+
+@pytest.mark.parametrize('data, expected', [
+    ([b'1,a\n2,', b'b\n'], b'1,a,7\n2,b,7\n'),
+    ([b'1,a\n2,b'], b'1,a,7\n2,b,7'),
+    ([b'1,a\r\n2,b\r\n'], b'1,a,7\r\n2,b,7\r\n'),
+    ([b'1,"a\nb"\n2,"c', b'""\n"\n'], b'1,"a\nb",7\n2,"c""\n",7\n'),
+])
+def test_add_marker(mock_copy_client, data, expected):
+    assert b''.join(mock_copy_client._add_marker(iter(data), ',', 7,
+                                                 '"')) == expected
+
+
+def test_add_marker_text_format(mock_copy_client):
+    data = [b'1\ta "quote\n2\tb\n']
+    assert b''.join(mock_copy_client._add_marker(iter(data), '\t', 7)) == \
+        b'1\ta "quote\t7\n2\tb\t7\n'
@@ -0,0 +1,127 @@
+import pytest
+import requests
+import requests_mock
+
+from carto import throttling
+from carto.auth import APIKeyAuthClient
+from carto.exceptions import CartoRateLimitException
+from carto.throttling import RateLimitThrottler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttling, '_now', clock.time)
+    monkeypatch.setattr(throttling, '_sleep', clock.sleep)
+    return clock
+
+
+def rate_limit_headers(limit, remaining, reset, retry_after=-1):
+    return {'Carto-Rate-Limit-Limit': str(limit),
+            'Carto-Rate-Limit-Remaining': str(remaining),
+            'Carto-Rate-Limit-Reset': str(reset),
+            'Retry-After': str(retry_after)}
+
+
+class FakeResponse(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_bucket_key():
+    assert RateLimitThrottler.bucket_key('api/v2/sql') == 'api/v2/sql'
+    assert RateLimitThrottler.bucket_key('/api/v2/sql/job/abc') == \
+        'api/v2/sql'
+    assert RateLimitThrottler.bucket_key('api/v1/map?x=1') == 'api/v1/map'
+
+
+def test_throttler_without_headers_does_not_wait(clock):
+    throttler = RateLimitThrottler()
+    for _ in range(100):
+        throttler.acquire('api/v2/sql')
+        throttler.update('api/v2/sql', FakeResponse({}))
+
+    assert clock.sleeps == []
+    assert throttler.stats()['requests'] == 100
+
+
+def test_throttler_paces_requests(clock):
+    throttler = RateLimitThrottler()
+    throttler.acquire('api/v2/sql')
+    # 3 of 4 tokens used, full again in 3 seconds: 1 token per second
+    throttler.update('api/v2/sql', FakeResponse(rate_limit_headers(4, 1, 3)))
+
+    for _ in range(3):
+        throttler.acquire('api/v2/sql')
+
+    # 1 token left, the next ones are spaced as they are refilled
+    assert clock.sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+    stats = throttler.stats()
+    assert stats['delayed_requests'] == 2
+    assert stats['wait_time'] == pytest.approx(2.0)
+    assert stats['buckets']['api/v2/sql']['rate'] == pytest.approx(1.0)
+
+    # Other APIs have their own buckets
+    throttler.acquire('api/v1/map')
+    assert len(clock.sleeps) == 2
+
+
+def test_throttler_blocks_after_rate_limited_response(clock):
+    throttler = RateLimitThrottler()
+    throttler.update('api/v2/sql',
+                     FakeResponse(rate_limit_headers(10, 0, 5, 3)))
+
+    # Tokens keep being refilled while blocked
+    assert throttler.acquire('api/v2/sql') == pytest.approx(3)
+    assert throttler.stats()['buckets']['api/v2/sql']['remaining'] == \
+        pytest.approx(5)
+    assert throttler.stats()['rate_limited'] == 1
+
+
+def test_client_retries_rate_limited_requests(clock):
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('GET', 'https://test.carto.com/api/v2/sql', [
+        {'status_code': 429, 'headers': rate_limit_headers(10, 0, 10, 2)},
+        {'json': {'rows': []}, 'headers': rate_limit_headers(10, 9, 1)}])
+
+    client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                              session=session, throttle=True,
+                              rate_limit_retries=1)
+    response = client.send('api/v2/sql', 'get', params={'q': 'select 1'})
+
+    assert response.json() == {'rows': []}
+    assert adapter.call_count == 2
+    assert clock.sleeps[0] == pytest.approx(2.0)
+    assert client.throttle_stats()['rate_limited'] == 1
+
+
+def test_client_does_not_retry_streamed_bodies(clock):
+    session = requests.Session()
+    adapter = requests_mock.Adapter()
+    session.mount('https://test.carto.com', adapter)
+    adapter.register_uri('POST', 'https://test.carto.com/api/v2/sql/copyfrom',
+                         status_code=429,
+                         headers=rate_limit_headers(10, 0, 10, 2))
+
+    client = APIKeyAuthClient('https://test.carto.com', 'some_api_key',
+                              session=session, throttle=True,
+                              rate_limit_retries=3)
+    with pytest.raises(CartoRateLimitException):
+        client.send('api/v2/sql/copyfrom', 'post',
+                    data=(chunk for chunk in [b'1,2\n']))
+    assert adapter.call_count == 1
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import pytest
+
+from carto.exceptions import CartoException
+from carto.utils import ResponseStream, JSONRowsReader
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+
+DATA = bytes(bytearray(range(256))) * 100
+
+
+def test_response_stream_read():
+    stream = ResponseStream(FakeResponse(DATA), chunk_size=1000)
+
+    result = b''
+    while True:
+        block = stream.read(7)
+        if not block:
+            break
+        result += block
+
+    assert result == DATA
+
+
+def test_response_stream_read_whole_chunks():
+    stream = ResponseStream(FakeResponse(DATA), chunk_size=1000)
+
+    assert stream.read(1000) == DATA[:1000]
+    assert stream.read(5000) == DATA[1000:2000]
+    assert stream.read(10) == DATA[2000:2010]
+    assert stream.read() == DATA[2010:]
+    assert stream.read(10) == b''
+
+
+def test_response_stream_readinto():
+    stream = ResponseStream(FakeResponse(DATA), chunk_size=1000)
+    buffer = bytearray(2500)
+
+    assert stream.readinto1(buffer) == 1000
+    assert stream.readinto(buffer) == 2500
+    assert bytes(buffer) == DATA[1000:3500]
+
+
+def test_response_stream_buffered():
+    stream = io.BufferedReader(ResponseStream(FakeResponse(DATA), 1000))
+
+    assert stream.readline() == DATA[:DATA.index(b'\n') + 1]
+    assert stream.read() == DATA[DATA.index(b'\n') + 1:]
+
+
+SQL_RESPONSE = {
+    'rows': [{'id': i, 'name': u'nñ ' * i, 'value': i * 1.5e10,
+              'flag': i % 2 == 0, 'empty': None} for i in range(50)],
+    'time': 0.5,
+    'fields': {'id': {'type': 'number'}, 'name': {'type': 'string'}},
+    'total_rows': 50
+}
+
+
+def chunked(data, chunk_size):
+    return (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 100, 1000000])
+def test_json_rows_reader(indent, chunk_size):
+    body = json.dumps(SQL_RESPONSE, indent=indent).encode('utf-8')
+    reader = JSONRowsReader(chunked(body, chunk_size))
+
+    assert list(reader) == SQL_RESPONSE['rows']
+    assert reader.metadata == {'time': 0.5,
+                               'fields': SQL_RESPONSE['fields'],
+                               'total_rows': 50}
+
+
+def test_json_rows_reader_metadata_before_rows():
+    body = b'{"time": 1, "rows": [1, 2.5, "3", null], "total_rows": 4}'
+    reader = JSONRowsReader(chunked(body, 3))
+
+    assert list(reader) == [1, 2.5, '3', None]
+    assert reader.metadata == {'time': 1, 'total_rows': 4}
+
+
+@pytest.mark.parametrize('body', [b'{"rows": [{"id": 1}, {"id"',
+                                  b'{"rows": [{"id": 1} {"id": 2}]}',
+                                  b'["rows"]'])
+def test_json_rows_reader_invalid(body):
+    with pytest.raises(CartoException):
+        list(JSONRowsReader(chunked(body, 4)))